@@ -0,0 +1,76 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from api.serializers import POST_FIELDS, parse_fields, serializer
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет, сколько постов в секунду отдаёт JSON API: отдельно '
+        'сериализация в словари, кодирование в JSON и целые запросы '
+        'к /api/v1/posts/ по курсору.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--fields', default='',
+            help='Поля, как в ?fields=; по умолчанию все.')
+
+    def handle(self, *args, **options):
+        posts = list(Post.objects.select_related('author', 'group')
+                     .order_by('-pub_date', '-pk')[:options['posts']])
+        if not posts:
+            raise CommandError(
+                'Нет постов - заполните базу командой generate_dataset.')
+        thumbnails.attach_variants(posts)
+        fields = parse_fields(options['fields'], POST_FIELDS)
+        serialize = serializer(fields, POST_FIELDS)
+        repeat = options['repeat']
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            data = [serialize(post) for post in posts]
+        self.report('Сериализация', len(posts) * repeat, started)
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            json.dumps(data, ensure_ascii=False)
+        self.report('Кодирование JSON', len(posts) * repeat, started)
+
+        with override_settings(DEBUG=False):
+            self.requests(options, len(posts))
+
+    def requests(self, options, limit):
+        client = Client()
+        url = reverse('api:index')
+        if options['fields']:
+            url += '?fields=' + options['fields']
+        served = 0
+        started = time.perf_counter()
+        for _ in range(options['repeat']):
+            next_url = url
+            count = 0
+            while next_url and count < limit:
+                response = client.get(next_url)
+                body = response.json()
+                count += len(body['results'])
+                next_url = body['next']
+            served += count
+        self.report(
+            f'Запросы по {settings.API_PAGE_SIZE} постов', served, started)
+
+    def report(self, title, count, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{title:28} {count / elapsed:10.0f} постов/с '
+            f'({elapsed / count * 1e6:.1f} мкс на пост)')
@@ -0,0 +1,128 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import caching
+from posts.models import Comment, Follow, Group, Post, User
+
+
+@override_settings(API_PAGE_SIZE=5)
+class ApiTestClass(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(
+            username='NoNameAuthor', first_name='Имя')
+        cls.reader = User.objects.create(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(12):
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {i}')
+        cls.post = Post.objects.latest('pk')
+        for i in range(7):
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'Комментарий {i}')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        # TestCase не коммитит транзакций: поколения сдвигаются сразу.
+        patcher = mock.patch.object(caching, 'transaction', mock.Mock(
+            on_commit=lambda func, using=None: func()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def walk(self, client, url):
+        """Все объекты ленты, пройденной по ссылкам next."""
+        results = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            results += response.json()['results']
+            url = response.json()['next']
+        return results
+
+    def test_index_embeds_author_and_group(self):
+        """Пост отдаётся с автором и группой за один запрос."""
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(reverse('api:index'))
+        post = response.json()['results'][0]
+        self.assertEqual(post['id'], self.post.pk)
+        self.assertEqual(post['text'], self.post.text)
+        self.assertEqual(post['author']['username'], 'NoNameAuthor')
+        self.assertEqual(post['author']['first_name'], 'Имя')
+        self.assertEqual(post['group'], {
+            'slug': 'test-slug', 'title': 'Тестовая группа'})
+        self.assertIsNone(post['image'])
+        self.assertEqual(post['url'], reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}))
+
+    def test_cursor_pagination(self):
+        """По ссылкам next лента проходится целиком и без повторов."""
+        for url, expected in (
+            (reverse('api:index'), Post.objects.order_by('-pk')),
+            (reverse('api:group_list', kwargs={'slug': 'test-slug'}),
+             Post.objects.order_by('pk')),
+            (reverse('api:profile', kwargs={'username': 'NoNameAuthor'}),
+             Post.objects.order_by('-pk')),
+            (reverse('api:comments', kwargs={'post_id': self.post.pk}),
+             Comment.objects.order_by('pk')),
+        ):
+            with self.subTest(url=url):
+                ids = [obj['id'] for obj in self.walk(self.guest_client, url)]
+                self.assertEqual(
+                    ids, list(expected.values_list('pk', flat=True)))
+
+    def test_sparse_fields(self):
+        """?fields= оставляет только нужные поля и убирает JOIN."""
+        url = reverse('api:index') + '?fields=id,text'
+        with self.assertNumQueries(1) as queries:
+            response = self.guest_client.get(url)
+        self.assertNotIn('JOIN', queries.captured_queries[0]['sql'])
+        self.assertEqual(
+            set(response.json()['results'][0]), {'id', 'text'})
+        next_url = response.json()['next']
+        self.assertIn('fields=id%2Ctext', next_url)
+        response = self.guest_client.get(url.replace('text', 'secret'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['detail'])
+
+    def test_detail_and_errors(self):
+        """Пост по id; ошибки отдаются JSON-ом."""
+        response = self.guest_client.get(
+            reverse('api:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(response.json()['comments_count'], 7)
+        response = self.guest_client.get(
+            reverse('api:post_detail', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('detail', response.json())
+        response = self.reader_client.post(reverse('api:index'))
+        self.assertEqual(response.status_code, 405)
+
+    def test_follow_feed(self):
+        """Лента подписок - только для авторизованных."""
+        response = self.guest_client.get(reverse('api:follow_index'))
+        self.assertEqual(response.status_code, 401)
+        results = self.walk(self.reader_client, reverse('api:follow_index'))
+        self.assertEqual(len(results), 12)
+        self.assertEqual(results[0]['author']['username'], 'NoNameAuthor')
+
+    def test_conditional_get(self):
+        """Повторный запрос с ETag получает 304, новый пост меняет ETag."""
+        url = reverse('api:index')
+        etag = self.guest_client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,192 @@
+from functools import wraps
+from operator import attrgetter
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.utils.http import urlencode
+
+from posts import caching, shards, thumbnails
+from posts.models import Group, Post, User
+from posts.utils import KeysetPaginator, lookup
+
+from .serializers import (COMMENT_FIELDS, POST_FIELDS, InvalidFields,
+                          group_data, parse_fields, relations, serializer,
+                          user_data)
+
+# Каждая ручка повторяет HTML-страницу из posts.views с теми же областями
+# кэша для ETag/Last-Modified, но листается только по курсору: без COUNT
+# и OFFSET страница стоит одного запроса по индексу.
+
+
+def _response(data, status=200):
+    return JsonResponse(
+        data, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def _error(status, detail):
+    return _response({'detail': detail}, status=status)
+
+
+def api_view(login_required=False):
+    """GET-ручка API: ошибки отдаются JSON-ом, а не HTML-страницами."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                response = _error(405, 'Метод не разрешён.')
+                response['Allow'] = 'GET, HEAD'
+                return response
+            if login_required and not request.user.is_authenticated:
+                return _error(401, 'Нужна авторизация.')
+            try:
+                return view(request, *args, **kwargs)
+            except Http404:
+                return _error(404, 'Не найдено.')
+            except InvalidFields as error:
+                return _error(400, str(error))
+        return wrapper
+    return decorator
+
+
+def _page_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri(
+        request.path + '?' + urlencode(params, doseq=True))
+
+
+def _page(request, queryset, available, transform=None, resolve=None,
+          **kwargs):
+    """Страница по курсору из ?cursor= с полями из ?fields=.
+
+    resolve(строки страницы) заменяет строки объектами для ответа,
+    если их нельзя получить JOIN-ом.
+    """
+    fields = parse_fields(request.GET.get('fields'), available)
+    related = relations(fields, 'post__' if transform else '')
+    if related and resolve is None and not isinstance(
+        queryset, shards.MergedQuerySet
+    ):
+        # select_related() без аргументов тянет все внешние ключи.
+        queryset = shards.related(queryset, *related)
+    paginator = KeysetPaginator(
+        queryset, settings.API_PAGE_SIZE, transform=transform, **kwargs)
+    page = paginator.get_cursor_page(request.GET.get('cursor'))
+    if resolve is not None:
+        page.object_list = resolve(page.object_list)
+    if 'image' in fields:
+        thumbnails.attach_variants(page)
+    serialize = serializer(fields, available)
+    return {
+        'results': [serialize(obj) for obj in page],
+        'next': _page_url(request, page.next_cursor),
+        'previous': _page_url(request, page.previous_cursor),
+    }
+
+
+def _group_scopes(request, slug):
+    group = lookup(request, Group.objects.all(), slug=slug)
+    return [caching.group_scope(group.pk), caching.PROFILES]
+
+
+def _profile_scopes(request, username):
+    author = lookup(request, User.objects.all(), username=username)
+    return [
+        caching.author_scope(author.pk),
+        caching.follow_scope(author.pk),
+        caching.PROFILES,
+    ]
+
+
+def _posts(**filters):
+    """Посты ленты; связи подгружает _page по запрошенным полям."""
+    if settings.SHARDS:
+        return shards.posts(**filters)
+    return Post.objects.filter(**filters)
+
+
+def _post(request, post_id):
+    # Пост для валидаторов и для ответа - один и тот же объект из lookup.
+    return lookup(request, shards.post(post_id), pk=post_id)
+
+
+def _feed_posts(entries):
+    posts = shards.in_bulk([entry.post_id for entry in entries])
+    return [posts[entry.post_id] for entry in entries
+            if entry.post_id in posts]
+
+
+def _post_scopes(request, post_id):
+    post = _post(request, post_id)
+    return [
+        caching.post_scope(post.pk),
+        caching.author_scope(post.author_id),
+        caching.PROFILES,
+    ]
+
+
+@api_view()
+@caching.conditional(lambda request: [caching.GLOBAL, caching.PROFILES])
+def index(request):
+    """Лента всех постов: 1 запрос (+1 на варианты картинок)."""
+    return _response(_page(request, _posts(), POST_FIELDS))
+
+
+@api_view()
+@caching.conditional(_group_scopes)
+def group_posts(request, slug):
+    """Посты группы: группа и страница."""
+    group = lookup(request, Group.objects.all(), slug=slug)
+    data = _page(
+        request, _posts(group=group), POST_FIELDS, descending=False)
+    data['group'] = group_data(group)
+    return _response(data)
+
+
+@api_view()
+@caching.conditional(_profile_scopes)
+def profile(request, username):
+    """Посты автора: автор и страница."""
+    author = lookup(request, User.objects.all(), username=username)
+    data = _page(request, _posts(author=author), POST_FIELDS)
+    data['author'] = user_data(author)
+    return _response(data)
+
+
+@api_view()
+@caching.conditional(_post_scopes)
+def post_detail(request, post_id):
+    """Пост: 1 запрос, автор и группа - через JOIN."""
+    fields = parse_fields(request.GET.get('fields'), POST_FIELDS)
+    post = _post(request, post_id)
+    if 'image' in fields:
+        thumbnails.attach_variants([post])
+    return _response(serializer(fields, POST_FIELDS)(post))
+
+
+@api_view()
+@caching.conditional(_post_scopes)
+def comments(request, post_id):
+    """Комментарии поста по возрастанию даты: пост и страница."""
+    post = _post(request, post_id)
+    return _response(_page(
+        request, post.comments.all(), COMMENT_FIELDS,
+        key='created', descending=False))
+
+
+@api_view(login_required=True)
+@caching.conditional(lambda request: [
+    caching.GLOBAL, caching.PROFILES, caching.follow_scope(request.user.pk),
+])
+def follow_index(request):
+    """Лента подписок: страница ленты с JOIN поста."""
+    if settings.SHARDS:
+        # Посты лежат на шардах авторов: JOIN с лентой невозможен.
+        return _response(_page(
+            request, request.user.feed.all(), POST_FIELDS,
+            resolve=_feed_posts))
+    return _response(_page(
+        request, request.user.feed.select_related('post'), POST_FIELDS,
+        transform=attrgetter('post')))
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import sqlite, timing
+        connection_created.connect(
+            sqlite.configure, dispatch_uid='core.sqlite')
+        timing.install()
@@ -0,0 +1,327 @@
+"""Двухуровневый кэш: LRU в памяти процесса перед общим файлом SQLite.
+
+L1 - OrderedDict с ограничением по числу записей, объёму и времени жизни;
+он отвечает без системных вызовов и общий для всех потоков процесса.
+L2 - таблица в файле SQLite (режим WAL), общая для всех воркеров
+gunicorn. Каждая запись в L2 получает возрастающий штамп версии; раз
+в SYNC_INTERVAL секунд процесс забирает ключи со штампом новее последнего
+увиденного и выбрасывает их из L1, поэтому изменение в одном воркере
+видно остальным не позже чем через SYNC_INTERVAL. Удаления оставляют
+в L2 «надгробия», чтобы их тоже было видно при синхронизации.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+CLEAR_KEY = ':clear:'
+TOMBSTONE_TTL = 60
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+class _ProcessState:
+    """L1 и счётчики, общие для всех потоков процесса."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.l1 = OrderedDict()
+        self.l1_bytes = 0
+        self.lock = threading.RLock()
+        self.stamp = None
+        self.synced_at = 0.0
+        self.writes = 0
+        self.stats = dict.fromkeys(
+            ('l1_hits', 'l2_hits', 'misses', 'sets', 'deletes',
+             'evictions', 'invalidations'), 0)
+
+
+def _state_for(location):
+    with _states_lock:
+        state = _states.get(location)
+        if state is None or state.pid != os.getpid():
+            state = _states[location] = _ProcessState()
+        return state
+
+
+class TieredCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._l1_max_entries = options.get('L1_MAX_ENTRIES', 1000)
+        self._l1_max_bytes = options.get('L1_MAX_BYTES', 16 * 1024 * 1024)
+        self._l1_timeout = options.get('L1_TIMEOUT', 30)
+        self._sync_interval = options.get('SYNC_INTERVAL', 0.5)
+        self._cull_every = options.get('CULL_EVERY', 100)
+        self._connection = None
+        self._connection_pid = None
+        self._process_state = None
+
+    @property
+    def _state(self):
+        state = self._process_state
+        if state is None or state.pid != os.getpid():
+            state = self._process_state = _state_for(self._path)
+        return state
+
+    @property
+    def stats(self):
+        return self._state.stats
+
+    # L2
+
+    @property
+    def _db(self):
+        if self._connection is None or self._connection_pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self._path, timeout=10, isolation_level=None,
+                check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, '
+                'value BLOB, expires REAL, stamp INTEGER NOT NULL)')
+            db.execute(
+                'CREATE INDEX IF NOT EXISTS cache_stamp ON cache (stamp)')
+            self._connection = db
+            self._connection_pid = os.getpid()
+            state = self._state
+            with state.lock:
+                if state.stamp is None:
+                    state.stamp = self._max_stamp(db)
+        return self._connection
+
+    @staticmethod
+    def _max_stamp(db):
+        return db.execute(
+            'SELECT IFNULL(MAX(stamp), 0) FROM cache').fetchone()[0]
+
+    def _write(self, db, key, value, expires):
+        db.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires, stamp) '
+            'VALUES (?, ?, ?, '
+            '(SELECT IFNULL(MAX(stamp), 0) + 1 FROM cache))',
+            (key, value, expires),
+        )
+
+    @staticmethod
+    def _read(db, key):
+        row = db.execute(
+            'SELECT value, expires FROM cache WHERE key = ?', (key,),
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            return None
+        return row
+
+    def _transaction(self, func):
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(db)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return result
+
+    # L1
+
+    def _sync(self, db):
+        """Выбрасывает из L1 ключи, изменённые в L2 другими процессами."""
+        state = self._state
+        now = time.monotonic()
+        if now - state.synced_at < self._sync_interval:
+            return
+        state.synced_at = now
+        changed = db.execute(
+            'SELECT key, stamp FROM cache WHERE stamp > ?', (state.stamp,),
+        ).fetchall()
+        with state.lock:
+            for key, stamp in changed:
+                if key == CLEAR_KEY:
+                    state.l1.clear()
+                    state.l1_bytes = 0
+                else:
+                    self._l1_pop(state, key)
+                state.stamp = max(state.stamp, stamp)
+            state.stats['invalidations'] += len(changed)
+
+    @staticmethod
+    def _l1_pop(state, key):
+        entry = state.l1.pop(key, None)
+        if entry is not None:
+            state.l1_bytes -= len(entry[0])
+
+    def _l1_put(self, key, value, expires):
+        if len(value) > self._l1_max_bytes:
+            return
+        l1_expires = time.time() + self._l1_timeout
+        if expires is not None:
+            l1_expires = min(l1_expires, expires)
+        state = self._state
+        with state.lock:
+            self._l1_pop(state, key)
+            state.l1[key] = (value, l1_expires)
+            state.l1_bytes += len(value)
+            while (len(state.l1) > self._l1_max_entries
+                   or state.l1_bytes > self._l1_max_bytes):
+                _, (evicted, _) = state.l1.popitem(last=False)
+                state.l1_bytes -= len(evicted)
+                state.stats['evictions'] += 1
+
+    def _l1_get(self, key):
+        state = self._state
+        with state.lock:
+            entry = state.l1.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self._l1_pop(state, key)
+                return None
+            state.l1.move_to_end(key)
+            return entry[0]
+
+    # API кэша Django
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        db = self._db
+        self._sync(db)
+        value = self._l1_get(key)
+        if value is not None:
+            self.stats['l1_hits'] += 1
+            return pickle.loads(value)
+        row = self._read(db, key)
+        if row is None:
+            self.stats['misses'] += 1
+            return default
+        self.stats['l2_hits'] += 1
+        self._l1_put(key, row[0], row[1])
+        return pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        expires = self.get_backend_timeout(timeout)
+        self._write(self._db, key, pickled, expires)
+        self._l1_put(key, pickled, expires)
+        self._written()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        expires = self.get_backend_timeout(timeout)
+
+        def add(db):
+            if self._read(db, key) is not None:
+                return False
+            self._write(db, key, pickled, expires)
+            return True
+
+        if not self._transaction(add):
+            return False
+        self._l1_put(key, pickled, expires)
+        self._written()
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def incr(db):
+            row = self._read(db, key)
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            pickled = pickle.dumps(value, self.pickle_protocol)
+            self._write(db, key, pickled, row[1])
+            return value, pickled, row[1]
+
+        value, pickled, expires = self._transaction(incr)
+        self._l1_put(key, pickled, expires)
+        self._written()
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        value = self.get(key, version=version)
+        if value is None:
+            return False
+        self.set(key, value, timeout, version=version)
+        return True
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        state = self._state
+        with state.lock:
+            self._l1_pop(state, key)
+        self._write(self._db, key, None, time.time())
+        state.stats['deletes'] += 1
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def clear(self):
+        def clear(db):
+            stamp = self._max_stamp(db) + 1
+            db.execute('DELETE FROM cache')
+            db.execute(
+                'INSERT INTO cache (key, value, expires, stamp) '
+                'VALUES (?, NULL, ?, ?)', (CLEAR_KEY, time.time(), stamp))
+
+        self._transaction(clear)
+        state = self._state
+        with state.lock:
+            state.l1.clear()
+            state.l1_bytes = 0
+
+    def _written(self):
+        state = self._state
+        state.stats['sets'] += 1
+        state.writes += 1
+        if state.writes % self._cull_every == 0:
+            self._cull(self._db)
+
+    def _cull(self, db):
+        """Удаляет просроченные записи и старые надгробия, затем
+        самые старые записи сверх MAX_ENTRIES.
+        """
+        now = time.time()
+        db.execute(
+            'DELETE FROM cache WHERE stamp < (SELECT MAX(stamp) FROM cache) '
+            'AND expires < ? AND (value IS NOT NULL OR expires < ?)',
+            (now, now - TOMBSTONE_TTL),
+        )
+        excess = db.execute(
+            'SELECT COUNT(*) FROM cache').fetchone()[0] - self._max_entries
+        if excess > 0:
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'WHERE value IS NOT NULL ORDER BY stamp LIMIT ?)',
+                (excess + self._max_entries // self._cull_frequency,),
+            )
+
+    def get_stats(self):
+        state = self._state
+        with state.lock:
+            return dict(
+                state.stats,
+                l1_entries=len(state.l1),
+                l1_bytes=state.l1_bytes,
+            )
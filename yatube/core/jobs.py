@@ -0,0 +1,250 @@
+"""Очередь фоновых задач в базе.
+
+enqueue() записывает вызов функции в таблицу Job, а команда run_workers
+выбирает готовые задачи (по приоритету, затем по времени) и выполняет их
+в пуле потоков или процессов. Упавшая задача повторяется через
+JOBS_RETRY_DELAY * 2^(попытка - 1) секунд, после JOBS_MAX_ATTEMPTS
+попыток остаётся в таблице в состоянии failed. Задача, чей воркер
+умер, возвращается в очередь через JOBS_TIMEOUT секунд.
+
+Без JOBS_QUEUE (например, в разработке без run_workers) enqueue
+выполняет функцию сразу.
+"""
+import json
+import logging
+import multiprocessing
+import time
+import traceback
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Потолок паузы между повторами, секунд.
+MAX_RETRY_DELAY = 60 * 60
+
+
+def enqueue(function, args=(), kwargs=None, *, priority=0, delay=0,
+            key=None, max_attempts=None):
+    """Ставит вызов function(*args, **kwargs) в очередь.
+
+    function - функция уровня модуля, аргументы - значения JSON.
+    Чем больше priority, тем раньше задача выполнится; delay откладывает
+    её на столько секунд. Пока в очереди ждёт задача с тем же key,
+    новая не добавляется.
+    """
+    kwargs = kwargs or {}
+    if not settings.JOBS_QUEUE:
+        return function(*args, **kwargs)
+    Job.objects.bulk_create([Job(
+        name=f'{function.__module__}.{function.__qualname__}',
+        payload=json.dumps({'args': list(args), 'kwargs': kwargs}),
+        key=key,
+        priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )], ignore_conflicts=True)
+    return None
+
+
+def perform(name, payload):
+    """Выполняет задачу; вызывается в потоке или процессе пула."""
+    call = json.loads(payload)
+    import_string(name)(*call['args'], **call['kwargs'])
+
+
+def claim(limit):
+    """Забирает до limit готовых задач и помечает их выполняемыми."""
+    now = timezone.now()
+    due = Job.objects.filter(state=Job.QUEUED, run_at__lte=now).order_by(
+        '-priority', 'run_at')
+    # Пустую очередь видно по чтению - блокировка записи не нужна.
+    if not due.exists():
+        return []
+    # Один UPDATE с подзапросом: задачу не заберут два воркера сразу.
+    Job.objects.filter(pk__in=due.values('pk')[:limit]).update(
+        state=Job.RUNNING, started=now)
+    return list(Job.objects.filter(state=Job.RUNNING, started=now))
+
+
+def complete(job, error=None):
+    """Удаляет выполненную задачу или планирует повтор упавшей."""
+    if error is None:
+        Job.objects.filter(pk=job.pk).delete()
+        return
+    attempts = job.attempts + 1
+    changes = {
+        'attempts': attempts,
+        'error': ''.join(traceback.format_exception(
+            type(error), error, error.__traceback__)),
+    }
+    if attempts >= job.max_attempts:
+        logger.error('Задача %s не выполнена: %r', job.name, error)
+        changes['state'] = Job.FAILED
+    else:
+        delay = min(
+            settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+        changes['state'] = Job.QUEUED
+        changes['run_at'] = timezone.now() + timedelta(seconds=delay)
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(**changes)
+    except IntegrityError:
+        # Пока задача выполнялась, поставили новую с тем же ключом -
+        # повтор не нужен.
+        Job.objects.filter(pk=job.pk).delete()
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи, выполнявшиеся дольше JOBS_TIMEOUT:
+    их воркер, по всей видимости, умер. Попытка засчитывается.
+    """
+    stale = Job.objects.filter(
+        state=Job.RUNNING,
+        started__lt=timezone.now() - timedelta(seconds=settings.JOBS_TIMEOUT))
+    requeued = 0
+    for job in stale:
+        complete(job, TimeoutError('воркер не завершил задачу'))
+        requeued += 1
+    return requeued
+
+
+def stats():
+    """Глубина очереди: готовые, отложенные, выполняемые и проваленные
+    задачи и сколько секунд ждёт самая старая готовая.
+    """
+    now = timezone.now()
+    due = Q(state=Job.QUEUED, run_at__lte=now)
+    counts = Job.objects.aggregate(
+        due=Count('pk', filter=due),
+        delayed=Count('pk', filter=Q(state=Job.QUEUED, run_at__gt=now)),
+        running=Count('pk', filter=Q(state=Job.RUNNING)),
+        failed=Count('pk', filter=Q(state=Job.FAILED)),
+        oldest=Min('run_at', filter=due),
+    )
+    oldest = counts.pop('oldest')
+    counts['lag'] = (now - oldest).total_seconds() if oldest else 0
+    return counts
+
+
+def process_pool(max_workers):
+    """Пул процессов для задач.
+
+    spawn, а не fork: дочерние процессы не должны наследовать открытые
+    соединения с базой и кэшем родителя. Django в них настраивается
+    до первой задачи, а модели импортируются уже при её распаковке.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+def thread_pool(max_workers):
+    return ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix='job')
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class Worker:
+    """Цикл run_workers: выбирает задачи в основном потоке и отдаёт их
+    пулу, пока заняты не все его места.
+    """
+
+    def __init__(self, pool, slots):
+        self.pool = pool
+        self.slots = slots
+        self.running = {}
+        self.done = self.failed = 0
+        # Ожидание (от run_at до начала) и длительность последних задач.
+        self.waits = deque(maxlen=1000)
+        self.durations = deque(maxlen=1000)
+
+    def run(self, burst=False, report=None, stop=lambda: False):
+        """Работает до stop(); с burst - пока есть готовые задачи.
+        report(строка) раз в JOBS_REPORT_INTERVAL секунд получает сводку.
+        """
+        reported = reaped = time.monotonic()
+        while not stop():
+            if time.monotonic() - reaped >= settings.JOBS_TIMEOUT / 2:
+                requeue_stale()
+                reaped = time.monotonic()
+            if not self.step():
+                if burst:
+                    break
+                time.sleep(settings.JOBS_POLL_INTERVAL)
+            if report and (
+                time.monotonic() - reported >= settings.JOBS_REPORT_INTERVAL
+            ):
+                report(self.summary())
+                reported = time.monotonic()
+        for future in list(self.running):
+            # Задачи, начатые до остановки, доделываются.
+            future.exception()
+            self.finish(future)
+        if report:
+            report(self.summary())
+
+    def step(self):
+        """Занимает свободные места пула и ждёт завершения хотя бы одной
+        задачи. False - если выполнять нечего.
+        """
+        free = self.slots - len(self.running)
+        if free:
+            for job in claim(free):
+                self.start(job)
+        if not self.running:
+            return False
+        finished, _ = wait(
+            self.running, timeout=settings.JOBS_POLL_INTERVAL,
+            return_when=FIRST_COMPLETED)
+        for future in finished:
+            self.finish(future)
+        return True
+
+    def start(self, job):
+        self.waits.append((job.started - job.run_at).total_seconds())
+        future = self.pool.submit(perform, job.name, job.payload)
+        self.running[future] = (job, time.monotonic())
+
+    def finish(self, future):
+        job, started = self.running.pop(future)
+        self.durations.append(time.monotonic() - started)
+        error = future.exception()
+        if error is None:
+            self.done += 1
+        else:
+            self.failed += 1
+            logger.warning('Задача %s упала: %r', job.name, error)
+        complete(job, error)
+
+    def summary(self):
+        line = (
+            f'выполнено {self.done}, с ошибкой {self.failed}, '
+            '{due} готовы, {delayed} отложены, {failed} провалены, '
+            'самая старая ждёт {lag:.1f} с'.format(**stats())
+        )
+        if self.durations:
+            line += (
+                f'; ожидание p50 {_percentile(self.waits, 0.5):.2f} с, '
+                f'p95 {_percentile(self.waits, 0.95):.2f} с; '
+                f'выполнение p50 {_percentile(self.durations, 0.5):.2f} с, '
+                f'p95 {_percentile(self.durations, 0.95):.2f} с'
+            )
+        return line
@@ -0,0 +1,79 @@
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import TieredCache, _ProcessState
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержку попаданий и память LocMemCache '
+        'и двухуровневого TieredCache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--value-size', type=int, default=2048)
+        parser.add_argument('--reads', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        keys = [f'bench:{i}' for i in range(options['keys'])]
+        value = 'x' * options['value_size']
+        with tempfile.TemporaryDirectory() as directory:
+            params = {'OPTIONS': {
+                'MAX_ENTRIES': len(keys) * 2,
+                'L1_MAX_ENTRIES': len(keys) * 2,
+                'SYNC_INTERVAL': 0.5,
+            }}
+            backends = {
+                'LocMemCache': LocMemCache('bench', params),
+                'TieredCache L1': TieredCache(
+                    os.path.join(directory, 'l2.sqlite3'), params),
+            }
+            for name, backend in backends.items():
+                memory = self.fill(backend, keys, value)
+                latency = self.read(backend, keys, options['reads'])
+                self.report(name, latency, memory)
+            tiered = backends['TieredCache L1']
+            latency = self.read(
+                tiered, keys, options['reads'], cold=True)
+            self.report('TieredCache L2', latency, None)
+
+    def fill(self, backend, keys, value):
+        tracemalloc.start()
+        for key in keys:
+            backend.set(key, value, timeout=None)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return memory
+
+    def read(self, backend, keys, reads, cold=False):
+        timings = []
+        for i in range(reads):
+            if cold:
+                # Пустой L1, как у только что запущенного воркера.
+                state = backend._process_state = _ProcessState()
+                state.stamp = backend._max_stamp(backend._db)
+            key = keys[i % len(keys)]
+            started = time.perf_counter()
+            backend.get(key)
+            timings.append((time.perf_counter() - started) * 1e6)
+        timings.sort()
+        return (
+            statistics.median(timings),
+            timings[int(len(timings) * 0.99) - 1],
+        )
+
+    def report(self, name, latency, memory):
+        line = (
+            f'{name:16} p50 {latency[0]:7.1f} мкс, '
+            f'p99 {latency[1]:7.1f} мкс'
+        )
+        if memory is not None:
+            line += f', память {memory / 1024:8.0f} КиБ'
+        self.stdout.write(line)
@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.sqlite import apply_pragmas
+
+# Без прагм: так соединение открывает Django по умолчанию - журнал
+# отката, synchronous=FULL и ожидание блокировки 5 с из модуля sqlite3.
+PROFILES = {
+    'по умолчанию': {},
+    'SQLITE_PRAGMAS': settings.SQLITE_PRAGMAS,
+}
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, author_id INTEGER, '
+    'pub_date REAL, text TEXT)',
+    'CREATE INDEX post_author_date ON post (author_id, pub_date)',
+    'CREATE TABLE stats (author_id INTEGER PRIMARY KEY, posts INTEGER)',
+)
+AUTHORS = 500
+
+
+def _connect(path, pragmas):
+    # isolation_level=None - автокоммит и явные BEGIN, как в Django.
+    db = sqlite3.connect(path, isolation_level=None)
+    apply_pragmas(db, pragmas)
+    return db
+
+
+def _read(db, rng):
+    db.execute(
+        'SELECT id, text FROM post WHERE author_id = ? '
+        'ORDER BY pub_date DESC LIMIT 10',
+        [rng.randrange(AUTHORS)]).fetchall()
+
+
+def _write(db, rng):
+    # Как atomic() в Django 2.2: модуль sqlite3 открывает транзакцию
+    # только перед первым изменением, чтение идёт в автокоммите.
+    author_id = rng.randrange(AUTHORS)
+    db.execute(
+        'SELECT posts FROM stats WHERE author_id = ?',
+        [author_id]).fetchone()
+    db.execute('BEGIN')
+    try:
+        db.execute(
+            'INSERT INTO post (author_id, pub_date, text) VALUES (?, ?, ?)',
+            [author_id, time.time(), 'x' * 200])
+        db.execute(
+            'UPDATE stats SET posts = posts + 1 WHERE author_id = ?',
+            [author_id])
+        db.execute('COMMIT')
+    except sqlite3.OperationalError:
+        db.execute('ROLLBACK')
+        raise
+
+
+def worker(kind, path, pragmas, start_at, seconds, seed):
+    """Крутит чтения или записи до дедлайна, возвращает задержки
+    успешных операций и число ошибок «database is locked».
+    """
+    db = _connect(path, pragmas)
+    rng = random.Random(seed)
+    operation = _read if kind == 'read' else _write
+    latencies, locked = [], 0
+    time.sleep(max(0, start_at - time.time()))
+    deadline = start_at + seconds
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            operation(db, rng)
+        except sqlite3.OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            locked += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    db.close()
+    return kind, latencies, locked
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность чтения и записи SQLite '
+        'из нескольких процессов без прагм и с SQLITE_PRAGMAS '
+        'на временной базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--rows', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"Профиль":16} {"чтений/с":>10} {"записей/с":>10} '
+            f'{"p95 записи, мс":>15} {"locked":>7}')
+        with tempfile.TemporaryDirectory() as directory:
+            for name, pragmas in PROFILES.items():
+                path = os.path.join(directory, f'{len(name)}.sqlite3')
+                self.prepare(path, pragmas, options['rows'])
+                self.report(name, self.run(path, pragmas, options), options)
+
+    def prepare(self, path, pragmas, rows):
+        db = _connect(path, pragmas)
+        for statement in SCHEMA:
+            db.execute(statement)
+        rng = random.Random(0)
+        db.execute('BEGIN')
+        db.executemany(
+            'INSERT INTO post (author_id, pub_date, text) VALUES (?, ?, ?)',
+            ((rng.randrange(AUTHORS), i, 'x' * 200) for i in range(rows)))
+        db.executemany(
+            'INSERT INTO stats VALUES (?, 0)',
+            ((i,) for i in range(AUTHORS)))
+        db.execute('COMMIT')
+        db.close()
+
+    def run(self, path, pragmas, options):
+        kinds = (
+            ['read'] * options['readers'] + ['write'] * options['writers'])
+        # spawn: дочерние процессы не наследуют соединения родителя.
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(len(kinds)) as pool:
+            start_at = time.time() + 1
+            return pool.starmap(worker, [
+                (kind, path, pragmas, start_at, options['seconds'], seed)
+                for seed, kind in enumerate(kinds)
+            ])
+
+    def report(self, name, results, options):
+        seconds = options['seconds']
+        reads = sum(len(lat) for kind, lat, _ in results if kind == 'read')
+        writes = [
+            latency for kind, latencies, _ in results if kind == 'write'
+            for latency in latencies
+        ]
+        locked = sum(count for _, _, count in results)
+        p95 = (
+            statistics.quantiles(writes, n=20)[-1] * 1000
+            if len(writes) > 1 else 0)
+        self.stdout.write(
+            f'{name:16} {reads / seconds:10.0f} '
+            f'{len(writes) / seconds:10.0f} {p95:15.2f} {locked:7}')
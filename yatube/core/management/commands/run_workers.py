@@ -0,0 +1,69 @@
+import logging
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import jobs
+
+logger = logging.getLogger('core.jobs')
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет фоновые задачи core.jobs в пуле потоков (для задач, '
+        'которые ждут сеть или базу) или процессов (для задач на CPU). '
+        'Останавливается по SIGTERM или Ctrl+C, доделав начатые задачи.'
+    )
+
+    def add_arguments(self, parser):
+        pool = parser.add_mutually_exclusive_group()
+        pool.add_argument(
+            '--threads', type=int, default=0,
+            help='Потоков в пуле (по умолчанию 4).')
+        pool.add_argument(
+            '--processes', type=int, default=0,
+            help='Процессов в пуле.')
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выйти, когда готовых задач не останется.')
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Показать глубину очереди и выйти.')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(
+                'готовы {due}, отложены {delayed}, выполняются {running}, '
+                'провалены {failed}, самая старая ждёт {lag:.1f} с'.format(
+                    **jobs.stats()))
+            return
+        if options['threads'] < 0 or options['processes'] < 0:
+            raise CommandError('Размер пула должен быть положительным.')
+        if options['processes']:
+            slots = options['processes']
+            pool = jobs.process_pool(slots)
+        else:
+            slots = options['threads'] or 4
+            pool = jobs.thread_pool(slots)
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        previous = signal.signal(signal.SIGTERM, stop)
+        worker = jobs.Worker(pool, slots)
+        try:
+            with pool:
+                worker.run(
+                    burst=options['burst'], report=self.report,
+                    stop=lambda: bool(stopping))
+        except KeyboardInterrupt:
+            # Прерван посреди цикла: выход из with дождался начатых задач,
+            # отмечаем их в очереди.
+            worker.run(stop=lambda: True, report=self.report)
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+
+    def report(self, line):
+        logger.info(line)
+        self.stdout.write(line)
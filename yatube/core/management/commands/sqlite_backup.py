@@ -0,0 +1,35 @@
+import os
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Снимает копию базы SQLite командой VACUUM INTO без остановки '
+        'сайта: копия согласована на момент начала, сжата и без WAL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            help='Файл копии; по умолчанию backups/db-<время>.sqlite3.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда работает только с SQLite.')
+        path = options['path'] or os.path.join(
+            settings.BASE_DIR, 'backups',
+            f'db-{datetime.now():%Y%m%d-%H%M%S}.sqlite3')
+        if os.path.exists(path):
+            raise CommandError(f'Файл {path} уже существует.')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM INTO %s', [path])
+        self.stdout.write(
+            f'Копия {path}: {os.path.getsize(path) / 2 ** 20:.1f} МиБ '
+            f'за {time.perf_counter() - started:.1f} с')
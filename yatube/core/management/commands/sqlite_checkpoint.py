@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит журнал WAL в основной файл базы SQLite. TRUNCATE '
+        'ещё и обрезает файл -wal, если его никто не читает.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', choices=MODES, default='TRUNCATE')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда работает только с SQLite.')
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA wal_checkpoint({options["mode"]})')
+            busy, log, checkpointed = cursor.fetchone()
+        if busy:
+            self.stderr.write(
+                'Checkpoint не завершён: базу держит другое соединение.')
+        self.stdout.write(
+            f'Страниц в журнале: {log}, перенесено: {checkpointed}')
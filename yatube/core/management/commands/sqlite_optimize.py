@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет статистику планировщика SQLite: PRAGMA optimize '
+        'анализирует только таблицы, которым это нужно; с --analyze - '
+        'полный ANALYZE всех индексов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда работает только с SQLite.')
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            if options['analyze']:
+                cursor.execute('ANALYZE')
+            cursor.execute('PRAGMA optimize')
+        self.stdout.write(
+            f'Готово за {time.perf_counter() - started:.2f} с')
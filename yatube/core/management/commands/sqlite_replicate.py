@@ -0,0 +1,54 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.replicas import database_path
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет локальные реплики SQLite из REPLICA_DATABASES: снимает '
+        'копию основной базы командой VACUUM INTO и атомарно подменяет '
+        'ею файл реплики. С --interval повторяет это каждые N секунд.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='aliases',
+            help='Алиас реплики; по умолчанию все из REPLICA_DATABASES.')
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Секунд между обновлениями; 0 - обновить один раз.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда работает только с SQLite.')
+        aliases = options['aliases'] or settings.REPLICA_DATABASES
+        if not aliases:
+            raise CommandError('Реплики не заданы: REPLICA_DATABASES пуст.')
+        while True:
+            for alias in aliases:
+                self.replicate(alias)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def replicate(self, alias):
+        path = database_path(alias)
+        temporary = f'{path}.tmp'
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        # Копия содержит всё, что закоммичено до начала VACUUM INTO.
+        started = time.time()
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM INTO %s', [temporary])
+        # По времени изменения файла core.replicas судит о свежести.
+        os.utime(temporary, (started, started))
+        # Открытые соединения дочитают прежний файл, новые откроют копию.
+        os.replace(temporary, path)
+        self.stdout.write(
+            f'{alias}: {os.path.getsize(path) / 2 ** 20:.1f} МиБ '
+            f'за {time.time() - started:.1f} с')
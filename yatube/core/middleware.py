@@ -0,0 +1,42 @@
+import json
+import logging
+import random
+
+from django.conf import settings
+
+from . import timing
+
+logger = logging.getLogger('core.timing')
+
+
+class ServerTimingMiddleware:
+    """Замеряет фазы выборки запросов (core.timing).
+
+    Итог уходит в заголовок Server-Timing и одной JSON-строкой в журнал
+    core.timing. Должен стоять первым в MIDDLEWARE, чтобы total включал
+    остальные middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.SERVER_TIMING_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+        timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = timing.stop()
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = timings.header()
+        if logger.isEnabledFor(logging.INFO):
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                **timings.as_dict(),
+            }
+            logger.info(json.dumps(record, ensure_ascii=False))
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Функция')),
+                ('payload', models.TextField(default='{}', verbose_name='Аргументы JSON')),
+                ('key', models.CharField(blank=True, max_length=255, null=True, verbose_name='Ключ дедупликации')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='Приоритет')),
+                ('state', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('failed', 'Не выполнена')], default='queued', max_length=10, verbose_name='Состояние')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Поставлена')),
+                ('run_at', models.DateTimeField(verbose_name='Выполнить не раньше')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Начата')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('max_attempts', models.PositiveSmallIntegerField(verbose_name='Попыток не больше')),
+                ('error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+            ],
+            options={
+                'verbose_name': 'Фоновая задача',
+                'verbose_name_plural': 'Фоновые задачи',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['state', '-priority', 'run_at'], name='job_state_priority_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(state='queued'), fields=('key',), name='job_queued_key_unique'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import models
+from django.db.models import Q
+
+
+class Job(models.Model):
+    """Фоновая задача очереди core.jobs.
+
+    Выполненные задачи удаляются, в таблице остаются ждущие,
+    выполняемые и те, что исчерпали попытки.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Не выполнена'),
+    )
+
+    name = models.CharField('Функция', max_length=255)
+    payload = models.TextField('Аргументы JSON', default='{}')
+    key = models.CharField(
+        'Ключ дедупликации', max_length=255, blank=True, null=True)
+    priority = models.SmallIntegerField('Приоритет', default=0)
+    state = models.CharField(
+        'Состояние', max_length=10, choices=STATES, default=QUEUED)
+    created = models.DateTimeField('Поставлена', auto_now_add=True)
+    run_at = models.DateTimeField('Выполнить не раньше')
+    started = models.DateTimeField('Начата', blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Попыток не больше')
+    error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Фоновые задачи'
+        verbose_name = 'Фоновая задача'
+        indexes = [
+            # Выбор следующих задач: WHERE state = 'queued'
+            # ORDER BY priority DESC, run_at.
+            models.Index(
+                fields=['state', '-priority', 'run_at'],
+                name='job_state_priority_idx'),
+        ]
+        constraints = [
+            # Задача с тем же ключом, пока ждёт, не ставится второй раз.
+            models.UniqueConstraint(
+                fields=['key'], condition=Q(state='queued'),
+                name='job_queued_key_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} [{self.state}]'
@@ -0,0 +1,157 @@
+"""Ограничение частоты пишущих запросов.
+
+Правила берутся из settings.RATELIMITS по имени URL вьюхи. Правило
+'user:10/m' - корзина из 10 токенов на пользователя (у гостя - на IP),
+которая наполняется со скоростью 10 токенов в минуту; 'ip:30/m' - то же
+на IP. Запрос без токена получает 429 с Retry-After.
+
+Корзины лежат в общем кэше. Compare-and-set у кэша Django нет, поэтому
+корзина сведена к атомарным incr двух окон длиной в период:
+расход = текущее окно + прошлое * доля прошлого окна, ещё попадающая
+в скользящий период. Ёмкость и средняя скорость те же, что у корзины
+токенов, а воркеры не мешают друг другу: запрос стоит incr и get.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+DEFAULT_METHODS = ('POST',)
+
+# Счётчики процесса: '<вьюха>:allowed' и '<вьюха>:limited'.
+stats = defaultdict(int)
+_stats_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def parse_rule(rule):
+    """'user:10/m' -> ('user', 10, 60)."""
+    key, _, rate = rule.partition(':')
+    limit, _, period = rate.partition('/')
+    if key not in ('user', 'ip') or period not in PERIODS:
+        raise ValueError(f'Неверное правило ограничения: {rule!r}')
+    return key, int(limit), PERIODS[period]
+
+
+def client_ip(request):
+    header = settings.RATELIMIT_IP_HEADER
+    if header and request.META.get(header):
+        # X-Forwarded-For: клиент, прокси1, прокси2.
+        return request.META[header].split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _identity(request, key):
+    if key == 'user' and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def _count(key, period):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=period * 2)
+        return cache.incr(key)
+
+
+def _take(name, rule, request, now):
+    """Берёт токен; возвращает (ключ окна, None) или (None, retry_after)."""
+    key, limit, period = parse_rule(rule)
+    window = int(now // period)
+    # Вид правила в ключе: у гостя правила user и ip с одним периодом
+    # иначе делили бы один счётчик и списывали запрос дважды.
+    prefix = f'ratelimit:{name}:{key}:{_identity(request, key)}:{period}'
+    current_key = f'{prefix}:{window}'
+    current = _count(current_key, period)
+    previous = cache.get(f'{prefix}:{window - 1}', 0)
+    elapsed = now - window * period
+    if current + previous * (1 - elapsed / period) <= limit:
+        return current_key, None
+    # Отказ не расходует токен.
+    cache.decr(current_key)
+    current -= 1
+    if current + 1 > limit or not previous:
+        retry_after = period - elapsed
+    else:
+        # Через сколько вклад прошлого окна упадёт настолько, что
+        # поместится ещё один запрос.
+        retry_after = period * (1 - (limit - current - 1) / previous) - elapsed
+    return None, max(1, math.ceil(retry_after))
+
+
+def _count_stat(name, outcome):
+    with _stats_lock:
+        stats[f'{name}:{outcome}'] += 1
+
+
+def check(request, name):
+    """Секунды до следующей попытки, если лимит вьюхи name исчерпан."""
+    config = settings.RATELIMITS.get(name)
+    if (
+        not settings.RATELIMIT_ENABLED or config is None
+        or request.method not in config.get('methods', DEFAULT_METHODS)
+    ):
+        return None
+    now = time.time()
+    taken = []
+    for rule in config['rates']:
+        current_key, retry_after = _take(name, rule, request, now)
+        if retry_after is not None:
+            # Токены уже пройденных правил возвращаются.
+            for key in taken:
+                cache.decr(key)
+            _count_stat(name, 'limited')
+            return retry_after
+        taken.append(current_key)
+    _count_stat(name, 'allowed')
+    return None
+
+
+def too_many_requests(request, retry_after):
+    response = render(
+        request, 'core/429.html', {'retry_after': retry_after}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def ratelimit(name):
+    """Декоратор вьюхи с правилами settings.RATELIMITS[name]."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            retry_after = check(request, name)
+            if retry_after is not None:
+                return too_many_requests(request, retry_after)
+            return view(request, *args, **kwargs)
+        wrapper.ratelimit = name
+        return wrapper
+    return decorator
+
+
+class RateLimitMiddleware:
+    """Ограничивает вьюхи из RATELIMITS по имени URL.
+
+    Нужен для вьюх, которые неудобно декорировать (классы из чужих
+    приложений); вьюхи с @ratelimit пропускаются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(view_func, 'ratelimit') or request.resolver_match is None:
+            return None
+        retry_after = check(request, request.resolver_match.view_name)
+        if retry_after is not None:
+            return too_many_requests(request, retry_after)
+        return None
@@ -0,0 +1,132 @@
+"""Чтение с реплик базы.
+
+ReplicaRouter отправляет чтения GET-запросов к вьюхам из модулей
+REPLICA_VIEW_MODULES на одну из реплик REPLICA_DATABASES, остальное -
+на default. Годится только реплика, обновлённая не раньше чем
+REPLICA_MAX_LAG секунд назад. Время копии SQLite - время изменения
+её файла (команда sqlite_replicate ставит его на начало копирования),
+у прочих баз его отмечает тот, кто следит за репликацией (mark_synced).
+
+Свои записи пользователь читает с default: после записи ответ ставит
+куку REPLICA_PIN_COOKIE со временем записи, и реплика выбирается, только
+если она обновлена позже. Страницы с областями кэша (posts.caching)
+так же требуют реплику не старше последнего изменения своих областей -
+иначе фрагменты нового поколения заполнились бы старыми данными.
+"""
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Реплика запроса, время её копии и была ли в запросе запись.
+_state = threading.local()
+
+
+def _synced_key(alias):
+    return f'replica:synced:{alias}'
+
+
+def mark_synced(alias, timestamp):
+    """Отмечает, что реплика alias содержит все записи до timestamp."""
+    cache.set(_synced_key(alias), timestamp, timeout=None)
+
+
+def database_path(alias):
+    """Путь к файлу базы SQLite, в том числе из NAME вида file:<путь>?..."""
+    name = connections.databases[alias]['NAME']
+    if name.startswith('file:'):
+        name = name[len('file:'):].partition('?')[0]
+    return name
+
+
+def synced_at(alias):
+    """Время, до которого у реплики alias есть все записи, или 0."""
+    if connections.databases[alias]['ENGINE'].endswith('sqlite3'):
+        try:
+            return os.stat(database_path(alias)).st_mtime
+        except OSError:
+            return 0
+    return cache.get(_synced_key(alias), 0)
+
+
+def choose(since=0):
+    """(alias, время копии) случайной достаточно свежей реплики
+    или (None, None).
+    """
+    since = max(since, time.time() - settings.REPLICA_MAX_LAG)
+    synced = {alias: synced_at(alias) for alias in settings.REPLICA_DATABASES}
+    fresh = [alias for alias, at in synced.items() if at >= since]
+    if not fresh:
+        return None, None
+    alias = random.choice(fresh)
+    return alias, synced[alias]
+
+
+def wrote():
+    """Оставшиеся чтения запроса идут с default, ответ закрепит его
+    за пользователем.
+    """
+    _state.replica = None
+    _state.wrote = True
+
+
+def require(since):
+    """Переходит на default, если реплика запроса старше since.
+
+    Возвращает True, если реплика сброшена: прочитанное с неё до этого
+    устарело.
+    """
+    if getattr(_state, 'replica', None) and _state.synced < since:
+        _state.replica = None
+        return True
+    return False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'replica', None) or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        wrote()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.replica, _state.wrote = None, False
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.replica = None
+        if _state.wrote:
+            # Время ответа, а не записи: к нему транзакция уже закрыта.
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, f'{time.time():.3f}',
+                max_age=settings.REPLICA_MAX_LAG, httponly=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method not in ('GET', 'HEAD')
+            or view_func.__module__ not in settings.REPLICA_VIEW_MODULES
+        ):
+            return None
+        try:
+            pinned = float(request.COOKIES.get(settings.REPLICA_PIN_COOKIE))
+        except (TypeError, ValueError):
+            pinned = 0
+        _state.replica, _state.synced = choose(pinned)
+        return None
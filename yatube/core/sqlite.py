@@ -0,0 +1,53 @@
+"""Настройка соединений с SQLite для нескольких воркеров.
+
+Прагмы из SQLITE_PRAGMAS выполняются на каждом новом соединении:
+WAL даёт читать во время записи, synchronous=NORMAL в режиме WAL
+не рискует целостностью и делает fsync только на checkpoint,
+busy_timeout ждёт блокировку вместо мгновенного «database is locked»,
+mmap_size и cache_size сокращают системные вызовы при чтении.
+"""
+import sqlite3
+
+from django.conf import settings
+
+
+def apply_pragmas(db, pragmas):
+    """Выполняет прагмы на соединении sqlite3 в порядке словаря."""
+    for name, value in pragmas.items():
+        db.execute(f'PRAGMA {name} = {value}')
+
+
+def configure(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # Напрямую через sqlite3: эти запросы не должны попадать
+    # в журнал запросов Django и в замеры core.timing.
+    pragmas = settings.SQLITE_PRAGMAS
+    if connection.alias in settings.REPLICA_DATABASES:
+        # Реплика открыта только для чтения: режим журнала у неё
+        # не переключить, да он и не нужен.
+        pragmas = {
+            name: value for name, value in pragmas.items()
+            if name != 'journal_mode'
+        }
+    apply_pragmas(connection.connection, pragmas)
+
+
+def analyzed_rows(connection, table):
+    """Число строк table по статистике ANALYZE или None, если её нет.
+
+    Первое число столбца stat в sqlite_stat1 - строк в таблице на момент
+    последнего ANALYZE (PRAGMA optimize, команда sqlite_optimize).
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    connection.ensure_connection()
+    # Напрямую через sqlite3, как и прагмы: это чтение метаданных.
+    try:
+        row = connection.connection.execute(
+            'SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1',
+            [table]).fetchone()
+    except sqlite3.OperationalError:
+        # ANALYZE ещё ни разу не выполнялся.
+        return None
+    return int(row[0].split()[0]) if row else None
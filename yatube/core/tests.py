@@ -1,4 +1,35 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import caching
+from posts.models import Post
+
+from . import jobs, ratelimit, replicas, sqlite, timing, writer
+from .cache import TieredCache
+from .models import Job
 
 
 class ViewTestClass(TestCase):
@@ -6,3 +37,483 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class TieredCacheTestClass(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.params = {'OPTIONS': {'SYNC_INTERVAL': 0}}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def other_process(self):
+        """Экземпляр со своим L1, как в соседнем воркере."""
+        other = TieredCache(self.path, self.params)
+        other._process_state = type(other._state)()
+        other._process_state.stamp = other._max_stamp(other._db)
+        return other
+
+    def test_value_is_shared_through_l2(self):
+        """Запись одного процесса читается другим."""
+        cache = TieredCache(self.path, self.params)
+        other = self.other_process()
+        cache.set('key', {'value': 1})
+        self.assertEqual(other.get('key'), {'value': 1})
+        self.assertEqual(other.get_stats()['l2_hits'], 1)
+        self.assertEqual(other.get('key'), {'value': 1})
+        self.assertEqual(other.get_stats()['l1_hits'], 1)
+
+    def test_l1_is_invalidated_by_other_process(self):
+        """Изменение и удаление в одном процессе сбрасывают L1 другого."""
+        cache = TieredCache(self.path, self.params)
+        other = self.other_process()
+        cache.set('key', 'old')
+        self.assertEqual(other.get('key'), 'old')
+        cache.set('key', 'new')
+        self.assertEqual(other.get('key'), 'new')
+        cache.delete('key')
+        self.assertIsNone(other.get('key'))
+
+    def test_add_incr_and_clear(self):
+        """add не перезаписывает, incr атомарен, clear виден всем."""
+        cache = TieredCache(self.path, self.params)
+        other = self.other_process()
+        self.assertTrue(cache.add('counter', 1))
+        self.assertFalse(other.add('counter', 5))
+        self.assertEqual(other.incr('counter'), 2)
+        self.assertEqual(cache.get('counter'), 2)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+        cache.clear()
+        self.assertIsNone(other.get('counter'))
+
+
+class ServerTimingTestClass(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_header_and_log_line(self):
+        """Замеренный запрос отдаёт Server-Timing и пишет строку в журнал."""
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            response = self.client.get('/')
+        header = response['Server-Timing']
+        self.assertIn('db;dur=', header)
+        self.assertIn('cache;dur=', header)
+        self.assertIn('tpl;dur=', header)
+        self.assertIn('total;dur=', header)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_count'], 0)
+        self.assertGreater(record['cache_misses'], 0)
+        phases = sum(record[f'{name}_ms'] for name, _ in timing.PHASES)
+        self.assertLessEqual(phases, record['total_ms'])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_request(self):
+        """Вне выборки запрос не замеряется."""
+        response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_nested_phases(self):
+        """Вложенная фаза вычитается из внешней и не считается дважды."""
+        timings = timing.start()
+        try:
+            cache.get_many(['a', 'b'])
+            cache.set('a', 1)
+            self.assertEqual(cache.get('a'), 1)
+            with timing.phase(timing.THUMBNAIL):
+                cache.get('b')
+        finally:
+            timing.stop()
+        self.assertEqual(timings.counts[timing.CACHE], 4)
+        self.assertEqual(timings.counts[timing.THUMBNAIL], 1)
+        self.assertEqual(timings.counts['cache_hits'], 1)
+        self.assertEqual(timings.counts['cache_misses'], 3)
+        self.assertLessEqual(
+            sum(timings.durations.values()), timings.total)
+
+    def test_get_many_with_generator(self):
+        """get_many с ключами-генератором возвращает значения и считает
+        промахи.
+        """
+        cache.set('a', 1)
+        timings = timing.start()
+        try:
+            values = cache.get_many(key for key in ('a', 'b'))
+        finally:
+            timing.stop()
+        self.assertEqual(values, {'a': 1})
+        self.assertEqual(timings.counts['cache_hits'], 1)
+        self.assertEqual(timings.counts['cache_misses'], 1)
+
+
+@override_settings(RATELIMIT_ENABLED=True, RATELIMITS={
+    'posts:add_comment': {'rates': ['user:3/m', 'ip:5/m']},
+    'users:signup': {'rates': ['ip:2/h']},
+})
+class RateLimitTestClass(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.author = User.objects.create(username='NoNameAuthor')
+        cls.reader = User.objects.create(username='Reader')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:add_comment', args=[self.post.pk])
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def test_user_bucket(self):
+        """Сверх лимита пользователь получает 429 с Retry-After,
+        у другого пользователя своя корзина.
+        """
+        client = self.client_for(self.reader)
+        for i in range(3):
+            response = client.post(self.url, {'text': f'Ответ {i}'})
+            self.assertEqual(response.status_code, 302)
+        response = client.post(self.url, {'text': 'Лишний'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self.post.comments.count(), 3)
+        response = self.client_for(self.author).post(
+            self.url, {'text': 'Автор'})
+        self.assertEqual(response.status_code, 302)
+        self.assertGreaterEqual(
+            ratelimit.stats['posts:add_comment:limited'], 1)
+
+    def test_ip_bucket_and_refunds(self):
+        """Общий лимит IP; отказ не тратит токены других правил."""
+        statuses = [
+            self.client_for(user).post(self.url, {'text': 'Ответ'})
+            .status_code
+            for user in (self.reader, self.reader, self.reader,
+                         self.reader, self.author, self.author,
+                         self.author)
+        ]
+        self.assertEqual(
+            statuses, [302, 302, 302, 429, 302, 302, 429])
+
+    @override_settings(RATELIMITS={
+        'users:signup': {'rates': ['user:3/m', 'ip:100/m']},
+    })
+    def test_guest_with_user_and_ip_rules(self):
+        """Гостю правила user и ip с одним периодом считают запрос
+        по одному разу.
+        """
+        request = RequestFactory().post(reverse('users:signup'))
+        request.user = AnonymousUser()
+        for _ in range(3):
+            self.assertIsNone(ratelimit.check(request, 'users:signup'))
+        self.assertIsNotNone(ratelimit.check(request, 'users:signup'))
+
+    def test_middleware_and_methods(self):
+        """Вьюха без декоратора ограничена middleware по имени URL,
+        GET формы не расходует токены.
+        """
+        url = reverse('users:signup')
+        for _ in range(5):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        for i in range(2):
+            self.client.post(url, {'username': f'new{i}'})
+        response = self.client.post(url, {'username': 'new3'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTemplateUsed(response, 'core/429.html')
+
+    def test_overhead(self):
+        """Проверка лимита не ходит в базу и не тормозит запрос.
+
+        Замеряется только check(), по медиане: с запасом на медленную
+        машину, но на порядок меньше запроса к базе.
+        """
+        request = RequestFactory().post(self.url)
+        request.user = self.reader
+        durations = []
+        with self.assertNumQueries(0):
+            for _ in range(50):
+                cache.clear()
+                started = time.perf_counter()
+                ratelimit.check(request, 'users:signup')
+                durations.append(time.perf_counter() - started)
+        self.assertLess(statistics.median(durations), 0.005)
+
+
+class SQLiteTestClass(TransactionTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_pragmas_on_new_connection(self):
+        """Прагмы SQLITE_PRAGMAS применяются к соединению Django."""
+        connection.ensure_connection()
+        db = connection.connection
+        self.assertEqual(
+            db.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+        self.assertEqual(db.execute('PRAGMA synchronous').fetchone()[0], 1)
+        self.assertEqual(db.execute('PRAGMA temp_store').fetchone()[0], 2)
+
+    def test_wal_on_file_database(self):
+        """На файловой базе включается WAL."""
+        db = sqlite3.connect(os.path.join(self.directory, 'db.sqlite3'))
+        self.addCleanup(db.close)
+        sqlite.apply_pragmas(db, {'journal_mode': 'WAL'})
+        self.assertEqual(
+            db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_maintenance_commands(self):
+        """Checkpoint, optimize и backup отрабатывают без ошибок,
+        копия содержит данные базы.
+        """
+        get_user_model().objects.create(username='NoNameAuthor')
+        path = os.path.join(self.directory, 'copy.sqlite3')
+        for command, args in (
+            ('sqlite_checkpoint', []),
+            ('sqlite_optimize', ['--analyze']),
+            ('sqlite_backup', [path]),
+        ):
+            call_command(command, *args, stdout=StringIO(), stderr=StringIO())
+        copy = sqlite3.connect(path)
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute(
+            'SELECT username FROM auth_user').fetchall(), [('NoNameAuthor',)])
+
+
+@override_settings(WRITE_QUEUE=True)
+class WriterTestClass(TransactionTestCase):
+    def test_run_in_writer_thread(self):
+        """Задача выполняется в потоке-писателе, результат и ошибка
+        возвращаются вызвавшему.
+        """
+        user = writer.run(
+            get_user_model().objects.create, username='NoNameAuthor')
+        self.assertTrue(
+            get_user_model().objects.filter(pk=user.pk).exists())
+        self.assertEqual(
+            writer.run(lambda: threading.current_thread().name), 'db-writer')
+        with self.assertRaises(ValueError):
+            writer.run(int, 'не число')
+
+    def test_failed_job_does_not_break_batch(self):
+        """Ошибка задачи откатывает только её точку сохранения."""
+        User = get_user_model()
+
+        def create_and_fail():
+            User.objects.create(username='Broken')
+            raise RuntimeError('сбой')
+
+        batch = [
+            (Future(), User.objects.create, (), {'username': 'First'}),
+            (Future(), create_and_fail, (), {}),
+            (Future(), User.objects.create, (), {'username': 'Second'}),
+        ]
+        writer._commit(batch)
+        self.assertEqual(batch[0][0].result().username, 'First')
+        self.assertIsInstance(batch[1][0].exception(), RuntimeError)
+        self.assertEqual(
+            sorted(User.objects.values_list('username', flat=True)),
+            ['First', 'Second'])
+
+    @override_settings(WRITE_QUEUE=True, WRITE_QUEUE_TIMEOUT=0.1)
+    def test_timed_out_job_is_cancelled(self):
+        """Запись, которую вьюха не дождалась, не выполняется позже."""
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        blocker = threading.Thread(target=writer.run, args=(block,))
+        blocker.start()
+        started.wait(5)
+        User = get_user_model()
+        with self.assertRaises(TimeoutError):
+            writer.run(User.objects.create, username='Late')
+        release.set()
+        blocker.join(5)
+        # Следующая запись проходит после отменённой.
+        writer.run(User.objects.create, username='Next')
+        self.assertEqual(
+            list(User.objects.values_list('username', flat=True)), ['Next'])
+
+    def test_inline_inside_transaction(self):
+        """В открытой транзакции задача выполняется на месте."""
+        with transaction.atomic():
+            name = writer.run(lambda: threading.current_thread().name)
+        self.assertEqual(name, threading.current_thread().name)
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaTestClass(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.author = User.objects.create(username='NoNameAuthor')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        self.client.force_login(self.author)
+        self.url = reverse('posts:post_detail', args=[self.post.pk])
+
+    def queries(self, url, synced):
+        """Ответ и число запросов к реплике и к default.
+
+        Области, время изменения которых ещё не записано в кэш, считаются
+        изменёнными в момент запроса, поэтому свежая реплика - на секунду
+        впереди.
+        """
+        with mock.patch.object(replicas, 'synced_at', return_value=synced):
+            with CaptureQueriesContext(connections['replica']) as replica:
+                with CaptureQueriesContext(connection) as default:
+                    response = self.client.get(url)
+        return response, len(replica), len(default)
+
+    def test_reads_from_fresh_replica(self):
+        """Чтения GET-вьюхи идут на свежую реплику, на default - ни одного."""
+        response, replica, default = self.queries(self.url, time.time() + 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(replica, 0)
+        self.assertEqual(default, 0)
+
+    def test_stale_replica(self):
+        """Реплика старше REPLICA_MAX_LAG или изменений страницы
+        не используется.
+        """
+        lag = time.time() - settings.REPLICA_MAX_LAG - 1
+        self.assertEqual(self.queries(self.url, lag)[1], 0)
+        caching.bump(caching.post_scope(self.post.pk))
+        response, replica, default = self.queries(
+            self.url, time.time() - 0.5)
+        # Реплика успевает отдать только объект страницы для ETag.
+        self.assertLessEqual(replica, 1)
+        self.assertGreater(default, 0)
+        self.assertEqual(response.context['post']._state.db, 'default')
+
+    def test_read_your_writes(self):
+        """После записи пользователь читает с default, пока реплика
+        не обновится позже записи.
+        """
+        synced = time.time()
+        with mock.patch.object(replicas, 'synced_at', return_value=synced):
+            response = self.client.post(
+                reverse('posts:add_comment', args=[self.post.pk]),
+                {'text': 'Ответ'})
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        response, replica, _ = self.queries(self.url, synced)
+        self.assertEqual(replica, 0)
+        self.assertContains(response, 'Ответ')
+        self.assertGreater(self.queries(self.url, time.time() + 1)[1], 0)
+
+
+# Задачи очереди для JobsTestClass: функции уровня модуля.
+performed = []
+
+
+def record(value):
+    performed.append(value)
+
+
+def fail():
+    raise RuntimeError('сбой')
+
+
+@override_settings(JOBS_QUEUE=True, JOBS_RETRY_DELAY=10, JOBS_MAX_ATTEMPTS=3)
+class JobsTestClass(TransactionTestCase):
+    def setUp(self):
+        performed.clear()
+
+    def run_workers(self, *args):
+        output = StringIO()
+        call_command('run_workers', '--burst', *args, stdout=output)
+        return output.getvalue()
+
+    def run_failing(self):
+        with self.assertLogs('core.jobs', 'WARNING') as logs:
+            self.run_workers()
+        return logs.output
+
+    @override_settings(JOBS_QUEUE=False)
+    def test_inline_without_queue(self):
+        """Без JOBS_QUEUE задача выполняется сразу."""
+        jobs.enqueue(record, ['сразу'])
+        self.assertEqual(performed, ['сразу'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_priority_delay_and_key(self):
+        """Задачи выбираются по приоритету, отложенные ждут своего
+        времени, ждущая задача с тем же ключом не дублируется.
+        """
+        jobs.enqueue(record, ['обычная'])
+        jobs.enqueue(record, ['срочная'], priority=5)
+        jobs.enqueue(record, ['отложенная'], delay=60)
+        jobs.enqueue(record, ['ключ'], key='one')
+        jobs.enqueue(record, ['дубль'], key='one')
+        self.assertEqual(Job.objects.count(), 4)
+        self.assertEqual(jobs.stats()['due'], 3)
+        self.assertEqual(jobs.stats()['delayed'], 1)
+        output = self.run_workers('--threads', '1')
+        self.assertEqual(performed, ['срочная', 'обычная', 'ключ'])
+        self.assertIn('выполнено 3', output)
+        self.assertEqual(Job.objects.get().payload, json.dumps(
+            {'args': ['отложенная'], 'kwargs': {}}))
+
+    def test_retry_with_backoff(self):
+        """Упавшая задача повторяется с удвоением паузы, а исчерпав
+        попытки, остаётся в состоянии failed.
+        """
+        jobs.enqueue(fail)
+        delays = []
+        for _ in range(2):
+            started = timezone.now()
+            self.run_failing()
+            job = Job.objects.get()
+            self.assertEqual(job.state, Job.QUEUED)
+            self.assertIn('RuntimeError: сбой', job.error)
+            delays.append(round((job.run_at - started).total_seconds()))
+            Job.objects.update(run_at=timezone.now())
+        self.assertEqual(delays, [10, 20])
+        self.assertIn('не выполнена', self.run_failing()[-1])
+        job = Job.objects.get()
+        self.assertEqual((job.state, job.attempts), (Job.FAILED, 3))
+        self.assertEqual(jobs.stats()['failed'], 1)
+
+    def test_requeue_stale(self):
+        """Задача, чей воркер пропал, возвращается в очередь."""
+        jobs.enqueue(record, ['зависшая'])
+        job = jobs.claim(10)[0]
+        self.assertEqual(jobs.claim(10), [])
+        self.assertEqual(jobs.requeue_stale(), 0)
+        Job.objects.update(
+            started=job.started - timedelta(seconds=settings.JOBS_TIMEOUT))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job = Job.objects.get()
+        self.assertEqual((job.state, job.attempts), (Job.QUEUED, 1))
+
+    def test_stats_command(self):
+        jobs.enqueue(record, ['ждёт'])
+        self.assertIn(
+            'готовы 1, отложены 0',
+            self.run_workers('--stats'))
+        self.assertEqual(performed, [])
+
+    def test_password_reset_mail_is_queued(self):
+        """Письмо о сбросе пароля уходит из очереди."""
+        get_user_model().objects.create_user(
+            username='NoNameAuthor', email='author@example.com',
+            password='password')
+        response = self.client.post(
+            reverse('users:password_reset'),
+            {'email': 'author@example.com'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Job.objects.get().priority, 10)
+        self.run_workers()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['author@example.com'])
@@ -0,0 +1,210 @@
+"""Замеры фаз запроса: SQL, кэш, шаблоны и миниатюры.
+
+ServerTimingMiddleware заводит Timings для выбранной доли запросов
+(SERVER_TIMING_SAMPLE_RATE) в памяти потока, а обёртки из install()
+засекают в нём время каждой фазы. Фаза считает только собственное время:
+вложенные фазы (SQL из шаблона, кэш внутри sorl) вычитаются из внешней,
+так что сумма фаз не больше общего времени запроса. Вне замеряемого
+запроса обёртка обходится одной проверкой thread-local.
+"""
+import functools
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+from django.utils.module_loading import import_string
+
+DB = 'db'
+CACHE = 'cache'
+TEMPLATE = 'tpl'
+THUMBNAIL = 'thumb'
+# Порядок и подписи метрик в заголовке; заголовки HTTP - только ASCII.
+PHASES = (
+    (DB, 'SQL'),
+    (CACHE, 'Cache'),
+    (TEMPLATE, 'Templates'),
+    (THUMBNAIL, 'Thumbnails'),
+)
+_CACHE_METHODS = (
+    'get', 'get_many', 'set', 'set_many', 'add', 'delete', 'delete_many',
+    'incr', 'decr', 'has_key', 'touch', 'get_or_set', 'clear',
+)
+
+_local = threading.local()
+
+
+class Timings:
+    """Время и число вызовов каждой фазы одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = None
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._stack = []
+
+    def enter(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        """Закрывает фазу; True, если она не вложена в фазу того же типа."""
+        name, started, nested = self._stack.pop()
+        elapsed = time.perf_counter() - started
+        self.durations[name] += elapsed - nested
+        if self._stack:
+            parent = self._stack[-1]
+            parent[2] += elapsed
+            if parent[0] == name:
+                return False
+        self.counts[name] += 1
+        return True
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def header(self):
+        metrics = [
+            f'{name};dur={self.durations[name] * 1000:.1f};'
+            f'desc="{description} x{self.counts[name]}"'
+            for name, description in PHASES if self.counts[name]
+        ]
+        metrics.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        record = {'total_ms': round(self.total * 1000, 2)}
+        for name, _ in PHASES:
+            record[f'{name}_ms'] = round(self.durations[name] * 1000, 2)
+            record[f'{name}_count'] = self.counts[name]
+        record['cache_hits'] = self.counts['cache_hits']
+        record['cache_misses'] = self.counts['cache_misses']
+        return record
+
+
+def current():
+    """Timings замеряемого запроса или None."""
+    return getattr(_local, 'timings', None)
+
+
+def start():
+    _local.timings = Timings()
+    return _local.timings
+
+
+def stop():
+    timings = current()
+    _local.timings = None
+    if timings is not None:
+        timings.finish()
+    return timings
+
+
+class phase:
+    """Контекстный менеджер для своих фаз: with timing.phase(THUMBNAIL)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.timings = None
+
+    def __enter__(self):
+        self.timings = current()
+        if self.timings is not None:
+            self.timings.enter(self.name)
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.exit()
+
+
+def _count_hits(timings, method, result, args, kwargs):
+    if method == 'get':
+        default = kwargs.get('default', args[1] if len(args) > 1 else None)
+        hits = int(result is not default)
+        misses = 1 - hits
+    else:
+        hits = len(result)
+        misses = len(kwargs.get('keys', args[0] if args else ())) - hits
+    timings.counts['cache_hits'] += hits
+    timings.counts['cache_misses'] += misses
+
+
+def _timed_cache_method(method, func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        timings = current()
+        if timings is None:
+            return func(self, *args, **kwargs)
+        if method == 'get_many':
+            # Ключи могут прийти генератором: промахи считаются по их
+            # числу уже после вызова.
+            if args:
+                args = (list(args[0]), *args[1:])
+            elif 'keys' in kwargs:
+                kwargs['keys'] = list(kwargs['keys'])
+        timings.enter(CACHE)
+        try:
+            result = func(self, *args, **kwargs)
+        finally:
+            outermost = timings.exit()
+        # get_many в базовом классе сам вызывает get - попадания
+        # считаются только у внешнего вызова.
+        if outermost and method in ('get', 'get_many'):
+            _count_hits(timings, method, result, args, kwargs)
+        return result
+    wrapper.timed = True
+    return wrapper
+
+
+def _timed(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        timings = current()
+        if timings is None:
+            return func(*args, **kwargs)
+        timings.enter(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings.exit()
+    wrapper.timed = True
+    return wrapper
+
+
+def _execute(execute, sql, params, many, context):
+    timings = current()
+    if timings is None:
+        return execute(sql, params, many, context)
+    timings.enter(DB)
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.exit()
+
+
+def _wrap_connection(sender, connection, **kwargs):
+    # Сигнал приходит при каждом переподключении того же DatabaseWrapper.
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+def instrument_cache(backend):
+    """Оборачивает методы класса кэша; повторный вызов ничего не делает."""
+    for method in _CACHE_METHODS:
+        func = getattr(backend, method)
+        if not getattr(func, 'timed', False):
+            setattr(backend, method, _timed_cache_method(method, func))
+
+
+def install():
+    """Ставит обёртки на соединения с базой, кэши и шаблоны Django."""
+    connection_created.connect(
+        _wrap_connection, dispatch_uid='core.timing')
+    for params in settings.CACHES.values():
+        instrument_cache(import_string(params['BACKEND']))
+    # Вложенные {% include %} рендерятся через django.template.base,
+    # поэтому засекается только шаблон верхнего уровня.
+    if not getattr(Template.render, 'timed', False):
+        Template.render = _timed(TEMPLATE, Template.render)
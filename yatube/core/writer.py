@@ -0,0 +1,107 @@
+"""Очередь записей в базу через один поток-писатель.
+
+SQLite пускает в базу одного писателя, и потоки воркера, пишущие
+одновременно, ждут блокировку по busy_timeout. С WRITE_QUEUE вьюхи
+передают короткие записи (run) потоку-писателю процесса. Он забирает
+всё, что накопилось в очереди (до WRITE_QUEUE_BATCH задач), и выполняет
+одной транзакцией - групповой коммит с одним fsync на пачку. Каждая
+задача идёт в своей точке сохранения: ошибка откатывает только её
+и возвращается вызвавшему. Между процессами записи по-прежнему
+разводит busy_timeout (core.sqlite).
+"""
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import replicas
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+_writer_thread = threading.local()
+
+
+def _jobs():
+    """Очередь текущего процесса; поток-писатель стартует с ней."""
+    global _queue, _queue_pid
+    with _queue_lock:
+        if _queue is None or _queue_pid != os.getpid():
+            _queue = queue.SimpleQueue()
+            _queue_pid = os.getpid()
+            threading.Thread(
+                target=_loop, args=(_queue,), name='db-writer',
+                daemon=True).start()
+        return _queue
+
+
+def _loop(jobs):
+    _writer_thread.active = True
+    while True:
+        batch = [jobs.get()]
+        while len(batch) < settings.WRITE_QUEUE_BATCH:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        _commit(batch)
+
+
+def _commit(batch):
+    # Задачи, которые вызвавший отменил по таймауту, не выполняются.
+    batch = [job for job in batch if job[0].set_running_or_notify_cancel()]
+    if not batch:
+        return
+    outcomes = []
+    try:
+        with transaction.atomic():
+            for future, function, args, kwargs in batch:
+                try:
+                    with transaction.atomic():
+                        result = function(*args, **kwargs)
+                except Exception as error:
+                    outcomes.append((future, None, error))
+                else:
+                    outcomes.append((future, result, None))
+    except Exception as error:
+        # Не удался сам коммит: пачка откатилась целиком.
+        connection.close()
+        for future, *_ in batch:
+            future.set_exception(error)
+        return
+    for future, result, error in outcomes:
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+
+def run(function, *args, **kwargs):
+    """Выполняет function(*args, **kwargs) в транзакции и возвращает
+    результат; с WRITE_QUEUE - в потоке-писателе.
+
+    Внутри уже открытой транзакции function выполняется на месте:
+    в другом потоке она оказалась бы вне этой транзакции.
+    """
+    if (
+        not settings.WRITE_QUEUE or connection.in_atomic_block
+        or getattr(_writer_thread, 'active', False)
+    ):
+        with transaction.atomic():
+            return function(*args, **kwargs)
+    # Запись идёт в другом потоке - роутер запроса о ней не узнает.
+    replicas.wrote()
+    future = Future()
+    _jobs().put((future, function, args, kwargs))
+    try:
+        return future.result(timeout=settings.WRITE_QUEUE_TIMEOUT)
+    except TimeoutError:
+        # Запись, которую вьюха не дождалась, не должна выполниться
+        # позже: повтор запроса её бы задублировал. Уже начатую
+        # дожидаемся.
+        if future.cancel():
+            raise
+        return future.result()
@@ -4,6 +4,13 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     name = 'posts'
 
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import shards, signals  # noqa: F401
+        connection_created.connect(
+            shards.configure, dispatch_uid='posts.shards')
+
 
 class GroupsConfig(AppConfig):
     name = 'group'
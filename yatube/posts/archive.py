@@ -0,0 +1,157 @@
+"""Архив старых постов.
+
+Посты старше ARCHIVE_AFTER_DAYS дней вместе с комментариями команда
+archive_posts переносит в таблицы ArchivedPost и ArchivedComment той же
+базы (при шардировании - того же шарда) с теми же id. Горячая таблица
+posts_post остаётся маленькой: главная и ленты подписок читают только её.
+
+Все архивные посты старше всех горячих, поэтому профиль и группа
+листают архив сразу после горячих постов (Chain), а страница поста
+ищет в архиве то, чего нет среди горячих. Архив только для чтения;
+поиск и JSON API его не видят.
+"""
+from django.db import connections, transaction
+from django.db.models import QuerySet
+from django.http import Http404
+
+from . import search, shards
+from .models import (ArchivedComment, ArchivedPost, Comment, FeedEntry, Post,
+                     PostImageVariant)
+from .utils import lookup
+
+
+class Chain:
+    """Горячие посты, за ними архивные, для KeysetPaginator.
+
+    Поддерживает то же, что MergedQuerySet. Срез берёт строки из первой
+    по порядку выборки и добирает недостающие из второй; COUNT первой
+    нужен, только если срез целиком за её концом.
+    """
+    ordered = True
+
+    def __init__(self, hot, archived, descending=True):
+        self.hot = hot
+        self.archived = archived
+        self.descending = descending
+        self.model = hot.model
+
+    def order_by(self, *fields):
+        return Chain(
+            self.hot.order_by(*fields), self.archived.order_by(*fields),
+            fields[0].startswith('-'))
+
+    def filter(self, *args, **kwargs):
+        return Chain(
+            self.hot.filter(*args, **kwargs),
+            self.archived.filter(*args, **kwargs),
+            self.descending)
+
+    def count(self):
+        if not isinstance(self.hot, QuerySet) or (
+            self.hot.db != self.archived.db
+        ):
+            return self.hot.count() + self.archived.count()
+        using = self.hot.db
+        # Оба COUNT одним запросом. Не COUNT по UNION ALL: его подзапрос
+        # SQLite перебирает целиком.
+        parts = [
+            queryset.order_by().values('pk').query.get_compiler(
+                using).as_sql()
+            for queryset in (self.hot, self.archived)
+        ]
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                'SELECT ' + ' + '.join(
+                    f'(SELECT COUNT(*) FROM ({sql}))' for sql, _ in parts),
+                [param for _, params in parts for param in params])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start, stop = item.start or 0, item.stop
+        first, second = self.hot, self.archived
+        if not self.descending:
+            first, second = second, first
+        rows = list(first[start:stop])
+        if len(rows) < stop - start:
+            offset = 0
+            if not rows and start:
+                offset = max(start - first.count(), 0)
+            rows += second[offset:offset + stop - start - len(rows)]
+        return rows
+
+    def __iter__(self):
+        return iter(self[0:self.count()])
+
+
+def posts(**filters):
+    """shards.posts, продолженные архивом."""
+    return Chain(
+        shards.posts(**filters), shards.posts(ArchivedPost, **filters))
+
+
+def post(request, post_id):
+    """Пост (как utils.lookup): горячий или, если его нет, архивный."""
+    try:
+        return lookup(request, shards.post(post_id), pk=post_id)
+    except Http404:
+        return lookup(
+            request, shards.post(post_id, ArchivedPost), pk=post_id)
+
+
+def _copy(cursor, source, target, where, ids):
+    """INSERT ... SELECT строк source в таблицу target с теми же
+    столбцами.
+    """
+    quote = cursor.db.ops.quote_name
+    columns = ', '.join(
+        quote(field.column) for field in target._meta.concrete_fields)
+    cursor.execute(
+        f'INSERT INTO {quote(target._meta.db_table)} ({columns}) '
+        f'SELECT {columns} FROM {quote(source._meta.db_table)} '
+        f'WHERE {quote(where)} IN ({", ".join(["%s"] * len(ids))})',
+        ids,
+    )
+    return cursor.rowcount
+
+
+def move(using, post_ids):
+    """Переносит посты post_ids базы using с комментариями в архив.
+
+    Первый же запрос транзакции пишущий, поэтому копия не разойдётся
+    с параллельными записями. Варианты картинок удаляются: архивные
+    посты показывают миниатюру исходной картинки. Возвращает
+    (постов, комментариев).
+    """
+    # Ленты и поиск - в default. При шардировании это другая база: если
+    # после коммита шарда не закоммитится default, в лентах останутся
+    # записи архивных постов, а лента подписок такие пропускает.
+    variants = PostImageVariant.objects.using(using).filter(
+        post_id__in=post_ids)
+    with transaction.atomic():
+        FeedEntry.objects.filter(post_id__in=post_ids).delete()
+        search.remove_many(post_ids)
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                posts = _copy(cursor, Post, ArchivedPost, 'id', post_ids)
+                comments = _copy(
+                    cursor, Comment, ArchivedComment, 'post_id', post_ids)
+            # Файлы вариантов удаляются после коммита, как в
+            # thumbnails.generate.
+            files = list(variants.values_list('image', flat=True))
+            for model, field in (
+                (PostImageVariant, 'post_id'),
+                (Comment, 'post_id'),
+                (Post, 'pk'),
+            ):
+                queryset = model.objects.using(using).filter(
+                    **{f'{field}__in': post_ids})
+                queryset._raw_delete(using)
+    storage = PostImageVariant._meta.get_field('image').storage
+    for name in files:
+        storage.delete(name)
+    return posts, comments
@@ -0,0 +1,180 @@
+"""Счётчики поколений для кэша фрагментов и условных GET.
+
+Ключ фрагмента включает номер поколения области (вся лента, группа,
+автор, пост). Любое изменение поста или комментария сдвигает поколения
+затронутых областей, и следующий запрос уже не попадает в старые
+ключи: инвалидация стоит O(1), а старые фрагменты просто вытесняются.
+
+Из тех же поколений без рендеринга строятся ETag страниц, а время
+последнего сдвига области служит для Last-Modified.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.views.decorators.http import condition
+
+from core import replicas
+
+GLOBAL = 'all'
+# Имена пользователей и группы, которые видны в карточках на всех страницах.
+PROFILES = 'profiles'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def follow_scope(user_id):
+    """Подписки и подписчики пользователя: счётчики профиля и лента."""
+    return f'follow:{user_id}'
+
+
+def _key(scope):
+    return f'generation:{scope}'
+
+
+def _modified_key(scope):
+    return f'modified:{scope}'
+
+
+def _initial():
+    # Поколение, созданное заново после вытеснения, не должно совпасть
+    # с прежним, поэтому отсчёт начинается с текущего времени в мс.
+    return int(time.time() * 1000)
+
+
+def generations(scopes):
+    """Словарь scope -> поколение одним обращением к кэшу."""
+    keys = {_key(scope): scope for scope in scopes}
+    values = cache.get_many(keys)
+    for key in keys.keys() - values.keys():
+        cache.add(key, _initial(), timeout=None)
+        values[key] = cache.get(key)
+    return {scope: values[key] for key, scope in keys.items()}
+
+
+def bump(*scopes):
+    for scope in scopes:
+        try:
+            cache.incr(_key(scope))
+        except ValueError:
+            cache.add(_key(scope), _initial(), timeout=None)
+    now = time.time()
+    cache.set_many(
+        {_modified_key(scope): now for scope in scopes}, timeout=None)
+
+
+def bump_on_commit(using, *scopes):
+    """Сдвигает поколения после коммита записи в базу using.
+
+    Сдвиг до коммита виден параллельному запросу раньше самих данных:
+    он закэширует старые карточки и ETag под новым поколением. Ленты и
+    счётчики пишутся в default, поэтому запись в шард ждёт и её коммита.
+    """
+    def on_default_commit():
+        transaction.on_commit(lambda: bump(*scopes))
+
+    if using == DEFAULT_DB_ALIAS:
+        transaction.on_commit(lambda: bump(*scopes))
+    else:
+        transaction.on_commit(on_default_commit, using=using)
+
+
+def post_scopes(post):
+    return (
+        post_scope(post.pk),
+        author_scope(post.author_id),
+        group_scope(post.group_id),
+    )
+
+
+def annotate_versions(posts, scope=None):
+    """Проставляет каждому посту cache_version для карточки.
+
+    Если передан scope, возвращает версию всего списка: она меняется
+    и при изменении области, и при изменении любой карточки в нём.
+    """
+    posts = list(posts)
+    scopes = {scope_ for post in posts for scope_ in post_scopes(post)}
+    if scope is not None:
+        scopes.add(scope)
+    values = generations(scopes)
+    for post in posts:
+        post.cache_version = '.'.join(
+            str(values[scope_]) for scope_ in post_scopes(post))
+    if scope is None:
+        return None
+    parts = [str(values[scope])] + [post.cache_version for post in posts]
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def _modified(scopes):
+    """Время последнего изменения областей scopes."""
+    keys = [_modified_key(scope) for scope in scopes]
+    modified = cache.get_many(keys)
+    for key in set(keys) - modified.keys():
+        # Время изменения вытеснено из кэша - считаем, что только что.
+        cache.add(key, time.time(), timeout=None)
+        modified[key] = cache.get(key)
+    return max(modified.values())
+
+
+def _validators(request, scopes):
+    """ETag и Last-Modified страницы из поколений областей scopes.
+
+    ETag зависит ещё и от пути с параметрами и от пользователя: шапка,
+    переключатель лент и форма комментария у каждого свои, а в форме
+    есть CSRF-токен, который меняется при входе. Last-Modified отдаётся
+    только гостям - для них страница зависит лишь от областей.
+    """
+    scopes = sorted(scopes)
+    values = generations(scopes)
+    modified = _modified(scopes)
+    # Реплика старше изменений областей заполнила бы фрагменты их
+    # новых поколений старыми данными.
+    if replicas.require(modified):
+        # Объекты, прочитанные scopes_for с реплики (utils.lookup),
+        # вьюха перечитает с default.
+        request.__dict__.pop('_lookups', None)
+    parts = [request.get_full_path()]
+    parts += [f'{scope}={values[scope]}' for scope in scopes]
+    last_modified = None
+    if request.user.is_authenticated:
+        parts.append(f'user={request.user.pk}')
+        parts.append(request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+    else:
+        last_modified = datetime.fromtimestamp(modified, timezone.utc)
+    etag = hashlib.md5('|'.join(parts).encode()).hexdigest()
+    return etag, last_modified
+
+
+def conditional(scopes_for):
+    """Декоратор вьюхи: ответ 304 на If-None-Match / If-Modified-Since.
+
+    scopes_for(request, *args, **kwargs) возвращает области, от которых
+    зависит страница; он вызывается до вьюхи, поэтому на 304 не тратится
+    ни рендеринг, ни запросы самой вьюхи.
+    """
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, '_validators'):
+            request._validators = _validators(
+                request, scopes_for(request, *args, **kwargs))
+        return request._validators
+
+    return condition(
+        etag_func=lambda *args, **kwargs: validators(*args, **kwargs)[0],
+        last_modified_func=(
+            lambda *args, **kwargs: validators(*args, **kwargs)[1]),
+    )
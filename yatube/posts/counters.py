@@ -0,0 +1,221 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются одним атомарным UPDATE ... SET n = n + delta из
+обработчиков сигналов, поэтому страницам не нужен COUNT(*). Если значения
+разошлись с данными (bulk_create, ручные правки в базе), их чинит
+reconcile() - команда reconcile_counters.
+
+Счётчики и оценки заменяют и COUNT(*) пагинатора на больших выборках
+(estimate, posts_total): номер последней страницы там не обязан быть
+точным.
+"""
+from functools import reduce
+from operator import add
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core import jobs, sqlite
+
+from . import shards
+from .models import (ArchivedPost, Comment, Follow, Group, Post, User,
+                     UserStats)
+
+# Счётчик -> модели, строки которых он считает, и их внешние ключи.
+# Архивные посты (posts.archive) по-прежнему видны в профиле и группе.
+USER_COUNTERS = {
+    'posts_count': ((Post, 'author'), (ArchivedPost, 'author')),
+    'followers_count': ((Follow, 'author'),),
+    'following_count': ((Follow, 'user'),),
+}
+GROUP_COUNTERS = {'posts_count': ((Post, 'group'), (ArchivedPost, 'group'))}
+POST_COUNTERS = {'comments_count': ((Comment, 'post'),)}
+
+# Последний точный подсчёт горячих постов и отметка, что он свежий.
+POSTS_TOTAL_KEY = 'counters:posts_total'
+POSTS_TOTAL_FRESH_KEY = 'counters:posts_total:fresh'
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_user(user_id, field, delta):
+    """Сдвигает счётчик пользователя; недостающую строку пересчитывает."""
+    updated = _change(UserStats.objects.filter(user_id=user_id), field, delta)
+    if not updated and delta > 0:
+        recount_user(user_id)
+
+
+def change_group(group_id, delta):
+    if group_id is not None:
+        _change(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def change_post(post_id, delta):
+    if post_id is not None:
+        _change(
+            Post.objects.using(shards.for_post(post_id)).filter(pk=post_id),
+            'comments_count', delta)
+
+
+def get_stats(user):
+    """Счётчики пользователя, даже если строка ещё не создана."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return recount_user(user.pk)
+
+
+def estimate(count):
+    """Готовое число строк для пагинатора, если их не меньше
+    COUNT_ESTIMATE_MIN, иначе None - точный COUNT(*) дешевле неточности.
+    """
+    if count is not None and count >= settings.COUNT_ESTIMATE_MIN:
+        return count
+    return None
+
+
+def refresh_posts_total():
+    """Точное число горячих постов во всех шардах; запоминается в кэше."""
+    total = shards.posts().count()
+    cache.set(POSTS_TOTAL_KEY, total, timeout=None)
+    cache.set(POSTS_TOTAL_FRESH_KEY, True, settings.COUNT_ESTIMATE_TTL)
+    return total
+
+
+def posts_total():
+    """Число горячих постов для пагинатора главной или None.
+
+    Берётся последний точный подсчёт из кэша, а до первого - статистика
+    ANALYZE. Раз в COUNT_ESTIMATE_TTL секунд подсчёт обновляется фоновой
+    задачей (без JOBS_QUEUE - сразу).
+    """
+    total = cache.get(POSTS_TOTAL_KEY)
+    if total is None:
+        analyzed = [
+            sqlite.analyzed_rows(connections[using], Post._meta.db_table)
+            for using in settings.SHARDS or [DEFAULT_DB_ALIAS]
+        ]
+        if None in analyzed or estimate(sum(analyzed)) is None:
+            # Подсчёт заменяет COUNT пагинатора.
+            return refresh_posts_total()
+        total = sum(analyzed)
+        cache.set(POSTS_TOTAL_KEY, total, timeout=None)
+    if cache.add(POSTS_TOTAL_FRESH_KEY, True, settings.COUNT_ESTIMATE_TTL):
+        refreshed = jobs.enqueue(refresh_posts_total, key=POSTS_TOTAL_KEY)
+        if refreshed is not None:
+            return refreshed
+    return estimate(total)
+
+
+def _count(model, fk):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')}).order_by()
+            .values(fk).annotate(n=Count('pk')).values('n'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def _actual(counters):
+    """Подзапросы с фактическими значениями счётчиков."""
+    return {
+        f'actual_{field}': reduce(
+            add, (_count(model, fk) for model, fk in sources))
+        for field, sources in counters.items()
+    }
+
+
+def recount_user(user_id):
+    actual = User.objects.filter(pk=user_id).annotate(
+        **_actual(USER_COUNTERS)).values(*(
+            f'actual_{field}' for field in USER_COUNTERS)).first() or {}
+    if settings.SHARDS:
+        # Посты автора лежат на его шарде, а не в default.
+        actual['actual_posts_count'] = sum(
+            model.objects.using(shards.for_author(user_id)).filter(
+                author_id=user_id).count()
+            for model in shards.POST_MODELS)
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            field: actual.get(f'actual_{field}', 0)
+            for field in USER_COUNTERS
+        },
+    )
+    return stats
+
+
+def _chunks(queryset, chunk_size):
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[
+            :chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def _reconcile_model(model, counters, chunk_size):
+    repaired = 0
+    queryset = model.objects.annotate(**_actual(counters))
+    for chunk in _chunks(queryset, chunk_size):
+        drifted = []
+        for obj in chunk:
+            stale = False
+            for field in counters:
+                actual = getattr(obj, f'actual_{field}')
+                if getattr(obj, field) != actual:
+                    setattr(obj, field, actual)
+                    stale = True
+            if stale:
+                drifted.append(obj)
+        if drifted:
+            model.objects.bulk_update(drifted, list(counters))
+        repaired += len(drifted)
+    return repaired
+
+
+def _reconcile_users(chunk_size):
+    repaired = 0
+    queryset = User.objects.select_related('stats').annotate(
+        **_actual(USER_COUNTERS))
+    for chunk in _chunks(queryset, chunk_size):
+        for user in chunk:
+            actual = {
+                field: getattr(user, f'actual_{field}')
+                for field in USER_COUNTERS
+            }
+            try:
+                current = {
+                    field: getattr(user.stats, field)
+                    for field in USER_COUNTERS
+                }
+            except UserStats.DoesNotExist:
+                current = None
+            if current != actual:
+                UserStats.objects.update_or_create(
+                    user_id=user.pk, defaults=actual)
+                repaired += 1
+    return repaired
+
+
+def reconcile(chunk_size=1000):
+    """Пересчитывает все счётчики порциями по chunk_size строк.
+
+    Возвращает число исправленных строк для каждой модели.
+    """
+    return {
+        'users': _reconcile_users(chunk_size),
+        'groups': _reconcile_model(Group, GROUP_COUNTERS, chunk_size),
+        'posts': _reconcile_model(Post, POST_COUNTERS, chunk_size),
+    }
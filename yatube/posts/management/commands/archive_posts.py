@@ -0,0 +1,64 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from posts import archive, caching
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты старше ARCHIVE_AFTER_DAYS дней с комментариями '
+        'в архивные таблицы. Каждая порция - отдельная короткая '
+        'транзакция, между порциями пишут остальные; прерванный перенос '
+        'можно просто запустить снова.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+            help='Возраст постов для архива в днях.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Постов в одной транзакции (не больше 10000).')
+        parser.add_argument(
+            '--pause', type=float, default=0.05,
+            help='Секунд между порциями.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать посты для архива.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if not 0 < chunk_size <= 10000:
+            # Иначе не хватит параметров запроса SQLite.
+            raise CommandError('--chunk-size должен быть от 1 до 10000.')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        started = time.perf_counter()
+        moved = {'posts': 0, 'comments': 0}
+        for using in settings.SHARDS or [DEFAULT_DB_ALIAS]:
+            old = Post.objects.using(using).filter(
+                pub_date__lt=cutoff).order_by('pub_date', 'pk')
+            if options['dry_run']:
+                self.stdout.write(f'{using}: в архив постов {old.count()}')
+                continue
+            while True:
+                # Выбор порции - чтение вне транзакции переноса.
+                post_ids = list(
+                    old.values_list('pk', flat=True)[:chunk_size])
+                if not post_ids:
+                    break
+                posts, comments = archive.move(using, post_ids)
+                moved['posts'] += posts
+                moved['comments'] += comments
+                time.sleep(options['pause'])
+        if moved['posts']:
+            # Главная показывает только свежие посты.
+            caching.bump(caching.GLOBAL)
+        self.stdout.write(
+            f'В архиве постов {moved["posts"]}, комментариев '
+            f'{moved["comments"]} за {time.perf_counter() - started:.1f} с')
@@ -0,0 +1,62 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Post, User
+from posts.utils import NEXT, KeysetPaginator, encode_cursor
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержку глубокой страницы для OFFSET-пагинации '
+        'и пагинации по курсору. Данные создаются во временной '
+        'транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--per-page', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=7)
+
+    def handle(self, *args, **options):
+        per_page = options['per_page']
+        number = options['page']
+        if options['posts'] < number * per_page:
+            options['posts'] = number * per_page
+        with transaction.atomic():
+            self.populate(options['posts'])
+            queryset = Post.objects.all()
+            offset = self.measure(options['repeat'], lambda: list(
+                KeysetPaginator(queryset, per_page).page(number)
+            ))
+            anchor = KeysetPaginator(queryset, per_page).object_list[
+                (number - 1) * per_page - 1
+            ]
+            cursor = encode_cursor(NEXT, anchor.pub_date, anchor.pk)
+            keyset = self.measure(options['repeat'], lambda: list(
+                KeysetPaginator(queryset, per_page).get_cursor_page(cursor)
+            ))
+            transaction.set_rollback(True)
+        self.stdout.write(
+            f'Страница {number} из {options["posts"]} постов '
+            f'(медиана из {options["repeat"]}):'
+        )
+        self.stdout.write(f'  OFFSET/LIMIT + COUNT: {offset:8.2f} мс')
+        self.stdout.write(f'  курсор (pub_date, id): {keyset:8.2f} мс')
+
+    def populate(self, count):
+        author = User.objects.create(username='bench_pagination')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=author) for i in range(count)
+        )
+
+    def measure(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,123 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.backends.django import DjangoTemplates
+from django.test.utils import override_settings
+
+from posts import caching, thumbnails
+from posts.models import Group, Post, User
+from posts.utils import prepare_cards
+
+# Карточка главной до posts/includes/post_card.html: ссылки, имя автора
+# и дата вычислялись в шаблоне для каждой карточки.
+TEMPLATE_CARD = '''{% load post_images cache %}{% for post in posts %}
+{% cache fragment_cache_timeout index_card post.pk post.cache_version %}
+<ul>
+  <li>Автор: {{ post.author.get_full_name }}</li>
+  <li>Дата публикации: {{ post.pub_date|date:"d E Y" }}</li>
+</ul>
+{% post_picture post %}
+<p>{{ post.text }}</p>
+{% if post.group %}
+  <a href="{% url 'posts:group_list' post.group.slug %}">все записи группы</a>
+{% endif %}
+<a href="{% url 'posts:post_detail' post.pk %}">подробная информация</a>
+{% endcache %}
+{% endfor %}'''
+INCLUDED_CARD = '''{% for post in posts %}
+{% include 'posts/includes/post_card.html' %}
+{% endfor %}'''
+
+FILESYSTEM = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+CACHED = [('django.template.loaders.cached.Loader', FILESYSTEM)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет стоимость рендеринга одной карточки поста в ленте: '
+        'прежней разметки прямо в шаблоне и общего post_card.html с '
+        'подготовленными prepare_cards полями, с кэширующим загрузчиком '
+        'шаблонов (Django включает его сам при DEBUG=False) и без него, '
+        'как при DEBUG. Кэш фрагментов отключён, данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        cards = options['cards']
+        dummy = {'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with transaction.atomic(), override_settings(CACHES=dummy):
+            posts = self.populate(cards)
+            results = []
+            for loaders_name, loaders in (
+                ('без кэша шаблонов', FILESYSTEM),
+                ('кэширующий загрузчик', CACHED),
+            ):
+                engine = self.engine(loaders)
+                results.append((
+                    f'в шаблоне, {loaders_name}',
+                    self.measure(options['repeat'], engine, TEMPLATE_CARD,
+                                 posts, prepare=False)))
+                results.append((
+                    f'post_card.html, {loaders_name}',
+                    self.measure(options['repeat'], engine, INCLUDED_CARD,
+                                 posts, prepare=True)))
+            transaction.set_rollback(True)
+        self.stdout.write(
+            f'Рендеринг ленты из {cards} карточек, на карточку '
+            f'(медиана из {options["repeat"]}):')
+        for name, per_card in results:
+            self.stdout.write(f'  {name:40} {per_card:8.1f} мкс')
+
+    def populate(self, count):
+        author = User.objects.create(
+            username='bench_render', first_name='Лев', last_name='Толстой')
+        group = Group.objects.create(
+            title='Бенчмарк', slug='bench-render', description='')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}\nвторая строка', author=author, group=group)
+            for i in range(count)
+        )
+        posts = list(
+            Post.objects.filter(author=author).select_related(
+                'author', 'group'))
+        thumbnails.attach_variants(posts)
+        caching.annotate_versions(posts)
+        return posts
+
+    def engine(self, loaders):
+        params = dict(settings.TEMPLATES[0])
+        del params['BACKEND']
+        params['APP_DIRS'] = False
+        params['OPTIONS'] = dict(params['OPTIONS'], loaders=loaders)
+        params['NAME'] = 'bench_render'
+        return DjangoTemplates(params)
+
+    def measure(self, repeat, engine, source, posts, prepare):
+        context = {
+            'posts': posts,
+            'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        }
+        # Лента компилируется один раз, а шаблоны, которые она подключает,
+        # при каждом рендеринге берутся у загрузчика.
+        template = engine.from_string(source)
+        # Прогрев: первый рендеринг заполняет кэш загрузчика.
+        template.render(context)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            if prepare:
+                prepare_cards(posts)
+            template.render(context)
+            timings.append(
+                (time.perf_counter() - started) * 1e6 / len(posts))
+        return statistics.median(timings)
@@ -0,0 +1,206 @@
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts import urls
+from posts.models import Group, Post, User, UserStats
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу."""
+    values = sorted(values)
+    rank = max(0, -(-len(values) * percent // 100) - 1)
+    return values[int(rank)]
+
+
+def record_queries(queries):
+    def wrapper(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+            check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет p50/p95 задержки, число запросов и пик памяти для каждого '
+        'URL из posts/urls.py и сохраняет результат в JSON для сравнения '
+        'между коммитами. Изменения в базе откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом.')
+        parser.add_argument(
+            '--output', default=os.path.join(settings.BASE_DIR, 'benchmarks'),
+            help='Каталог для файлов с результатами.')
+        parser.add_argument(
+            '--compare', default='latest',
+            help='Файл результатов для сравнения, latest - последний '
+                 'в --output, none - без сравнения.')
+
+    def handle(self, *args, **options):
+        baseline = self.baseline(options)
+        # Без DEBUG: журнал SQL-запросов искажал бы время и память.
+        with override_settings(DEBUG=False), transaction.atomic():
+            cases = self.cases()
+            results = {
+                name: self.measure(client, url, options)
+                for name, client, url in cases
+            }
+            dataset = {
+                'users': User.objects.count(),
+                'groups': Group.objects.count(),
+                'posts': Post.objects.count(),
+            }
+            transaction.set_rollback(True)
+        commit, dirty = git_commit()
+        report = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'dirty': dirty,
+            'database': connection.vendor,
+            'dataset': dataset,
+            'options': {
+                key: options[key] for key in ('repeat', 'warmup', 'cold')},
+            'results': results,
+        }
+        path = self.save(report, options['output'])
+        self.print_report(results, baseline)
+        self.stdout.write(f'Результаты сохранены в {path}')
+
+    def cases(self):
+        """Для каждого URL - клиент и адрес на самых тяжёлых объектах."""
+        group = Group.objects.order_by('-posts_count').first()
+        post = Post.objects.order_by('-comments_count').first()
+        author = UserStats.objects.select_related('user').order_by(
+            '-followers_count').first()
+        reader = UserStats.objects.select_related('user').order_by(
+            '-following_count').first()
+        if not (group and post and author and reader):
+            raise CommandError(
+                'Нужны группы, посты и подписки - '
+                'заполните базу командой generate_dataset.')
+        values = {
+            'slug': group.slug,
+            'post_id': post.pk,
+            'username': author.user.username,
+        }
+        query = {
+            'search': '?q=' + post.text.split()[0].strip('.,!?'),
+        }
+        guest = Client()
+        member = Client()
+        member.force_login(reader.user)
+        cases = []
+        for pattern in urls.urlpatterns:
+            name = pattern.name
+            url = reverse(f'{urls.app_name}:{name}', kwargs={
+                key: values[key] for key in pattern.pattern.converters
+            }) + query.get(name, '')
+            if guest.get(url).status_code == 200:
+                cases.append((f'{name} (гость)', guest, url))
+            cases.append((name, member, url))
+        return cases
+
+    def measure(self, client, url, options):
+        for _ in range(options['warmup']):
+            client.get(url)
+        timings = []
+        for _ in range(options['repeat']):
+            if options['cold']:
+                cache.clear()
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+        if options['cold']:
+            cache.clear()
+        queries = []
+        with connection.execute_wrapper(record_queries(queries)):
+            client.get(url)
+        if options['cold']:
+            cache.clear()
+        tracemalloc.start()
+        client.get(url)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {
+            'url': url,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'queries': len(queries),
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    def baseline(self, options):
+        if options['compare'] == 'none':
+            return None
+        path = options['compare']
+        if path == 'latest':
+            if not os.path.isdir(options['output']):
+                return None
+            files = sorted(
+                name for name in os.listdir(options['output'])
+                if name.endswith('.json'))
+            if not files:
+                return None
+            path = os.path.join(options['output'], files[-1])
+        with open(path, encoding='utf-8') as file:
+            report = json.load(file)
+        self.stdout.write(
+            f'Сравнение с {path} (коммит {report.get("commit")})')
+        return report['results']
+
+    def save(self, report, directory):
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        commit = (report['commit'] or 'nogit')[:10]
+        path = os.path.join(directory, f'{stamp}-{commit}.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        return path
+
+    def print_report(self, results, baseline):
+        self.stdout.write(
+            f'{"URL":32} {"p50, мс":>9} {"p95, мс":>9} '
+            f'{"запросы":>8} {"пик, КиБ":>9}')
+        for name, result in results.items():
+            line = (
+                f'{name:32} {result["p50_ms"]:9.2f} {result["p95_ms"]:9.2f} '
+                f'{result["queries"]:8} {result["peak_kib"]:9.0f}'
+            )
+            before = (baseline or {}).get(name)
+            if before:
+                change = (result['p50_ms'] / before['p50_ms'] - 1) * 100
+                line += f'  p50 {change:+.0f}%'
+                if result['queries'] != before['queries']:
+                    line += f', запросов было {before["queries"]}'
+            self.stdout.write(line)
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+
+from core import writer
+from posts.models import Comment, Post, User
+
+from .bench_views import percentile
+
+SCRATCH_USERNAME = 'bench-writes'
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает базу записями комментариев из --writers потоков '
+        'напрямую и через очередь записей (core.writer) и сравнивает '
+        'коммитов в секунду и задержки. Созданные строки удаляются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=50)
+        parser.add_argument(
+            '--writes', type=int, default=40,
+            help='Записей на поток.')
+
+    def handle(self, *args, **options):
+        User.objects.filter(username=SCRATCH_USERNAME).delete()
+        author = User.objects.create(username=SCRATCH_USERNAME)
+        post = Post.objects.create(author=author, text='Нагрузочный пост')
+        self.stdout.write(
+            f'{"Режим":10} {"записей/с":>10} {"p50, мс":>9} '
+            f'{"p95, мс":>9} {"p99, мс":>9} {"ошибок":>7}')
+        try:
+            for name, enabled in (('напрямую', False), ('очередь', True)):
+                with override_settings(WRITE_QUEUE=enabled):
+                    self.report(name, *self.run(author, post, options))
+        finally:
+            # Посты и комментарии удаляются каскадом, счётчики - сигналами.
+            author.delete()
+
+    def run(self, author, post, options):
+        latencies, errors = [], []
+        start = threading.Barrier(options['writers'] + 1)
+
+        def write(number):
+            start.wait()
+            for i in range(options['writes']):
+                comment = Comment(
+                    post=post, author=author, text=f'Ответ {number}.{i}')
+                started = time.perf_counter()
+                try:
+                    writer.run(comment.save)
+                except OperationalError as error:
+                    errors.append(error)
+                    continue
+                latencies.append(time.perf_counter() - started)
+            connection.close()
+
+        threads = [
+            threading.Thread(target=write, args=(number,))
+            for number in range(options['writers'])
+        ]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return latencies, errors, time.perf_counter() - started
+
+    def report(self, name, latencies, errors, elapsed):
+        milliseconds = [latency * 1000 for latency in latencies] or [0]
+        self.stdout.write(
+            f'{name:10} {len(latencies) / elapsed:10.0f} '
+            f'{percentile(milliseconds, 50):9.2f} '
+            f'{percentile(milliseconds, 95):9.2f} '
+            f'{percentile(milliseconds, 99):9.2f} {len(errors):7}')
@@ -0,0 +1,108 @@
+import json
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+
+from posts import shards
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает пользователей, группы, посты, комментарии и подписки '
+        'в JSONL для import_content. Строки читаются iterator() порциями, '
+        'поэтому память не зависит от размера базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Файл JSONL, - для stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        shards.check_single_database()
+        self.chunk_size = options['chunk_size']
+        self.counts = dict.fromkeys(
+            ('user', 'group', 'post', 'comment', 'follow'), 0)
+        # Отчёт о скорости не должен смешиваться с выгрузкой в stdout.
+        self.report = self.stderr if options['output'] == '-' else self.stdout
+        started = time.perf_counter()
+        if options['output'] == '-':
+            target = nullcontext(sys.stdout)
+        else:
+            target = open(options['output'], 'w', encoding='utf-8')
+        with target as output:
+            for record in self.records():
+                output.write(json.dumps(record, ensure_ascii=False))
+                output.write('\n')
+        elapsed = time.perf_counter() - started
+        total = sum(self.counts.values())
+        for kind, count in self.counts.items():
+            self.report.write(f'{kind}: {count}')
+        self.report.write(
+            f'Всего {total} строк за {elapsed:.1f} с, '
+            f'{total / max(elapsed, 1e-9):.0f} строк/с')
+
+    def rows(self, queryset, *fields):
+        return queryset.values_list(*fields).iterator(
+            chunk_size=self.chunk_size)
+
+    def records(self):
+        """Строки выгрузки; ссылки на пользователей и группы - по
+        username и slug, комментарии идут сразу за своим постом.
+        """
+        for username, first_name, last_name, email, joined in self.rows(
+            User.objects.order_by('pk'), 'username', 'first_name',
+            'last_name', 'email', 'date_joined',
+        ):
+            self.counts['user'] += 1
+            yield {
+                'type': 'user', 'username': username,
+                'first_name': first_name, 'last_name': last_name,
+                'email': email, 'date_joined': joined.isoformat(),
+            }
+        for slug, title, description in self.rows(
+            Group.objects.order_by('pk'), 'slug', 'title', 'description',
+        ):
+            self.counts['group'] += 1
+            yield {
+                'type': 'group', 'slug': slug, 'title': title,
+                'description': description,
+            }
+        yield from self.posts_with_comments()
+        for user, author in self.rows(
+            Follow.objects.order_by('pk'),
+            'user__username', 'author__username',
+        ):
+            self.counts['follow'] += 1
+            yield {'type': 'follow', 'user': user, 'author': author}
+
+    def posts_with_comments(self):
+        # Посты и комментарии читаются двумя потоками, упорядоченными
+        # по id поста, и сливаются, как в merge join; комментарии идут
+        # по индексу (post, created).
+        comments = self.rows(
+            Comment.objects.order_by('post_id', 'created', 'pk'),
+            'post_id', 'author__username', 'text', 'created',
+        )
+        comment = next(comments, None)
+        for pk, author, group, text, pub_date, image in self.rows(
+            Post.objects.order_by('pk'), 'pk', 'author__username',
+            'group__slug', 'text', 'pub_date', 'image',
+        ):
+            self.counts['post'] += 1
+            yield {
+                'type': 'post', 'id': pk, 'author': author, 'group': group,
+                'text': text, 'pub_date': pub_date.isoformat(),
+                'image': image or None,
+            }
+            while comment is not None and comment[0] <= pk:
+                post_id, author, text, created = comment
+                if post_id == pk:
+                    self.counts['comment'] += 1
+                    yield {
+                        'type': 'comment', 'post': post_id, 'author': author,
+                        'text': text, 'created': created.isoformat(),
+                    }
+                comment = next(comments, None)
@@ -0,0 +1,206 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from posts import counters, search, shards, timeline
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import explicit_dates
+
+# Тексты и имена берутся из заранее сгенерированных пулов: Faker
+# на каждую из миллионов строк работал бы на порядки дольше вставки.
+POOL_SIZE = 2000
+
+
+def zipf_sampler(rng, population, exponent):
+    """Выборка из population с вероятностями по закону Ципфа.
+
+    Ранги раздаются в случайном порядке, чтобы популярность не зависела
+    от id.
+    """
+    population = list(population)
+    rng.shuffle(population)
+    weights = list(accumulate(
+        1 / rank ** exponent for rank in range(1, len(population) + 1)))
+    return lambda k: rng.choices(population, cum_weights=weights, k=k)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'подписками и комментариями для нагрузочных замеров. Авторы, '
+        'подписки и комментарии распределены по закону Ципфа.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа.')
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределены посты.')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument(
+            '--no-search', action='store_true',
+            help='Не перестраивать полнотекстовый индекс.')
+
+    def handle(self, *args, **options):
+        shards.check_single_database()
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.texts = [
+            self.faker.paragraph(nb_sentences=self.rng.randint(1, 6))
+            for _ in range(POOL_SIZE)
+        ]
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+
+        user_ids = self.phase('Пользователи', self.create_users,
+                              options['users'])
+        group_ids = self.phase('Группы', self.create_groups,
+                               options['groups'])
+        post_ids = self.phase(
+            'Посты', self.create_posts, options['posts'],
+            zipf_sampler(self.rng, user_ids, options['zipf']),
+            zipf_sampler(self.rng, group_ids, options['zipf']),
+        )
+        self.phase(
+            'Подписки', self.create_follows, options['follows'], user_ids,
+            zipf_sampler(self.rng, user_ids, options['zipf']),
+        )
+        self.phase(
+            'Комментарии', self.create_comments, options['comments'],
+            user_ids,
+            zipf_sampler(self.rng, range(len(post_ids)), options['zipf']),
+            post_ids,
+        )
+        self.phase('Счётчики', counters.reconcile, self.chunk_size)
+        self.phase('Ленты подписок', timeline.rebuild_all)
+        if not options['no_search']:
+            self.phase('Поисковый индекс', search.rebuild, self.chunk_size)
+        cache.clear()
+
+    def phase(self, title, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(
+            f'{title}: {time.perf_counter() - started:.1f} с')
+        return result
+
+    def bulk_create(self, model, objects):
+        """Вставляет объекты порциями и возвращает id новых строк."""
+        last_pk = model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        chunk = []
+        for obj in objects:
+            chunk.append(obj)
+            if len(chunk) >= self.chunk_size:
+                self.insert(model, chunk)
+                chunk = []
+        self.insert(model, chunk)
+        return list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', flat=True))
+
+    @staticmethod
+    def insert(model, chunk):
+        with transaction.atomic():
+            model.objects.bulk_create(chunk)
+
+    def create_users(self, count):
+        offset = User.objects.count()
+        first_names = [self.faker.first_name() for _ in range(POOL_SIZE)]
+        last_names = [self.faker.last_name() for _ in range(POOL_SIZE)]
+        password = make_password(None)
+        return self.bulk_create(User, (
+            User(
+                username=f'user{offset + i}',
+                first_name=self.rng.choice(first_names),
+                last_name=self.rng.choice(last_names),
+                password=password,
+            )
+            for i in range(count)
+        ))
+
+    def create_groups(self, count):
+        offset = Group.objects.count()
+        return self.bulk_create(Group, (
+            Group(
+                title=self.faker.catch_phrase()[:200],
+                slug=f'group-{offset + i}',
+                description=self.rng.choice(self.texts),
+            )
+            for i in range(count)
+        ))
+
+    def post_date(self, index, count, jitter=True):
+        """Посты идут по времени в порядке id, как на живом сайте."""
+        span = (self.now - self.start) / max(count, 1)
+        return self.start + span * (
+            index + (self.rng.random() if jitter else 1))
+
+    def create_posts(self, count, authors, groups):
+        author_ids = authors(count)
+        group_ids = groups(count)
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            self.post_count = count
+            return self.bulk_create(Post, (
+                Post(
+                    text=self.rng.choice(self.texts),
+                    author_id=author_ids[i],
+                    # Примерно треть постов - без группы.
+                    group_id=group_ids[i] if self.rng.random() < 0.7
+                    else None,
+                    pub_date=self.post_date(i, count),
+                )
+                for i in range(count)
+            ))
+
+    def create_follows(self, count, user_ids, authors):
+        pairs = set()
+        for _ in range(3):
+            missing = count - len(pairs)
+            if missing <= 0:
+                break
+            for user_id, author_id in zip(
+                self.rng.choices(user_ids, k=missing), authors(missing)
+            ):
+                if user_id != author_id:
+                    pairs.add((user_id, author_id))
+        return self.bulk_create(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in pairs
+        ))
+
+    def create_comments(self, count, user_ids, post_indexes, post_ids):
+        if not post_ids:
+            return []
+        indexes = post_indexes(count)
+        with explicit_dates(Comment._meta.get_field('created')):
+            return self.bulk_create(Comment, (
+                Comment(
+                    text=self.rng.choice(self.texts),
+                    author_id=self.rng.choice(user_ids),
+                    post_id=post_ids[index],
+                    created=min(
+                        self.now,
+                        self.post_date(index, self.post_count, jitter=False)
+                        + timedelta(days=self.rng.expovariate(1)),
+                    ),
+                )
+                for index in indexes
+            ))
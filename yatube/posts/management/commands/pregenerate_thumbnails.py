@@ -0,0 +1,43 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+
+from posts import caching, shards
+from posts.models import Post
+from posts.thumbnails import make_variants, process_pool
+
+
+class Command(BaseCommand):
+    help = (
+        'Нарезает варианты для всех картинок постов параллельно '
+        'в нескольких процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count())
+
+    def handle(self, *args, **options):
+        shards.check_single_database()
+        post_ids = (
+            Post.objects.exclude(image='')
+            .order_by().values_list('pk', flat=True)
+        )
+        done = failed = 0
+        # Поколения сдвигаются здесь: у процессов пула свой кэш.
+        scopes = set()
+        with process_pool(options['workers']) as pool:
+            futures = [
+                pool.submit(make_variants, post_id)
+                for post_id in post_ids.iterator()
+            ]
+            for future in futures:
+                if future.exception() is None:
+                    done += 1
+                    scopes.update(future.result())
+                else:
+                    failed += 1
+                    self.stderr.write(f'{future.exception()!r}')
+        if scopes:
+            caching.bump(*scopes)
+        self.stdout.write(f'Готово: {done}, с ошибками: {failed}')
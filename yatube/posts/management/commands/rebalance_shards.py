@@ -0,0 +1,131 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from posts import shards
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Post,
+                          PostImageVariant, PostLocation)
+from posts.utils import explicit_dates
+
+# Ограничение SQLite на число параметров запроса.
+IDS_PER_QUERY = 500
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), IDS_PER_QUERY):
+        yield ids[start:start + IDS_PER_QUERY]
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты авторов, оказавшихся не на своём шарде после '
+        'изменения SHARDS, вместе с комментариями, вариантами картинок '
+        'и архивом. '
+        'Автор переносится в одной транзакции целевого шарда; прерванный '
+        'перенос безопасно повторить. С --from default раскладывает '
+        'по шардам посты, накопленные без шардирования.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', action='append', dest='sources', default=[],
+            help='Дополнительная база-источник: default или шард, '
+                 'выведенный из SHARDS.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, кого нужно перенести.')
+
+    def handle(self, *args, **options):
+        if not settings.SHARDS:
+            raise CommandError('Шардирование выключено: SHARDS пуст.')
+        sources = list(dict.fromkeys(settings.SHARDS + options['sources']))
+        started = time.perf_counter()
+        moved = {'authors': 0, 'posts': 0, 'comments': 0}
+        for source in sources:
+            authors = set()
+            for model in shards.POST_MODELS:
+                authors.update(
+                    model.objects.using(source).order_by().values_list(
+                        'author_id', flat=True).distinct())
+            movers = [
+                author_id for author_id in sorted(authors)
+                if shards.for_author(author_id) != source
+            ]
+            self.stdout.write(f'{source}: переносится авторов {len(movers)}')
+            if options['dry_run']:
+                continue
+            for author_id in movers:
+                posts, comments = self.move(author_id, source)
+                moved['authors'] += 1
+                moved['posts'] += posts
+                moved['comments'] += comments
+        self.stdout.write(
+            f'Перенесено авторов {moved["authors"]}, постов {moved["posts"]}, '
+            f'комментариев {moved["comments"]} '
+            f'за {time.perf_counter() - started:.1f} с')
+
+    def move(self, author_id, source):
+        target = shards.for_author(author_id)
+        posts, comments = [], []
+        for post_model, comment_model in (
+            (Post, Comment),
+            (ArchivedPost, ArchivedComment),
+        ):
+            found = list(post_model.objects.using(source).filter(
+                author_id=author_id))
+            post_ids = [post.pk for post in found]
+            posts += found
+            for ids in _chunks(post_ids):
+                comments += comment_model.objects.using(source).filter(
+                    post_id__in=ids)
+        post_ids = [post.pk for post in posts]
+        variants = []
+        for ids in _chunks(post_ids):
+            variants += PostImageVariant.objects.using(source).filter(
+                post_id__in=ids)
+        if source == DEFAULT_DB_ALIAS:
+            # Посты, созданные без шардирования, ещё без адресов.
+            PostLocation.objects.bulk_create([
+                PostLocation(pk=pk, author_id=author_id) for pk in post_ids
+            ], ignore_conflicts=True)
+        # Комментарии и варианты получают id целевого шарда; id постов
+        # сквозные и не меняются.
+        for obj in comments + variants:
+            obj.pk = None
+        with transaction.atomic(using=target):
+            # Остатки прерванного переноса того же автора.
+            self.delete(target, post_ids)
+            with explicit_dates(
+                Post._meta.get_field('pub_date'),
+                Comment._meta.get_field('created'),
+            ):
+                for model in (
+                    Post, ArchivedPost, Comment, ArchivedComment,
+                    PostImageVariant,
+                ):
+                    model.objects.using(target).bulk_create([
+                        obj for obj in posts + comments + variants
+                        if isinstance(obj, model)
+                    ])
+        with transaction.atomic(using=source):
+            self.delete(source, post_ids)
+        return len(posts), len(comments)
+
+    @staticmethod
+    def delete(using, post_ids):
+        """Удаляет посты с комментариями и вариантами без сигналов:
+        счётчики, ленты и адреса при переносе не меняются.
+        """
+        for ids in _chunks(post_ids):
+            for model, field in (
+                (PostImageVariant, 'post_id'),
+                (Comment, 'post_id'),
+                (ArchivedComment, 'post_id'),
+                (Post, 'pk'),
+                (ArchivedPost, 'pk'),
+            ):
+                queryset = model.objects.using(using).filter(
+                    **{f'{field}__in': ids})
+                queryset._raw_delete(using)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов целиком.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexed = rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(f'Проиндексировано постов: {indexed}')
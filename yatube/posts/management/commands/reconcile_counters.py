@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import shards
+from posts.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики постов, комментариев '
+        'и подписок порциями и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        shards.check_single_database()
+        repaired = reconcile(chunk_size=options['chunk_size'])
+        for name, count in repaired.items():
+            self.stdout.write(f'{name}: исправлено строк {count}')
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    for follow in Follow.objects.iterator():
+        posts = Post.objects.filter(author_id=follow.author_id).order_by(
+            '-pub_date')[:settings.FEED_SIZE]
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(user_id=follow.user_id, post_id=post.pk,
+                          pub_date=post.pub_date)
+                for post in posts
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0006_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='posts.Post', verbose_name='Запись')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='feedentry',
+            unique_together={('user', 'post')},
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
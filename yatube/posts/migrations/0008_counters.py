@@ -0,0 +1,79 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, fk):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')}).order_by()
+            .values(fk).annotate(n=Count('pk')).values('n'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    Group.objects.update(posts_count=count_of(Post, 'group'))
+    Post.objects.update(comments_count=count_of(Comment, 'post'))
+    users = User.objects.annotate(
+        n_posts=count_of(Post, 'author'),
+        n_followers=count_of(Follow, 'author'),
+        n_following=count_of(Follow, 'user'),
+    )
+    UserStats.objects.bulk_create(
+        UserStats(
+            user_id=user.pk,
+            posts_count=user.n_posts,
+            followers_count=user.n_followers,
+            following_count=user.n_following,
+        )
+        for user in users.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0007_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+"""Таблица полнотекстового поиска.
+
+Миграция создаёт пустую таблицу: текст проходит через стеммер из
+posts.search, а его изменения не должны менять результат исторической
+миграции. Посты, созданные до неё, индексирует команда
+rebuild_search_index.
+"""
+from django.db import migrations
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5('
+        "body, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
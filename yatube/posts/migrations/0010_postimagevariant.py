@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostImageVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, verbose_name='Исходный файл')),
+                ('mime_type', models.CharField(max_length=20, verbose_name='Тип')),
+                ('width', models.PositiveIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(verbose_name='Высота')),
+                ('image', models.ImageField(upload_to='posts/variants/', verbose_name='Файл')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_variants', to='posts.Post', verbose_name='Запись')),
+            ],
+            options={
+                'verbose_name': 'Вариант картинки',
+                'verbose_name_plural': 'Варианты картинок',
+                'ordering': ('width',),
+            },
+        ),
+    ]
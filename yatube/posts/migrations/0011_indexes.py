@@ -0,0 +1,105 @@
+"""Составные индексы для лент, комментариев и подписок.
+
+Миграция не атомарная: каждый индекс строится и фиксируется отдельно,
+поэтому прерванный на большой таблице прогон можно просто повторить -
+готовые индексы пропускаются (IF NOT EXISTS). В PostgreSQL индексы
+строятся CONCURRENTLY и не блокируют запись в таблицы. Старый индекс
+ленты удаляется только после того, как построен новый.
+"""
+from django.db import migrations, models
+
+INDEXES = (
+    ('post', models.Index(fields=['pub_date'], name='post_pub_date_idx')),
+    ('post', models.Index(
+        fields=['group', 'pub_date'], name='post_group_pub_date_idx')),
+    ('post', models.Index(
+        fields=['author', 'pub_date'], name='post_author_pub_date_idx')),
+    ('comment', models.Index(
+        fields=['post', 'created'], name='comment_post_created_idx')),
+    ('follow', models.Index(
+        fields=['user', 'author'], name='follow_user_author_idx')),
+    ('follow', models.Index(
+        fields=['author', 'user'], name='follow_author_user_idx')),
+    ('feedentry', models.Index(
+        fields=['user', 'pub_date'], name='feed_user_date_idx')),
+)
+OLD_FEED_INDEX = 'feed_user_pub_date_idx'
+
+
+def _create_sql(schema_editor, model, index):
+    sql = str(index.create_sql(model, schema_editor))
+    if schema_editor.connection.vendor == 'postgresql':
+        return sql.replace(
+            'CREATE INDEX', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS', 1)
+    if schema_editor.connection.vendor == 'sqlite':
+        return sql.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1)
+    return sql
+
+
+def _drop_sql(schema_editor, name):
+    concurrently = (
+        ' CONCURRENTLY'
+        if schema_editor.connection.vendor == 'postgresql' else ''
+    )
+    return (
+        f'DROP INDEX{concurrently} IF EXISTS '
+        f'{schema_editor.quote_name(name)}'
+    )
+
+
+def create_indexes(model_name):
+    def create(apps, schema_editor):
+        model = apps.get_model('posts', model_name)
+        for name, index in INDEXES:
+            if name == model_name:
+                schema_editor.execute(
+                    _create_sql(schema_editor, model, index))
+        if model_name == 'feedentry':
+            schema_editor.execute(_drop_sql(schema_editor, OLD_FEED_INDEX))
+        if schema_editor.connection.vendor == 'sqlite':
+            # Статистика для планировщика по новым индексам.
+            schema_editor.execute(
+                f'ANALYZE {schema_editor.quote_name(model._meta.db_table)}')
+    return create
+
+
+def drop_indexes(model_name):
+    def drop(apps, schema_editor):
+        if model_name == 'feedentry':
+            model = apps.get_model('posts', model_name)
+            schema_editor.execute(_create_sql(
+                schema_editor, model, models.Index(
+                    fields=['user', '-pub_date'], name=OLD_FEED_INDEX)))
+        for name, index in reversed(INDEXES):
+            if name == model_name:
+                schema_editor.execute(_drop_sql(schema_editor, index.name))
+    return drop
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('posts', '0010_postimagevariant'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            # По операции на модель: с подсказкой model_name роутер
+            # шардов (posts.shards) строит индексы постов и комментариев
+            # и на шардах.
+            database_operations=[
+                migrations.RunPython(
+                    create_indexes(model_name), drop_indexes(model_name),
+                    hints={'model_name': model_name})
+                for model_name in ('post', 'comment', 'follow', 'feedentry')
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='feedentry', name=OLD_FEED_INDEX),
+            ] + [
+                migrations.AddIndex(model_name=model_name, index=index)
+                for model_name, index in INDEXES
+            ],
+        ),
+    ]
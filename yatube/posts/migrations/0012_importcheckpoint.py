@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Источник')),
+                ('position', models.BigIntegerField(default=0, verbose_name='Смещение в файле')),
+                ('rows', models.BigIntegerField(default=0, verbose_name='Импортировано строк')),
+                ('last_source_post', models.BigIntegerField(null=True, verbose_name='id последнего поста в файле')),
+                ('last_post', models.BigIntegerField(null=True, verbose_name='id последнего поста')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Точка импорта',
+                'verbose_name_plural': 'Точки импорта',
+            },
+        ),
+    ]
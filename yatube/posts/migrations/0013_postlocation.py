@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostLocation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Адрес поста',
+                'verbose_name_plural': 'Адреса постов',
+            },
+        ),
+    ]
@@ -5,10 +5,28 @@ from django.conf import settings
 User = get_user_model()
 
 
+class ShardedQuerySet(models.QuerySet):
+    """Запросы к моделям, которые при шардировании лежат в шарде поста
+    (posts.shards).
+    """
+
+    def create(self, **kwargs):
+        # QuerySet.create спрашивает у роутера базу по одной модели;
+        # без явного using() сохраняем через объект - по нему роутер
+        # находит шард.
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(
+        'Число постов', default=0, editable=False)
 
     def __str__(self):
         return self.title
@@ -33,6 +51,22 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев', default=0, editable=False)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        # Индексы по (..., pub_date) отдают страницы лент уже упорядоченными:
+        # pk в конце ключа - тот же, что добавляет в сортировку пагинатор.
+        indexes = [
+            models.Index(fields=['pub_date'], name='post_pub_date_idx'),
+            models.Index(
+                fields=['group', 'pub_date'], name='post_group_pub_date_idx'),
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='post_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text
@@ -58,10 +92,39 @@ class Comment(models.Model):
         verbose_name='Запись'
     )
 
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created_idx'),
+        ]
+
     def __str__(self):
         return self.text[:settings.CUT_TEXT]
 
 
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stats',
+        verbose_name='Пользователь')
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0)
+    following_count = models.PositiveIntegerField(
+        'Число подписок', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Счётчики пользователей'
+        verbose_name = 'Счётчики пользователя'
+
+    def __str__(self):
+        return f'Счётчики {self.user_id}'
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
         User,
@@ -77,6 +140,180 @@ class Follow(models.Model):
     class Meta:
         verbose_name_plural = 'Подписки'
         verbose_name = 'Подписка'
+        indexes = [
+            models.Index(
+                fields=['user', 'author'], name='follow_user_author_idx'),
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} подписался на {self.author}'
+
+
+class FeedEntry(models.Model):
+    """Запись в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Читатель')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Запись')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name_plural = 'Ленты подписок'
+        verbose_name = 'Запись ленты'
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date'], name='feed_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} в ленте {self.user_id}'
+
+
+class PostImageVariant(models.Model):
+    """Уменьшенная копия картинки поста определённой ширины и формата."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+        verbose_name='Запись')
+    source = models.CharField('Исходный файл', max_length=255)
+    mime_type = models.CharField('Тип', max_length=20)
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+    image = models.ImageField('Файл', upload_to='posts/variants/')
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'Варианты картинок'
+        verbose_name = 'Вариант картинки'
+        ordering = ('width',)
+
+    def __str__(self):
+        return f'{self.source} {self.width}w {self.mime_type}'
+
+
+class ImportCheckpoint(models.Model):
+    """Докуда дошёл import_content: сохраняется в той же транзакции,
+    что и импортированная порция, поэтому повторный запуск продолжает
+    с места остановки без дублей.
+    """
+    source = models.CharField('Источник', max_length=255, unique=True)
+    position = models.BigIntegerField('Смещение в файле', default=0)
+    rows = models.BigIntegerField('Импортировано строк', default=0)
+    # Комментарии идут в файле сразу за своим постом, поэтому между
+    # порциями достаточно помнить только последний пост.
+    last_source_post = models.BigIntegerField(
+        'id последнего поста в файле', null=True)
+    last_post = models.BigIntegerField('id последнего поста', null=True)
+    updated = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Точки импорта'
+        verbose_name = 'Точка импорта'
+
+    def __str__(self):
+        return f'{self.source}: {self.position}'
+
+
+class PostLocation(models.Model):
+    """Адрес поста при шардировании (posts.shards): здесь выдаются
+    сквозные id постов, а автор поста определяет его шард.
+    """
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор')
+
+    class Meta:
+        verbose_name_plural = 'Адреса постов'
+        verbose_name = 'Адрес поста'
+
+    def __str__(self):
+        return f'{self.pk} автора {self.author_id}'
+
+
+class ArchivedPost(models.Model):
+    """Пост, перенесённый в архив (posts.archive) с тем же id.
+
+    Поля повторяют Post: команда archive_posts копирует строки
+    INSERT ... SELECT по совпадающим столбцам.
+    """
+    text = models.TextField('Текст поста')
+    pub_date = models.DateTimeField('Дата публикации')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        verbose_name='Автор')
+    group = models.ForeignKey(
+        Group, on_delete=models.CASCADE,
+        blank=True, null=True,
+        related_name='archived_posts',
+        verbose_name='Группа')
+    image = models.ImageField('Картинка', upload_to='posts/', blank=True)
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев', default=0, editable=False)
+
+    # Архив только для чтения: шаблоны прячут правку и комментарии.
+    archived = True
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'Архивные посты'
+        verbose_name = 'Архивный пост'
+        indexes = [
+            models.Index(
+                fields=['pub_date'], name='archived_pub_date_idx'),
+            models.Index(
+                fields=['group', 'pub_date'],
+                name='archived_group_pub_date_idx'),
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='archived_author_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return self.text
+
+
+class ArchivedComment(models.Model):
+    """Комментарий архивного поста."""
+    text = models.TextField('Текст комментария')
+    created = models.DateTimeField('Дата публикации')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор комментария')
+    post = models.ForeignKey(
+        ArchivedPost,
+        blank=True, null=True,
+        on_delete=models.CASCADE,
+        related_name='comments',
+        verbose_name='Запись')
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'Архивные комментарии'
+        verbose_name = 'Архивный комментарий'
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='archived_post_created_idx'),
+        ]
+
+    def __str__(self):
+        return self.text
@@ -0,0 +1,253 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+В таблице posts_post_fts (rowid = id поста) хранится текст поста,
+прогнанный через русский стеммер, поэтому «котами» находит «коты».
+Ранжирование - BM25 самой FTS5. Индекс обновляется сигналами при
+сохранении и удалении поста; полностью перестраивается командой
+rebuild_search_index.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+
+from . import shards
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+# id постов в одном запросе к шарду (лимит параметров SQLite).
+CHUNK_SIZE = 500
+
+_WORD = re.compile(r'\w+')
+_VOWEL = re.compile('[аеиоуыэюя]')
+_PERFECTIVE_GERUND = re.compile(
+    r'((?<=[ая])(вшись|вши|в)|(ившись|ывшись|ивши|ывши|ив|ыв))$')
+_REFLEXIVE = re.compile(r'(ся|сь)$')
+_ADJECTIVAL = re.compile(
+    r'(((?<=[ая])(ем|нн|вш|ющ|щ)|(ивш|ывш|ующ))?'
+    r'(ими|ыми|его|ого|ему|ому|ее|ие|ые|ое|ей|ий|ый|ой|ем|им|ым|ом'
+    r'|их|ых|ую|юю|ая|яя|ою|ею))$')
+_VERB = re.compile(
+    r'((?<=[ая])(ете|йте|ешь|нно|ла|на|ли|ем|ло|но|ет|ют|ны|ть|й|л|н)'
+    r'|(ейте|уйте|ила|ыла|ена|ите|или|ыли|ило|ыло|ено|ует|уют|ены|ить'
+    r'|ыть|ишь|ей|уй|ил|ыл|им|ым|ен|ят|ит|ыт|ую|ю))$')
+_NOUN = re.compile(
+    r'(иями|ями|иях|ием|ами|ией|иям|ях|ям|ев|ов|ие|ье|еи|ии|ей|ой|ий'
+    r'|ем|ам|ом|ах|ию|ью|ия|ья|а|е|и|й|о|у|ы|ь|ю|я)$')
+_DERIVATIONAL = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def _region(word, start):
+    """Начало области после первой согласной, идущей за гласной."""
+    match = _VOWEL.search(word, start)
+    if match is None:
+        return len(word)
+    for pos in range(match.end(), len(word)):
+        if not _VOWEL.match(word[pos]):
+            return pos + 1
+    return len(word)
+
+
+# Словоформы повторяются по закону Ципфа: при индексации тысяч постов
+# почти каждое слово уже встречалось, и регулярки стеммера не нужны.
+@lru_cache(maxsize=65536)
+def stem(word):
+    """Русский стеммер Snowball (Портер)."""
+    word = word.lower().replace('ё', 'е')
+    match = _VOWEL.search(word)
+    if match is None:
+        return word
+    head, rv = word[:match.end()], word[match.end():]
+    r2 = _region(word, _region(word, 0)) - match.end()
+
+    rv, found = _PERFECTIVE_GERUND.subn('', rv)
+    if not found:
+        rv = _REFLEXIVE.sub('', rv)
+        rv, found = _ADJECTIVAL.subn('', rv)
+        if not found:
+            rv, found = _VERB.subn('', rv)
+            if not found:
+                rv = _NOUN.sub('', rv)
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if _DERIVATIONAL.search(rv[max(r2, 0):]):
+        rv = _DERIVATIONAL.sub('', rv)
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        rv, found = _SUPERLATIVE.subn('', rv)
+        if found and rv.endswith('нн'):
+            rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+    return head + rv
+
+
+def tokenize(text):
+    return [stem(word) for word in _WORD.findall(text.lower())]
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def index_post(post):
+    if available():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, body) '
+                'VALUES (%s, %s)',
+                [post.pk, ' '.join(tokenize(post.text))],
+            )
+
+
+def index_many(rows):
+    """Добавляет в индекс пары (id, текст) одним executemany."""
+    if available():
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, body) '
+                'VALUES (%s, %s)',
+                [(pk, ' '.join(tokenize(text))) for pk, text in rows],
+            )
+
+
+def remove_post(post_id):
+    if available():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def remove_many(post_ids):
+    """Удаляет из индекса посты post_ids одним executemany."""
+    if available():
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(post_id,) for post_id in post_ids],
+            )
+
+
+def rebuild(chunk_size=1000):
+    """Перестраивает индекс целиком, возвращает число постов."""
+    if not available():
+        return 0
+    indexed = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        posts = Post.objects.order_by().values_list('pk', 'text')
+        rows = []
+        for pk, text in posts.iterator(chunk_size=chunk_size):
+            rows.append((pk, ' '.join(tokenize(text))))
+            if len(rows) >= chunk_size:
+                indexed += _insert(cursor, rows)
+                rows = []
+        indexed += _insert(cursor, rows)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def _insert(cursor, rows):
+    cursor.executemany(
+        f'INSERT INTO {FTS_TABLE} (rowid, body) VALUES (%s, %s)', rows)
+    return len(rows)
+
+
+class SearchResults:
+    """Ленивый список найденных постов, отсортированный по BM25.
+
+    Поддерживает count() и срезы, поэтому подходит для Paginator.
+    Индекс лежит в default; при шардировании посты догружаются с шардов,
+    а фильтры по группе и автору применяются там же (_sharded_ids).
+    """
+
+    def __init__(self, query, group=None, author=None):
+        terms = dict.fromkeys(tokenize(query))
+        self.match = ' '.join(f'"{term}"' for term in terms)
+        self.group = group
+        self.author = author
+        self.filters = []
+        self.params = [self.match]
+        self._ids = None
+        if settings.SHARDS:
+            return
+        if group is not None:
+            self.filters.append('AND p.group_id = %s')
+            self.params.append(group.pk)
+        if author is not None:
+            self.filters.append('AND p.author_id = %s')
+            self.params.append(author.pk)
+
+    def _execute(self, select, tail='', params=()):
+        join = ''
+        if not settings.SHARDS:
+            join = f'JOIN posts_post p ON p.id = {FTS_TABLE}.rowid '
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {select} FROM {FTS_TABLE} {join}'
+                f'WHERE {FTS_TABLE} MATCH %s {" ".join(self.filters)} '
+                f'{tail}',
+                self.params + list(params),
+            )
+            return cursor.fetchall()
+
+    def _ranked(self, tail='', params=()):
+        return [row[0] for row in self._execute(
+            f'{FTS_TABLE}.rowid',
+            f'ORDER BY bm25({FTS_TABLE}), {FTS_TABLE}.rowid DESC {tail}',
+            params)]
+
+    def _sharded(self):
+        """Фильтры по группе или автору при шардировании: столбцы постов
+        лежат на шардах, и JOIN с индексом невозможен.
+        """
+        return settings.SHARDS and (
+            self.group is not None or self.author is not None)
+
+    def _sharded_ids(self):
+        """id всех найденных постов по рангу, прошедших фильтры шардов."""
+        if self._ids is None:
+            ids = self._ranked()
+            filters = {}
+            aliases = settings.SHARDS
+            if self.group is not None:
+                filters['group'] = self.group
+            if self.author is not None:
+                filters['author'] = self.author
+                aliases = [shards.for_author(self.author.pk)]
+            found = set()
+            for alias in aliases:
+                for start in range(0, len(ids), CHUNK_SIZE):
+                    found.update(Post.objects.using(alias).filter(
+                        pk__in=ids[start:start + CHUNK_SIZE], **filters,
+                    ).values_list('pk', flat=True))
+            self._ids = [pk for pk in ids if pk in found]
+        return self._ids
+
+    def count(self):
+        if not self.match or not available():
+            return 0
+        if self._sharded():
+            return len(self._sharded_ids())
+        return self._execute('COUNT(*)')[0][0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        if not self.match or not available():
+            return []
+        start = item.start or 0
+        if self._sharded():
+            ids = self._sharded_ids()[start:item.stop]
+        else:
+            ids = self._ranked(
+                'LIMIT %s OFFSET %s', [item.stop - start, start])
+        posts = shards.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
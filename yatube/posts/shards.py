@@ -0,0 +1,304 @@
+"""Шардирование постов по авторам.
+
+С непустым SHARDS посты автора, комментарии к ним, варианты картинок
+и архив (posts.archive) лежат в одной из баз SHARDS - её выбирает
+rendezvous-хеширование по id автора, поэтому при добавлении шарда
+переезжает лишь доля авторов (команда rebalance_shards). Пользователи,
+группы, подписки, ленты и счётчики остаются в default.
+
+id постов сквозные: их выдаёт таблица PostLocation в default, она же
+помнит автора поста, то есть его шард. Связи с моделями из default
+шарды не проверяют (PRAGMA foreign_keys = OFF) и не соединяют JOIN:
+авторов и группы постов догружает prefetch_related одним запросом.
+
+Ленты главной и групп собираются со всех шардов слиянием
+упорядоченных выборок (MergedQuerySet). С пустым SHARDS все функции
+модуля возвращают обычные запросы к default.
+"""
+import hashlib
+import heapq
+from collections import defaultdict
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import prefetch_related_objects
+
+from core import replicas
+
+from .models import (ArchivedComment, ArchivedPost, Comment, FeedEntry, Post,
+                     PostImageVariant, PostLocation, User)
+
+SHARDED_MODELS = {
+    Post, Comment, PostImageVariant, ArchivedPost, ArchivedComment,
+}
+POST_MODELS = (Post, ArchivedPost)
+
+
+def _weight(alias, author_id):
+    digest = hashlib.blake2b(
+        f'{alias}:{author_id}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def for_author(author_id, shards=None):
+    """Шард постов автора или None без шардирования."""
+    shards = settings.SHARDS if shards is None else shards
+    if not shards:
+        return None
+    return max(shards, key=lambda alias: _weight(alias, author_id))
+
+
+# Автор поста не меняется, а id не переиспользуются (AUTOINCREMENT),
+# поэтому найденный адрес можно помнить сколько угодно. Промахи
+# не запоминаются: пост с этим id может появиться позже.
+_authors = {}
+AUTHORS_CACHE_SIZE = 65536
+
+
+def _author_of(post_id):
+    author_id = _authors.get(post_id)
+    if author_id is None:
+        # Из default: на отстающей реплике нового адреса ещё нет.
+        author_id = PostLocation.objects.using(DEFAULT_DB_ALIAS).filter(
+            pk=post_id).values_list('author_id', flat=True).first()
+        if author_id is not None:
+            if len(_authors) >= AUTHORS_CACHE_SIZE:
+                _authors.clear()
+            _authors[post_id] = author_id
+    return author_id
+
+
+def for_post(post_id):
+    """Шард поста или None без шардирования и для неизвестного id."""
+    if not settings.SHARDS:
+        return None
+    author_id = _author_of(post_id)
+    if author_id is None:
+        return None
+    return for_author(author_id)
+
+
+def allocate(post):
+    """Выдаёт новому посту сквозной id и записывает его адрес."""
+    post.pk = PostLocation.objects.create(author_id=post.author_id).pk
+
+
+def check_single_database():
+    """Для команд, которые работают с постами только в default."""
+    if settings.SHARDS:
+        raise CommandError(
+            'Команда не поддерживает шардирование: посты лежат в SHARDS.')
+
+
+def forget(post_id):
+    """Удаляет адрес удалённого поста и его записи в лентах: каскад
+    с шарда до default не доходит.
+    """
+    PostLocation.objects.filter(pk=post_id).delete()
+    FeedEntry.objects.filter(post_id=post_id).delete()
+
+
+def delete_for_user(user):
+    """Посты и комментарии удаляемого пользователя на шардах."""
+    for model in POST_MODELS:
+        model.objects.using(for_author(user.pk)).filter(author=user).delete()
+    for alias in settings.SHARDS:
+        for model in (Comment, ArchivedComment):
+            model.objects.using(alias).filter(author=user).delete()
+
+
+def delete_for_group(group):
+    """Посты удаляемой группы на всех шардах."""
+    for alias in settings.SHARDS:
+        for model in POST_MODELS:
+            model.objects.using(alias).filter(group=group).delete()
+
+
+def related(queryset, *fields):
+    """select_related в одной базе; на шарде JOIN с таблицами default
+    невозможен, и связи догружаются prefetch_related.
+    """
+    if settings.SHARDS:
+        return queryset.prefetch_related(*fields)
+    return queryset.select_related(*fields)
+
+
+def post(post_id, model=Post):
+    """Посты (model - Post или ArchivedPost) шарда, на котором лежит
+    пост post_id, с автором и его счётчиками и группой.
+    """
+    return related(
+        model.objects.using(for_post(post_id)), 'author__stats', 'group')
+
+
+def posts(model=Post, **filters):
+    """Лента постов с авторами и группами: с фильтром по автору - из его
+    шарда, иначе - слиянием всех шардов.
+    """
+    if not settings.SHARDS:
+        return model.objects.filter(**filters).select_related(
+            'author', 'group')
+    author = filters.get('author')
+    if author is not None:
+        return model.objects.using(for_author(author.pk)).filter(
+            **filters).prefetch_related('author', 'group')
+    return MergedQuerySet(
+        [model.objects.using(alias).filter(**filters)
+         for alias in settings.SHARDS],
+        related=('author', 'group'),
+    )
+
+
+def in_bulk(ids):
+    """Словарь id -> пост с автором и группой по запросу на шард."""
+    if not settings.SHARDS:
+        return Post.objects.select_related('author', 'group').in_bulk(ids)
+    locations = PostLocation.objects.filter(pk__in=ids).values_list(
+        'pk', 'author_id')
+    by_shard = defaultdict(list)
+    for pk, author_id in locations:
+        by_shard[for_author(author_id)].append(pk)
+    found = {}
+    for alias, pks in by_shard.items():
+        found.update(Post.objects.using(alias).in_bulk(pks))
+    prefetch_related_objects(list(found.values()), 'author', 'group')
+    return found
+
+
+class MergedQuerySet:
+    """Упорядоченная выборка из нескольких баз: k-way merge
+    упорядоченных выборок шардов.
+
+    Поддерживает то, что нужно KeysetPaginator: order_by, filter, count
+    и срезы. Срез [start:stop] берёт у каждого шарда первые stop строк:
+    с начала - сразу целиком, глубже - сначала только ключи сортировки,
+    а строки - лишь для попавших на страницу.
+    """
+    ordered = True
+
+    def __init__(self, querysets, related=(), ordering=('-pub_date', '-pk')):
+        self.querysets = querysets
+        self.related = related
+        self.ordering = ordering
+        self.model = querysets[0].model
+
+    def _clone(self, querysets, ordering=None):
+        return MergedQuerySet(
+            querysets, self.related, ordering or self.ordering)
+
+    def order_by(self, *fields):
+        return self._clone(
+            [queryset.order_by(*fields) for queryset in self.querysets],
+            fields)
+
+    def filter(self, *args, **kwargs):
+        return self._clone([
+            queryset.filter(*args, **kwargs) for queryset in self.querysets
+        ])
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def _fields(self):
+        descending = {field.startswith('-') for field in self.ordering}
+        if len(descending) != 1:
+            raise ValueError('Поля сортировки должны идти в одну сторону.')
+        return [field.lstrip('-') for field in self.ordering], descending.pop()
+
+    def _merge(self, rows, key, stop, descending):
+        merged = heapq.merge(*rows, key=key, reverse=descending)
+        return list(islice(merged, stop))
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start, stop = item.start or 0, item.stop
+        fields, descending = self._fields()
+        if start == 0:
+            rows = self._merge(
+                [list(queryset[:stop]) for queryset in self.querysets],
+                attrgetter(*fields), stop, descending)
+        else:
+            # (ключи сортировки..., pk, номер шарда)
+            keys = self._merge(
+                [
+                    [(*values, index) for values in
+                     queryset.values_list(*fields, 'pk')[:stop]]
+                    for index, queryset in enumerate(self.querysets)
+                ],
+                lambda values: values[:-2], stop, descending)[start:]
+            by_shard = defaultdict(list)
+            for *_, pk, index in keys:
+                by_shard[index].append(pk)
+            found = {}
+            for index, pks in by_shard.items():
+                found[index] = self.querysets[index].in_bulk(pks)
+            rows = [found[index][pk] for *_, pk, index in keys]
+        prefetch_related_objects(rows, *self.related)
+        return rows
+
+    def __iter__(self):
+        return iter(self[0:self.count()])
+
+
+class ShardRouter:
+    """Отправляет запросы к моделям SHARDED_MODELS в шард их поста.
+
+    Шард известен, если запрос идёт от объекта (сохранение, связанные
+    менеджеры вроде post.comments); остальные запросы выбирают базу
+    явно через using() - например, функциями этого модуля.
+    """
+
+    def _route(self, model, hints):
+        if not settings.SHARDS or model not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._state.db in settings.SHARDS:
+            return instance._state.db
+        if isinstance(instance, POST_MODELS):
+            return for_author(instance.author_id)
+        if model in POST_MODELS and isinstance(instance, User):
+            # author.posts, author.archived_posts
+            return for_author(instance.pk)
+        post_id = getattr(instance, 'post_id', None)
+        return None if post_id is None else for_post(post_id)
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        alias = self._route(model, hints)
+        if alias is not None:
+            replicas.wrote()
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in settings.SHARD_DATABASES:
+            return None
+        return app_label == 'posts' and model_name in {
+            model._meta.model_name for model in SHARDED_MODELS
+        }
+
+
+def configure(sender, connection, **kwargs):
+    """Отключает проверку внешних ключей там, где связи пересекают базы:
+    на шардах и, при шардировании, в default (ленты ссылаются на посты
+    шардов).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    if connection.alias in settings.SHARD_DATABASES or (
+        settings.SHARDS and connection.alias == DEFAULT_DB_ALIAS
+    ):
+        connection.connection.execute('PRAGMA foreign_keys = OFF')
@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import caching, counters, search, shards, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, using, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    elif update_fields != frozenset(['last_login']):
+        # Вход пользователя меняет только last_login, которого не видно
+        # на страницах, - кэш из-за него не сбрасываем.
+        caching.bump_on_commit(
+            using, caching.PROFILES, caching.author_scope(instance.pk))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    if settings.SHARDS:
+        shards.delete_for_user(instance)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, using, **kwargs):
+    caching.bump_on_commit(
+        using, caching.PROFILES, caching.group_scope(instance.pk))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    if settings.SHARDS:
+        shards.delete_for_group(instance)
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    instance._counted_group_id = instance.group_id
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw, **kwargs):
+    if settings.SHARDS and instance.pk is None and not raw:
+        shards.allocate(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, using, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, 'posts_count', 1)
+        counters.change_group(instance.group_id, 1)
+        timeline.fan_out(instance)
+    elif instance.group_id != instance._counted_group_id:
+        counters.change_group(instance._counted_group_id, -1)
+        counters.change_group(instance.group_id, 1)
+        caching.bump_on_commit(
+            using, caching.group_scope(instance._counted_group_id))
+    instance._counted_group_id = instance.group_id
+    search.index_post(instance)
+    caching.bump_on_commit(
+        using, caching.GLOBAL, *caching.post_scopes(instance))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, using, **kwargs):
+    counters.change_user(instance.author_id, 'posts_count', -1)
+    counters.change_group(instance._counted_group_id, -1)
+    search.remove_post(instance.pk)
+    if settings.SHARDS:
+        shards.forget(instance.pk)
+    caching.bump_on_commit(
+        using, caching.GLOBAL, *caching.post_scopes(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, using, **kwargs):
+    if created:
+        counters.change_post(instance.post_id, 1)
+    caching.bump_on_commit(using, caching.post_scope(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, using, **kwargs):
+    counters.change_post(instance.post_id, -1)
+    caching.bump_on_commit(using, caching.post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, using, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, 'followers_count', 1)
+        counters.change_user(instance.user_id, 'following_count', 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        caching.bump_on_commit(
+            using,
+            caching.follow_scope(instance.author_id),
+            caching.follow_scope(instance.user_id),
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, using, **kwargs):
+    counters.change_user(instance.author_id, 'followers_count', -1)
+    counters.change_user(instance.user_id, 'following_count', -1)
+    timeline.prune(instance.user_id, instance.author_id)
+    caching.bump_on_commit(
+        using,
+        caching.follow_scope(instance.author_id),
+        caching.follow_scope(instance.user_id),
+    )
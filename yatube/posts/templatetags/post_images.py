@@ -0,0 +1,65 @@
+from itertools import groupby
+
+from django import template
+from sorl.thumbnail import get_thumbnail
+
+from ..thumbnails import DEFAULT_WIDTH, FALLBACK, MIME_TYPES, SIZES
+
+register = template.Library()
+
+
+def _srcset(variants):
+    return ', '.join(
+        f'{variant.image.url} {variant.width}w' for variant in variants)
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post, css_class='card-img-top'):
+    """<picture> с вариантами картинки поста.
+
+    Варианты берутся из post.picture_variants (см. attach_variants),
+    пока их нет - выводится миниатюра sorl.
+    """
+    if not post.image:
+        return {}
+    variants = getattr(post, 'picture_variants', None)
+    if variants is None:
+        variants = list(post.image_variants.filter(source=post.image.name))
+    context = {'css_class': css_class, 'sizes': SIZES}
+    if not variants:
+        geometry, options = FALLBACK
+        try:
+            thumbnail = get_thumbnail(post.image, geometry, **options)
+        except Exception:
+            # Как и {% thumbnail %}: битая картинка не роняет страницу.
+            return {}
+        context['img'] = {'url': thumbnail.url}
+        if thumbnail.size:
+            context['img']['width'], context['img']['height'] = (
+                thumbnail.size)
+        return context
+    by_type = {
+        mime_type: list(group)
+        for mime_type, group in groupby(
+            sorted(variants, key=lambda variant: variant.mime_type),
+            key=lambda variant: variant.mime_type,
+        )
+    }
+    fallback = by_type.pop('image/jpeg', variants)
+    default = next(
+        (variant for variant in reversed(fallback)
+         if variant.width <= DEFAULT_WIDTH),
+        fallback[0],
+    )
+    context['sources'] = [
+        {'type': mime_type, 'srcset': _srcset(group)}
+        for mime_type, group in sorted(
+            by_type.items(), key=lambda item: MIME_TYPES.index(item[0]))
+    ]
+    context['img'] = {
+        'url': default.image.url,
+        'srcset': _srcset(fallback),
+        'width': default.width,
+        'height': default.height,
+    }
+    return context
@@ -0,0 +1,136 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import archive
+from ..models import (ArchivedComment, ArchivedPost, Comment, FeedEntry,
+                      Follow, Group, Post, PostImageVariant, User, UserStats)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class ArchiveTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='NoNameAuthor')
+        cls.reader = User.objects.create(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(
+                text=f'Тестовый пост {i}', author=cls.author, group=cls.group)
+            for i in range(15)
+        ]
+        # Восемь самых старых постов - старше порога архива.
+        for days, post in zip(range(800, 0, -1), cls.posts[:8]):
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=timezone.now() - timedelta(days=days))
+        cls.old = cls.posts[2]
+        Comment.objects.create(
+            author=cls.reader, post=cls.old, text='Старый комментарий')
+        call_command('archive_posts', '--pause', '0', stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def page(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_old_posts_moved(self):
+        """Старые посты с комментариями переехали в архив с теми же id,
+        записи лент на них удалены.
+        """
+        old = [post.pk for post in self.posts[:8]]
+        self.assertEqual(
+            sorted(ArchivedPost.objects.values_list('pk', flat=True)), old)
+        self.assertFalse(Post.objects.filter(pk__in=old).exists())
+        self.assertEqual(Post.objects.count(), 7)
+        comment = ArchivedComment.objects.get()
+        self.assertEqual(comment.post_id, self.old.pk)
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(FeedEntry.objects.filter(post_id__in=old).exists())
+        self.assertEqual(ArchivedPost.objects.get(pk=self.old.pk).text,
+                         self.old.text)
+
+    def test_pages_fall_through_to_archive(self):
+        """Профиль и группа листают архив после свежих постов,
+        главная показывает только свежие.
+        """
+        ids = [post.pk for post in self.posts]
+        profile = reverse('posts:profile', args=[self.author.username])
+        self.assertEqual(self.page(profile), ids[::-1][:10])
+        self.assertEqual(self.page(profile, page=2), ids[::-1][10:])
+        response = self.client.get(profile)
+        self.assertEqual(response.context['page_obj'].paginator.count, 15)
+        cursor = response.context['page_obj'].next_cursor
+        self.assertEqual(self.page(profile, cursor=cursor), ids[::-1][10:])
+        group = reverse('posts:group_list', args=[self.group.slug])
+        self.assertEqual(self.page(group), ids[:10])
+        self.assertEqual(self.page(group, page=2), ids[10:])
+        self.assertEqual(self.page(reverse('posts:index')), ids[8:][::-1])
+
+    def test_archived_post_is_read_only(self):
+        """Архивный пост открывается с комментариями, но комментировать
+        и править его нельзя.
+        """
+        url = reverse('posts:post_detail', args=[self.old.pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'Старый комментарий')
+        self.assertNotContains(response, 'Добавить комментарий')
+        response = self.client.post(
+            reverse('posts:add_comment', args=[self.old.pk]),
+            {'text': 'Новый'})
+        self.assertEqual(response.status_code, 404)
+        self.client.force_login(self.author)
+        response = self.client.get(
+            reverse('posts:post_edit', args=[self.old.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_counters_include_archive(self):
+        """Архивные посты учтены в счётчиках, reconcile их не теряет."""
+        output = StringIO()
+        call_command('reconcile_counters', stdout=output)
+        self.assertIn('users: исправлено строк 0', output.getvalue())
+        self.assertIn('groups: исправлено строк 0', output.getvalue())
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 15)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ArchiveVariantsTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_variant_files_removed(self):
+        """Файлы вариантов картинки архивного поста удаляются."""
+        post = Post.objects.create(
+            text='Пост', author=User.objects.create(username='Author'))
+        variant = PostImageVariant(
+            post=post, source='posts/image.gif', mime_type='image/webp',
+            width=320, height=160)
+        variant.image.save('image.webp', ContentFile(b'webp'), save=True)
+        name = variant.image.name
+        self.assertTrue(default_storage.exists(name))
+        archive.move('default', [post.pk])
+        self.assertFalse(PostImageVariant.objects.exists())
+        self.assertFalse(default_storage.exists(name))
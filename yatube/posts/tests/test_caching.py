@@ -0,0 +1,185 @@
+from unittest import mock
+
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from .. import caching
+from ..models import Comment, Follow, Group, Post, User
+
+
+class FragmentCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(
+            username='NoNameAuthor', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Исходный текст', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        # TestCase не коммитит транзакций: поколения сдвигаются сразу.
+        patcher = mock.patch.object(caching, 'transaction', mock.Mock(
+            on_commit=lambda func, using=None: func()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, name, **kwargs):
+        return self.guest_client.get(
+            reverse(name, kwargs=kwargs)).content.decode()
+
+    def test_fragments_are_cached(self):
+        """Повторный запрос отдаёт фрагменты из кэша."""
+        self.get('posts:index')
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        self.assertIn('Исходный текст', self.get('posts:index'))
+
+    def test_card_is_shared_by_feeds(self):
+        """Карточка поста, закэшированная на главной, отдаётся и в ленте
+        группы и в профиле.
+        """
+        self.get('posts:index')
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        self.assertIn(
+            'Исходный текст',
+            self.get('posts:group_list', slug=self.group.slug))
+        self.assertIn(
+            'Исходный текст',
+            self.get('posts:profile', username=self.author.username))
+
+    def test_post_edit_invalidates_lists(self):
+        """Правка поста сразу видна на всех страницах."""
+        pages = (
+            ('posts:index', {}),
+            ('posts:group_list', {'slug': self.group.slug}),
+            ('posts:profile', {'username': self.author.username}),
+            ('posts:post_detail', {'post_id': self.post.pk}),
+        )
+        for name, kwargs in pages:
+            self.get(name, **kwargs)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        for name, kwargs in pages:
+            with self.subTest(name=name):
+                self.assertIn('Новый текст', self.get(name, **kwargs))
+
+    def test_author_rename_invalidates_cards(self):
+        """Смена имени автора сбрасывает карточки его постов."""
+        url_kwargs = {'slug': self.group.slug}
+        self.get('posts:group_list', **url_kwargs)
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Фёдор'
+        author.save()
+        self.assertIn('Фёдор', self.get('posts:group_list', **url_kwargs))
+
+    def test_comment_invalidates_post_detail(self):
+        """Новый комментарий сразу виден на странице поста."""
+        self.get('posts:post_detail', post_id=self.post.pk)
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Свежий комментарий')
+        self.assertIn(
+            'Свежий комментарий',
+            self.get('posts:post_detail', post_id=self.post.pk),
+        )
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='NoNameAuthor')
+        cls.reader = User.objects.create(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Тестовый пост', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        # TestCase не коммитит транзакций: поколения сдвигаются сразу.
+        patcher = mock.patch.object(caching, 'transaction', mock.Mock(
+            on_commit=lambda func, using=None: func()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_not_modified(self):
+        """По ETag и Last-Modified гостю отдаётся 304 без рендеринга
+        и не дороже одного запроса за объект страницы.
+        """
+        pages = (
+            (reverse('posts:index'), 0),
+            (reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+             1),
+            (reverse('posts:profile',
+                     kwargs={'username': self.author.username}), 1),
+            (reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+             1),
+            (reverse('posts:search') + '?q=пост', 0),
+        )
+        for url, queries in pages:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertTrue(response.has_header('Last-Modified'))
+                with self.assertNumQueries(queries):
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                response = self.guest_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_validators(self):
+        """Новый комментарий, пост и смена имени автора меняют ETag."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        changes = (
+            lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий'),
+            lambda: Post.objects.create(author=self.author, text='Ещё'),
+            lambda: User.objects.filter(pk=self.reader.pk).first().save(),
+        )
+        for change in changes:
+            etag = self.guest_client.get(url)['ETag']
+            change()
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+    def test_follow_invalidates_profile(self):
+        """Подписка меняет счётчики и кнопку в профиле автора."""
+        url = reverse(
+            'posts:profile', kwargs={'username': self.author.username})
+        etag = self.reader_client.get(url)['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_authorized_variation(self):
+        """Авторизованный получает свой ETag и не получает Last-Modified;
+        вход пользователя ETag страниц не сбрасывает.
+        """
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        guest = self.guest_client.get(url)
+        reader = self.reader_client.get(url)
+        self.assertNotEqual(guest['ETag'], reader['ETag'])
+        self.assertFalse(reader.has_header('Last-Modified'))
+        response = self.reader_client.get(
+            url, HTTP_IF_NONE_MATCH=guest['ETag'])
+        self.assertEqual(response.status_code, 200)
+        author = User.objects.get(pk=self.author.pk)
+        update_last_login(None, author)
+        response = self.guest_client.get(
+            url, HTTP_IF_NONE_MATCH=guest['ETag'])
+        self.assertEqual(response.status_code, 304)
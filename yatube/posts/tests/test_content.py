@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..management.commands.import_content import Command as ImportCommand
+from ..models import (Comment, FeedEntry, Follow, Group, ImportCheckpoint,
+                      Post, User)
+
+
+class ContentExportImportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='NoNameAuthor')
+        cls.reader = User.objects.create(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(5):
+            post = Post.objects.create(
+                author=cls.author, group=cls.group if i % 2 else None,
+                text=f'Пост {i}')
+            for j in range(i):
+                Comment.objects.create(
+                    post=post, author=cls.reader, text=f'Ответ {i}.{j}')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'content.jsonl')
+        call_command('export_content', self.path, stdout=StringIO())
+        self.snapshot = self.content()
+
+    @staticmethod
+    def content():
+        return {
+            'posts': list(Post.objects.order_by('pub_date').values_list(
+                'author__username', 'group__slug', 'text', 'pub_date',
+                'comments_count')),
+            'comments': sorted(Comment.objects.values_list(
+                'post__text', 'author__username', 'text', 'created')),
+            'follows': list(Follow.objects.values_list(
+                'user__username', 'author__username')),
+            'groups': list(Group.objects.values_list(
+                'slug', 'title', 'posts_count')),
+        }
+
+    def wipe(self):
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        Group.objects.all().delete()
+        User.objects.exclude(username='Reader').delete()
+
+    def test_round_trip(self):
+        """Импорт выгрузки восстанавливает посты, комментарии, подписки,
+        счётчики и ленту, сопоставляя оставшихся пользователей по имени.
+        """
+        reader_pk = self.reader.pk
+        self.wipe()
+        call_command(
+            'import_content', self.path, chunk_size=3, stdout=StringIO())
+        self.assertEqual(self.content(), self.snapshot)
+        self.assertEqual(User.objects.get(username='Reader').pk, reader_pk)
+        self.assertEqual(
+            FeedEntry.objects.filter(user__username='Reader').count(), 5)
+        post = Post.objects.get(text='Пост 4')
+        self.assertEqual(post.comments.count(), 4)
+
+    def test_resume_after_failure(self):
+        """Прерванный импорт продолжается с точки без дублей."""
+        self.wipe()
+        original = ImportCommand.insert_comments
+        calls = []
+
+        def failing(command, records, post_ids):
+            calls.append(records)
+            if len(calls) == 3:
+                raise RuntimeError('обрыв')
+            return original(command, records, post_ids)
+
+        with mock.patch.object(ImportCommand, 'insert_comments', failing):
+            with self.assertRaises(RuntimeError):
+                call_command(
+                    'import_content', self.path, chunk_size=3,
+                    stdout=StringIO())
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertGreater(checkpoint.position, 0)
+        self.assertLess(checkpoint.position, os.path.getsize(self.path))
+        call_command(
+            'import_content', self.path, chunk_size=3, stdout=StringIO())
+        self.assertEqual(self.content(), self.snapshot)
+        call_command(
+            'import_content', self.path, chunk_size=3, stdout=StringIO())
+        self.assertEqual(self.content(), self.snapshot)
@@ -0,0 +1,66 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from ..models import Comment, Follow, Group, Post, User, UserStats
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='NoNameAuthor')
+        cls.reader = User.objects.create(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def assert_counters(self, posts, group_posts, followers, following):
+        stats = UserStats.objects.get(user=self.author)
+        self.group.refresh_from_db()
+        self.assertEqual(stats.posts_count, posts)
+        self.assertEqual(self.group.posts_count, group_posts)
+        self.assertEqual(stats.followers_count, followers)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count,
+            following,
+        )
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются при создании, правке и удалении записей."""
+        post = Post.objects.create(
+            author=self.author, text='Тестовый пост', group=self.group)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assert_counters(1, 1, 1, 1)
+        comment = Comment.objects.create(
+            author=self.reader, post=post, text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        post.group = self.other_group
+        post.save()
+        self.assert_counters(1, 0, 1, 1)
+        self.reader.follower.all().delete()
+        post.delete()
+        self.assert_counters(0, 0, 0, 0)
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.other_group.posts_count, 0)
+
+    def test_reconcile_repairs_drift(self):
+        """reconcile_counters чинит счётчики после bulk_create."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}', group=self.group)
+            for i in range(5)
+        )
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command('reconcile_counters', chunk_size=2, stdout=StringIO())
+        self.assert_counters(5, 5, 0, 0)
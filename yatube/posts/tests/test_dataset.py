@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from .. import counters
+from ..models import Comment, FeedEntry, Follow, Group, Post, User
+from ..urls import urlpatterns
+
+
+class GenerateDatasetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'generate_dataset', users=30, groups=3, posts=300, follows=60,
+            comments=200, seed=1, chunk_size=100, stdout=StringIO())
+
+    def test_sizes(self):
+        """Создано запрошенное число строк."""
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertGreater(Follow.objects.count(), 0)
+
+    def test_dates_follow_ids(self):
+        """Даты постов растут вместе с id и не совпадают."""
+        dates = list(Post.objects.order_by('pk').values_list(
+            'pub_date', flat=True))
+        self.assertEqual(dates, sorted(dates))
+        self.assertEqual(len(set(dates)), len(dates))
+
+    def test_denormalized_data_is_consistent(self):
+        """Счётчики сходятся, ленты подписок заполнены."""
+        self.assertEqual(
+            counters.reconcile(), {'users': 0, 'groups': 0, 'posts': 0})
+        reader = Follow.objects.first().user
+        self.assertTrue(FeedEntry.objects.filter(user=reader).exists())
+
+    def test_bench_views(self):
+        """Замер проходит по всем URL и сохраняет результат в JSON."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        call_command(
+            'bench_views', repeat=1, warmup=0, output=directory,
+            stdout=StringIO())
+        name, = os.listdir(directory)
+        with open(os.path.join(directory, name), encoding='utf-8') as file:
+            report = json.load(file)
+        self.assertEqual(
+            {name.split()[0] for name in report['results']},
+            {pattern.name for pattern in urlpatterns},
+        )
+        self.assertEqual(Post.objects.count(), 300)
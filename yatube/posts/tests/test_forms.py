@@ -2,12 +2,27 @@ from django.urls import reverse
 from http import HTTPStatus
 from django.test import Client, TestCase, override_settings
 from ..models import Group, Post, User, Comment
+from .. import caching, thumbnails
+from ..thumbnails import WIDTHS, formats
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from concurrent.futures import Future
+from io import BytesIO
+from unittest import mock
+from django.core.cache.backends.dummy import DummyCache
+from PIL import Image
 import tempfile
 import shutil
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -44,17 +59,9 @@ class PostURLTests(TestCase):
     def test_create_post_is_valid(self):
         """При отправке валидной формы создаётся новая запись в базе данных."""
         post_count = Post.objects.count()
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
         image = SimpleUploadedFile(
             name='small.gif',
-            content=small_gif,
+            content=SMALL_GIF,
             content_type='image/gif'
         )
         form_data = {
@@ -82,6 +89,80 @@ class PostURLTests(TestCase):
             ).exists()
         )
 
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_create_post_generates_image_variants(self):
+        """После загрузки картинки нарезаются её варианты, а лента
+        выводит их через <picture> с размерами.
+        """
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1500), 'red').save(buffer, 'JPEG')
+        image = SimpleUploadedFile(
+            name='big.jpg',
+            content=buffer.getvalue(),
+            content_type='image/jpeg'
+        )
+        with mock.patch(
+            'posts.thumbnails.transaction.on_commit',
+            side_effect=lambda func: func(),
+        ):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'С картинкой', 'image': image},
+            )
+        post = Post.objects.get(text='С картинкой')
+        self.assertTrue(post.image.name.startswith('posts/big'))
+        variants = post.image_variants.all()
+        self.assertEqual(len(variants), len(WIDTHS) * len(formats()))
+        for variant in variants:
+            self.assertEqual(variant.source, post.image.name)
+            self.assertEqual(
+                Image.open(variant.image).size,
+                (variant.width, variant.height),
+            )
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, '1440w')
+        self.assertContains(response, 'width="960" height="339"')
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_pool_generation_bumps_parent_cache(self):
+        """Поколения после нарезки в пуле сдвигаются в кэше родителя,
+        а не в кэше дочернего процесса.
+        """
+        class ChildPool:
+            def submit(self, fn, *args):
+                future = Future()
+                with mock.patch.object(caching, 'cache', DummyCache('', {})):
+                    future.set_result(fn(*args))
+                return future
+
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400), 'red').save(buffer, 'JPEG')
+        post = Post.objects.create(
+            author=self.author, text='В пуле', image=SimpleUploadedFile(
+                'pool.jpg', buffer.getvalue(), content_type='image/jpeg'))
+        scope = caching.post_scope(post.pk)
+        before = caching.generations([scope])[scope]
+        with mock.patch.object(
+                thumbnails, 'executor', return_value=ChildPool()):
+            thumbnails.submit(post.pk)
+        self.assertTrue(post.image_variants.exists())
+        self.assertNotEqual(caching.generations([scope])[scope], before)
+
+    def test_post_picture_without_variants(self):
+        """Пока вариантов нет, выводится миниатюра sorl с размерами."""
+        image = SimpleUploadedFile(
+            name='small.gif',
+            content=SMALL_GIF,
+            content_type='image/gif'
+        )
+        post = Post.objects.create(
+            author=self.author, text='Без вариантов', image=image)
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertNotContains(response, 'srcset')
+
     def test_edit_post_is_valid(self):
         """При отправке валидной формы происходит изменение поста."""
         form_data = {
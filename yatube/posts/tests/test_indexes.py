@@ -0,0 +1,99 @@
+import re
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..models import Comment, Follow, Group, Post, User
+
+# Полный проход по таблице без индекса: «SCAN posts_post», но не
+# «SCAN posts_post USING INDEX ...».
+FULL_SCAN = re.compile(r'^SCAN [\w"]+$')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+@override_settings(NUM_POST=5)
+class QueryPlanTest(TestCase):
+    """Запросы страниц идут по индексам без полных проходов по таблицам
+    и без сортировки во временном B-дереве.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='NoNameAuthor')
+        cls.reader = User.objects.create(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(12):
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {i}')
+        cls.post = Post.objects.latest('pk')
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def plans(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                yield query['sql'], [row[3] for row in cursor.fetchall()]
+
+    def assert_indexed(self, client, url):
+        for sql, plan in self.plans(client, url):
+            if any('VIRTUAL TABLE' in step for step in plan):
+                # Поиск сортирует по релевантности bm25 - её в индексе нет.
+                continue
+            for step in plan:
+                with self.subTest(url=url, sql=sql, step=step):
+                    self.assertIsNone(FULL_SCAN.match(step))
+                    self.assertNotIn('TEMP B-TREE', step)
+
+    def test_pages_use_indexes(self):
+        pages = (
+            (self.guest_client, reverse('posts:index')),
+            (self.guest_client, reverse('posts:index') + '?page=2'),
+            (self.guest_client, reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug})),
+            (self.guest_client, reverse(
+                'posts:profile', kwargs={'username': self.author.username})),
+            (self.reader_client, reverse(
+                'posts:profile', kwargs={'username': self.author.username})),
+            (self.reader_client, reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk})),
+            (self.reader_client, reverse('posts:follow_index')),
+            (self.guest_client, reverse(
+                'posts:comments', kwargs={'post_id': self.post.pk})),
+            (self.guest_client, reverse('posts:search') + '?q=пост'),
+        )
+        for client, url in pages:
+            self.assert_indexed(client, url)
+
+    def test_cursor_pages_use_indexes(self):
+        for name, kwargs in (
+            ('posts:index', {}),
+            ('posts:group_list', {'slug': self.group.slug}),
+            ('posts:profile', {'username': self.author.username}),
+            ('posts:follow_index', {}),
+        ):
+            url = reverse(name, kwargs=kwargs)
+            response = self.reader_client.get(url)
+            cursor = response.context['page_obj'].next_cursor
+            self.assertIsNotNone(cursor)
+            self.assert_indexed(self.reader_client, f'{url}?cursor={cursor}')
@@ -0,0 +1,79 @@
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from ..models import Comment, Follow, Group, Post, User
+
+PAGE_SIZES = (10, 100, 1000)
+
+
+class QueryBudgetTest(TestCase):
+    """Число запросов каждой страницы не зависит от размера страницы."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(
+            username='NoNameAuthor', first_name='Лев', last_name='Толстой')
+        cls.reader = User.objects.create(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Тестовый пост {i}', author=cls.author,
+                 group=cls.group)
+            for i in range(max(PAGE_SIZES))
+        )
+        cls.post = Post.objects.latest('pk')
+        Comment.objects.bulk_create(
+            Comment(text=f'Комментарий {i}', author=cls.reader,
+                    post=cls.post)
+            for i in range(10)
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def assert_budget(self, client, url, budget):
+        for size in PAGE_SIZES:
+            with self.subTest(url=url, size=size):
+                with override_settings(NUM_POST=size):
+                    with self.assertNumQueries(budget):
+                        response = client.get(url)
+                self.assertEqual(len(response.context['page_obj']), size)
+
+    def test_index_budget(self):
+        """Главная: COUNT и страница."""
+        self.assert_budget(self.guest_client, reverse('posts:index'), 2)
+
+    def test_group_budget(self):
+        """Группа: группа, COUNT и страница - архивная и свежая: по
+        возрастанию дат лента начинается с архива, а он здесь пуст.
+        """
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.assert_budget(self.guest_client, url, 4)
+
+    def test_profile_budget(self):
+        """Профиль: автор, COUNT и страница; для читателя ещё сессия,
+        пользователь и проверка подписки.
+        """
+        url = reverse(
+            'posts:profile', kwargs={'username': self.author.username})
+        self.assert_budget(self.guest_client, url, 3)
+        self.assert_budget(self.reader_client, url, 6)
+
+    def test_follow_index_budget(self):
+        """Лента: сессия, пользователь, COUNT и страница."""
+        self.assert_budget(
+            self.reader_client, reverse('posts:follow_index'), 4)
+
+    def test_post_detail_budget(self):
+        """Пост: пост со счётчиками автора и комментарии."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with self.assertNumQueries(2):
+            self.guest_client.get(url)
@@ -0,0 +1,66 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+from ..models import Group, Post, User
+from ..search import stem
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='NoNameAuthor')
+        cls.other = User.objects.create(username='OtherAuthor')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.cats = Post.objects.create(
+            author=cls.author, group=cls.group,
+            text='Коты, коты и ещё раз коты спят на диване')
+        cls.cat = Post.objects.create(
+            author=cls.other, text='Один кот гулял по крыше')
+        cls.dogs = Post.objects.create(
+            author=cls.author, text='Собаки лают на прохожих')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, **params):
+        response = self.guest_client.get(reverse('posts:search'), params)
+        return list(response.context['page_obj'])
+
+    def test_stem(self):
+        """Стеммер сводит словоформы к общей основе."""
+        self.assertEqual(stem('котами'), stem('коты'))
+        self.assertEqual(stem('собаки'), stem('собакой'))
+
+    def test_search_ranks_and_filters(self):
+        """Поиск находит словоформы, ранжирует и фильтрует."""
+        self.assertEqual(self.search(q='котами'), [self.cats, self.cat])
+        self.assertEqual(
+            self.search(q='кот', group=self.group.slug), [self.cats])
+        self.assertEqual(
+            self.search(q='кот', author=self.other.username), [self.cat])
+        self.assertEqual(self.search(q=''), [])
+
+    def test_index_follows_edit_and_delete(self):
+        """Индекс обновляется при правке и удалении поста."""
+        dogs = Post.objects.get(pk=self.dogs.pk)
+        dogs.text = 'Теперь здесь про котов'
+        dogs.save()
+        self.assertIn(dogs, self.search(q='кот'))
+        self.assertEqual(self.search(q='собака'), [])
+        Post.objects.get(pk=self.cat.pk).delete()
+        self.assertNotIn(self.cat, self.search(q='кот'))
+
+    def test_rebuild_index(self):
+        """rebuild_search_index индексирует посты из bulk_create."""
+        Post.objects.bulk_create([
+            Post(author=self.author, text='Попугаи умеют говорить')])
+        self.assertEqual(self.search(q='попугай'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search(q='попугай')), 1)
@@ -0,0 +1,300 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connections, transaction
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import caching, search, shards
+from ..models import (ArchivedPost, Comment, FeedEntry, Group, Post,
+                      PostLocation, User)
+
+SHARDS = ['shard0', 'shard1']
+
+
+class ShardsTest(TransactionTestCase):
+    databases = {'default', 'shard0', 'shard1'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['default'].enable_constraint_checking()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        shards._authors.clear()
+        # Миграции тестовых баз снова включают внешние ключи, а default
+        # открыт до override_settings: отключаем их, как configure.
+        for alias in self.databases:
+            connections[alias].disable_constraint_checking()
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        # По автору на каждый шард.
+        self.authors = {}
+        number = 0
+        while len(self.authors) < len(SHARDS):
+            author = User.objects.create(username=f'author{number}')
+            self.authors.setdefault(
+                shards.for_author(author.pk, SHARDS), author)
+            number += 1
+        self.reader = User.objects.create(username='Reader')
+
+    def create_posts(self, count):
+        authors = list(self.authors.values())
+        return [
+            Post.objects.create(
+                author=authors[i % len(authors)],
+                text=f'Тестовый пост {i}',
+                group=self.group,
+            )
+            for i in range(count)
+        ]
+
+    def page(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_rendezvous_moves_only_to_new_shard(self):
+        """Новый шард забирает авторов только себе."""
+        for author_id in range(1, 200):
+            before = shards.for_author(author_id, ['a', 'b'])
+            after = shards.for_author(author_id, ['a', 'b', 'c'])
+            self.assertIn(after, {before, 'c'})
+
+    def test_bump_waits_for_commit(self):
+        """Поколения сдвигаются только после коммита записи, в том числе
+        когда пост пишется в шард, а лента - в default.
+        """
+        for setting in ([], SHARDS):
+            with self.subTest(shards=setting), \
+                    override_settings(SHARDS=setting):
+                before = caching.generations([caching.GLOBAL])
+                with transaction.atomic():
+                    self.create_posts(1)
+                    self.assertEqual(
+                        caching.generations([caching.GLOBAL]), before)
+                self.assertNotEqual(
+                    caching.generations([caching.GLOBAL]), before)
+
+    @override_settings(SHARDS=SHARDS)
+    def test_default_only_commands_refuse(self):
+        """Команды, читающие посты только из default, не запускаются
+        при шардировании, а не обрабатывают ноль постов.
+        """
+        for args in (['export_content', '-'], ['pregenerate_thumbnails']):
+            with self.subTest(command=args[0]):
+                with self.assertRaises(CommandError):
+                    call_command(*args, stdout=StringIO())
+
+    def test_shards_have_indexes(self):
+        """Индексы лент и комментариев построены и на шардах."""
+        for alias in SHARDS:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index'")
+                names = {row[0] for row in cursor.fetchall()}
+            self.assertLessEqual({
+                'post_pub_date_idx',
+                'post_group_pub_date_idx',
+                'post_author_pub_date_idx',
+                'comment_post_created_idx',
+            }, names, alias)
+            self.assertNotIn('feed_user_date_idx', names)
+
+    @override_settings(SHARDS=SHARDS)
+    def test_posts_live_on_author_shard(self):
+        """Пост, его комментарии и адрес лежат там, где ждёт роутер."""
+        posts = self.create_posts(4)
+        for post in posts:
+            alias = shards.for_author(post.author_id)
+            self.assertEqual(post._state.db, alias)
+            self.assertEqual(shards.for_post(post.pk), alias)
+            self.assertTrue(
+                Post.objects.using(alias).filter(pk=post.pk).exists())
+        self.assertFalse(Post.objects.using('default').exists())
+        self.assertEqual(PostLocation.objects.count(), len(posts))
+        self.assertEqual(
+            len({post.pk for post in posts}), len(posts))
+        self.client.force_login(self.reader)
+        post = posts[1]
+        response = self.client.post(
+            reverse('posts:add_comment', args=[post.pk]),
+            {'text': 'Комментарий'})
+        self.assertEqual(response.status_code, 302)
+        comment = Comment.objects.using(post._state.db).get()
+        self.assertEqual(comment.post_id, post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk]))
+        self.assertContains(response, 'Комментарий')
+
+    @override_settings(SHARDS=SHARDS)
+    def test_index_merges_shards(self):
+        """Главная и группа собирают упорядоченную ленту со всех шардов,
+        в том числе на глубоких страницах и по курсору.
+        """
+        posts = [post.pk for post in self.create_posts(25)]
+        for url, expected in (
+            (reverse('posts:index'), posts[::-1]),
+            (reverse('posts:group_list', args=[self.group.slug]), posts),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.page(url), expected[:10])
+                self.assertEqual(self.page(url, page=2), expected[10:20])
+                self.assertEqual(self.page(url, page=3), expected[20:])
+                response = self.client.get(url)
+                cursor = response.context['page_obj'].next_cursor
+                self.assertEqual(
+                    self.page(url, cursor=cursor), expected[10:20])
+                self.assertEqual(
+                    response.context['page_obj'].paginator.count, 25)
+
+    @override_settings(SHARDS=SHARDS)
+    def test_unknown_id_is_not_remembered(self):
+        """Запрос поста до его создания не прячет пост после."""
+        # AUTOINCREMENT: следующий id - после последнего выданного.
+        with connections['default'].cursor() as cursor:
+            cursor.execute(
+                'SELECT seq FROM sqlite_sequence WHERE name = %s',
+                [PostLocation._meta.db_table])
+            row = cursor.fetchone()
+        post_id = (row[0] if row else 0) + 1
+        url = reverse('posts:post_detail', args=[post_id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        post = self.create_posts(1)[0]
+        self.assertEqual(post.pk, post_id)
+        cache.clear()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(SHARDS=SHARDS)
+    def test_search_and_api(self):
+        """Поиск и JSON API находят посты на шардах."""
+        with connections['default'].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+        first, second = self.authors.values()
+        walks = Post.objects.create(
+            author=first, group=self.group, text='Кошка гуляет')
+        sleeps = Post.objects.create(author=second, text='Кошки спят')
+        url = reverse('posts:search')
+        for params, expected in (
+            ({'q': 'кошка'}, {walks.pk, sleeps.pk}),
+            ({'q': 'кошка', 'group': self.group.slug}, {walks.pk}),
+            ({'q': 'кошка', 'author': second.username}, {sleeps.pk}),
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                page = response.context['page_obj']
+                self.assertEqual({post.pk for post in page}, expected)
+                self.assertEqual(page.paginator.count, len(expected))
+        for url, expected in (
+            (reverse('api:index'), [sleeps.pk, walks.pk]),
+            (reverse('api:group_list', args=[self.group.slug]), [walks.pk]),
+            (reverse('api:profile', args=[second.username]), [sleeps.pk]),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'fields': 'id,author'})
+                self.assertEqual(
+                    [post['id'] for post in response.json()['results']],
+                    expected)
+        response = self.client.get(
+            reverse('api:post_detail', args=[walks.pk]))
+        self.assertEqual(response.json()['text'], 'Кошка гуляет')
+        self.client.force_login(self.reader)
+        self.client.get(
+            reverse('posts:profile_follow', args=[first.username]))
+        response = self.client.get(reverse('api:follow_index'))
+        self.assertEqual(
+            [post['id'] for post in response.json()['results']], [walks.pk])
+
+    @override_settings(SHARDS=SHARDS)
+    def test_profile_and_follow(self):
+        """Профиль читает шард автора, лента подписок - шарды постов."""
+        posts = self.create_posts(6)
+        author = posts[0].author
+        own = [post.pk for post in reversed(posts)
+               if post.author_id == author.pk]
+        self.assertEqual(
+            self.page(reverse('posts:profile', args=[author.username])),
+            own)
+        self.client.force_login(self.reader)
+        for author in self.authors.values():
+            self.client.get(
+                reverse('posts:profile_follow', args=[author.username]))
+        self.assertEqual(FeedEntry.objects.count(), len(posts))
+        self.assertEqual(
+            self.page(reverse('posts:follow_index')),
+            [post.pk for post in reversed(posts)])
+        self.client.get(
+            reverse('posts:profile_unfollow', args=[author.username]))
+        # Не post__author: JOIN с пустой posts_post в default.
+        unfollowed = [
+            post.pk for post in posts if post.author_id == author.pk]
+        self.assertFalse(FeedEntry.objects.filter(
+            post_id__in=unfollowed).exists())
+        self.assertEqual(
+            FeedEntry.objects.count(), len(posts) - len(unfollowed))
+
+    @override_settings(SHARDS=SHARDS)
+    def test_archive_on_shards(self):
+        """Архив лежит на шарде автора, профиль и группа листают его."""
+        posts = self.create_posts(4)
+        for post in posts[:2]:
+            Post.objects.using(post._state.db).filter(pk=post.pk).update(
+                pub_date=timezone.now() - timedelta(days=800))
+        call_command('archive_posts', '--pause', '0', stdout=StringIO())
+        for post in posts[:2]:
+            self.assertTrue(ArchivedPost.objects.using(
+                post._state.db).filter(pk=post.pk).exists())
+        author = posts[0].author
+        self.assertEqual(
+            self.page(reverse('posts:profile', args=[author.username])),
+            [posts[2].pk, posts[0].pk])
+        self.assertEqual(
+            self.page(reverse('posts:group_list', args=[self.group.slug])),
+            [post.pk for post in posts])
+        response = self.client.get(
+            reverse('posts:post_detail', args=[posts[0].pk]))
+        self.assertEqual(response.context['post'].pk, posts[0].pk)
+
+    def test_rebalance_moves_authors(self):
+        """rebalance_shards раскладывает посты по шардам после смены
+        SHARDS, в том числе созданные без шардирования.
+        """
+        with override_settings(SHARDS=[]):
+            legacy = self.create_posts(3)
+        with override_settings(SHARDS=['shard0']):
+            call_command(
+                'rebalance_shards', '--from', 'default', stdout=StringIO())
+            self.assertEqual(PostLocation.objects.count(), len(legacy))
+            posts = self.create_posts(4)
+            Comment.objects.create(
+                author=self.reader, post=posts[1], text='Комментарий')
+        self.assertEqual(Post.objects.using('shard0').count(), 7)
+        with override_settings(SHARDS=SHARDS):
+            call_command('rebalance_shards', stdout=StringIO())
+            shards._authors.clear()
+            for post in legacy + posts:
+                alias = shards.for_post(post.pk)
+                self.assertEqual(alias, shards.for_author(post.author_id))
+                self.assertTrue(
+                    Post.objects.using(alias).filter(pk=post.pk).exists())
+            self.assertFalse(Post.objects.using('default').exists())
+            self.assertEqual(
+                sum(Post.objects.using(alias).count() for alias in SHARDS),
+                len(legacy + posts))
+            comment = Comment.objects.using(
+                shards.for_post(posts[1].pk)).get()
+            self.assertEqual(comment.post_id, posts[1].pk)
+            expected = [post.pk for post in reversed(legacy + posts)]
+            self.assertEqual(self.page(reverse('posts:index')), expected)
+            output = StringIO()
+            call_command('rebalance_shards', stdout=output)
+            self.assertIn('Перенесено авторов 0', output.getvalue())
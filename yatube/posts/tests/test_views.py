@@ -1,12 +1,18 @@
 from django.urls import reverse
 from django import forms
 from django.test import Client, TestCase, override_settings
-from ..models import Group, Post, User, Follow
+from core import jobs
+from core.models import Job
+
+from .. import counters
+from ..models import Comment, Group, Post, User, Follow, UserStats
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.core.cache import cache
 import tempfile
 import shutil
+from django.utils import timezone
+from django.utils.formats import date_format
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -56,6 +62,92 @@ class Paginator_view_test(TestCase):
                     page_two
                 )
 
+    def test_cursor_pagination(self):
+        """По курсорам страницы листаются вперёд и назад без пропусков."""
+        url = reverse('posts:index')
+        first = self.unauthorized_client.get(url).context['page_obj']
+        self.assertIsNone(first.previous_cursor)
+        second = self.unauthorized_client.get(
+            url, {'cursor': first.next_cursor}).context['page_obj']
+        self.assertEqual(len(second), 3)
+        self.assertIsNone(second.next_cursor)
+        self.assertEqual(
+            [post.pk for post in first] + [post.pk for post in second],
+            [post.pk for post in Post.objects.order_by('-pub_date', '-pk')]
+        )
+        back = self.unauthorized_client.get(
+            url, {'cursor': second.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back), list(first))
+        self.assertIsNone(back.previous_cursor)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор открывает первую страницу."""
+        response = self.unauthorized_client.get(
+            reverse('posts:index'), {'cursor': 'broken'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_post_card(self):
+        """Карточка ссылается на автора, группу и пост и показывает дату."""
+        cache.clear()
+        response = self.unauthorized_client.get(reverse('posts:index'))
+        post = response.context['page_obj'][0]
+        self.assertEqual(
+            post.url, reverse('posts:post_detail', args=[post.pk]))
+        self.assertEqual(post.pub_date_text, date_format(
+            timezone.localtime(post.pub_date), 'd E Y'))
+        self.assertContains(response, post.url)
+        self.assertContains(response, reverse(
+            'posts:profile', args=[self.author.username]), count=10)
+        self.assertContains(response, reverse(
+            'posts:group_list', args=[self.group.slug]), count=10)
+        self.assertContains(response, post.pub_date_text)
+
+    @override_settings(NUM_POST=1)
+    def test_page_window(self):
+        """Ссылки есть на первую, последнюю и соседние страницы,
+        остальные пропущены.
+        """
+        url = reverse('posts:index')
+        cases = {
+            1: [1, 2, 3, None, 13],
+            7: [1, None, 5, 6, 7, 8, 9, None, 13],
+            12: [1, None, 10, 11, 12, 13],
+        }
+        for number, window in cases.items():
+            with self.subTest(number=number):
+                response = self.unauthorized_client.get(url, {'page': number})
+                self.assertEqual(
+                    response.context['page_obj'].page_window, window)
+        self.assertContains(response, '&hellip;', count=1)
+        self.assertNotContains(response, '?page=5"')
+
+    @override_settings(COUNT_ESTIMATE_MIN=10, JOBS_QUEUE=True)
+    def test_estimated_count(self):
+        """Большие выборки берут число строк из кэша и счётчиков,
+        устаревший подсчёт главной обновляет фоновая задача.
+        """
+        cache.clear()
+        url = reverse('posts:index')
+        # Первый подсчёт точный и заменяет COUNT пагинатора.
+        with self.assertNumQueries(2):
+            response = self.unauthorized_client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+        Post.objects.order_by('pk').first().delete()
+        response = self.unauthorized_client.get(url, {'page': 2})
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+        self.assertEqual(len(response.context['page_obj']), 2)
+        cache.delete(counters.POSTS_TOTAL_FRESH_KEY)
+        self.unauthorized_client.get(url)
+        job = Job.objects.get()
+        self.assertEqual(job.key, counters.POSTS_TOTAL_KEY)
+        jobs.perform(job.name, job.payload)
+        response = self.unauthorized_client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 12)
+        UserStats.objects.filter(user=self.author).update(posts_count=40)
+        response = self.unauthorized_client.get(
+            reverse('posts:profile', args=[self.author.username]))
+        self.assertEqual(response.context['page_obj'].paginator.count, 40)
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostURLTests(TestCase):
@@ -248,3 +340,78 @@ class PostURLTests(TestCase):
             )
         )
         self.assertEqual(Follow.objects.count(), count_follow)
+
+    def test_follow_index_feed(self):
+        """Лента подписок заполняется при подписке и новых постах
+        и очищается при отписке.
+        """
+        url = reverse('posts:follow_index')
+        self.authorized_client.get(
+            reverse(
+                'posts:profile_follow',
+                kwargs={'username': self.author.username}
+            )
+        )
+        response = self.authorized_client.get(url)
+        self.assertIn(self.post, response.context['page_obj'])
+        new_post = Post.objects.create(
+            author=self.author,
+            text='Новый пост в ленте',
+        )
+        response = self.authorized_client.get(url)
+        self.assertEqual(response.context['page_obj'][0], new_post)
+        self.authorized_client.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.author.username}
+            )
+        )
+        response = self.authorized_client.get(url)
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+
+@override_settings(COMMENTS_PAGE_SIZE=5)
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='NoNameAuthor')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        for i in range(12):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'Комментарий {i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_first_page(self):
+        """На странице поста - первая страница комментариев и ссылка
+        на следующую.
+        """
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [f'Комментарий {i}' for i in range(5)])
+        self.assertContains(response, 'Комментарии (12)')
+        self.assertContains(response, 'data-more-comments')
+
+    def test_fragments(self):
+        """Фрагменты по ссылкам «Показать ещё» отдают остальные
+        комментарии по порядку, последний - без ссылки.
+        """
+        first = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        url = reverse('posts:comments', kwargs={'post_id': self.post.pk})
+        url += '?cursor=' + first.context['comments'].next_cursor
+        texts = []
+        while url:
+            response = self.client.get(url)
+            self.assertTemplateUsed(response, 'posts/includes/comments.html')
+            self.assertNotContains(response, '<html')
+            page = response.context['comments']
+            texts += [comment.text for comment in page]
+            url = page.next_cursor and (
+                reverse('posts:comments', kwargs={'post_id': self.post.pk})
+                + '?cursor=' + page.next_cursor)
+        self.assertEqual(texts, [f'Комментарий {i}' for i in range(5, 12)])
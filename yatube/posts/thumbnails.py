@@ -0,0 +1,246 @@
+"""Варианты картинок постов.
+
+Для каждой картинки один раз нарезается набор копий нескольких ширин
+(WIDTHS) в современных форматах, которые умеет сохранять установленный
+Pillow (AVIF, WebP), и в JPEG для остальных браузеров. Набор хранится
+в PostImageVariant, а тег {% post_picture %} выводит его как <picture>
+со srcset и размерами. Нарезка идёт в фоновом пуле процессов (с JOBS_QUEUE -
+в очереди core.jobs) сразу после сохранения картинки; пока набора нет,
+показывается миниатюра sorl.
+"""
+import logging
+import math
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.engines.pil_engine import Engine
+
+from core import jobs, timing
+from core.jobs import process_pool
+
+from . import caching, shards
+from .models import Post, PostImageVariant
+
+logger = logging.getLogger(__name__)
+
+# Пропорции и размер карточки, как у прежней миниатюры 960x339.
+FALLBACK = ('960x339', {'crop': 'center', 'upscale': True})
+ASPECT = 960 / 339
+WIDTHS = (480, 960, 1440)
+DEFAULT_WIDTH = 960
+SIZES = '(max-width: 960px) 100vw, 960px'
+
+# Формат Pillow, MIME-тип, расширение и параметры сохранения; JPEG
+# последним - это запасной вариант для <img>.
+_FORMATS = (
+    ('AVIF', 'image/avif', 'avif', {'quality': 60}),
+    ('WEBP', 'image/webp', 'webp', {'quality': 75, 'method': 4}),
+    ('JPEG', 'image/jpeg', 'jpg',
+     {'quality': 80, 'optimize': True, 'progressive': True}),
+)
+# Порядок <source> в <picture>: браузер берёт первый знакомый тип.
+MIME_TYPES = tuple(fmt[1] for fmt in _FORMATS)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def formats():
+    """Форматы из _FORMATS, которые установленный Pillow умеет сохранять."""
+    Image.init()
+    return [fmt for fmt in _FORMATS if fmt[0] in Image.SAVE]
+
+
+class DraftEngine(Engine):
+    """Движок PIL, который декодирует JPEG сразу в уменьшенном масштабе.
+
+    Image.draft() просит декодер JPEG отдать картинку в 1/2, 1/4 или 1/8
+    от исходного размера, но не меньше нужного для миниатюры: большие
+    фотографии декодируются в разы быстрее и занимают меньше памяти.
+    """
+
+    def create(self, image, geometry, options):
+        if image.format == 'JPEG' and not options.get('cropbox'):
+            self._draft(image, geometry, options)
+        return super().create(image, geometry, options)
+
+    def _draft(self, image, geometry, options):
+        width, height = image.size
+        if self.flip_dimensions(image, options=options):
+            width, height = height, width
+        factor = self._calculate_scaling_factor(
+            width, height, geometry, options)
+        if factor >= 1:
+            return
+        image.draft(image.mode, (
+            math.ceil(image.size[0] * factor),
+            math.ceil(image.size[1] * factor),
+        ))
+
+
+class TimedBackend(ThumbnailBackend):
+    """Бэкенд sorl, который засекает генерацию миниатюр (core.timing)."""
+
+    def _create_thumbnail(self, *args, **kwargs):
+        with timing.phase(timing.THUMBNAIL):
+            return super()._create_thumbnail(*args, **kwargs)
+
+
+def _crop_box(width, height):
+    """Центральная область с пропорциями ASPECT."""
+    if width / height > ASPECT:
+        crop_width = round(height * ASPECT)
+        left = (width - crop_width) // 2
+        return left, 0, left + crop_width, height
+    crop_height = round(width / ASPECT)
+    top = (height - crop_height) // 2
+    return 0, top, width, top + crop_height
+
+
+def _open(file):
+    image = Image.open(file)
+    if image.format == 'JPEG':
+        # Декодируем не крупнее, чем нужно для самой широкой копии,
+        # при любой ориентации из EXIF.
+        width, height = image.size
+        factor = max(
+            WIDTHS[-1] / (box[2] - box[0])
+            for box in (_crop_box(width, height), _crop_box(height, width))
+        )
+        if factor < 1:
+            image.draft('RGB', (
+                math.ceil(width * factor), math.ceil(height * factor)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return image.crop(_crop_box(*image.size))
+
+
+def _widths(source_width):
+    """Ширины копий: не больше исходной, но хотя бы одна."""
+    return [
+        width for width in WIDTHS if width <= source_width
+    ] or [WIDTHS[0]]
+
+
+def make_variants(post_id):
+    """Нарезает набор вариантов для текущей картинки поста.
+
+    Возвращает области кэша, поколения которых нужно сдвинуть: в пуле
+    процессов это делает родитель: у дочернего процесса свой локальный кэш.
+    """
+    post = Post.objects.using(shards.for_post(post_id)).filter(
+        pk=post_id).first()
+    if post is None or not post.image:
+        return ()
+    source = post.image.name
+    if post.image_variants.filter(source=source).exists():
+        return ()
+    with post.image.open('rb') as file:
+        image = _open(file)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    variants = []
+    for width in _widths(image.width):
+        height = round(width / ASPECT)
+        resized = image.resize((width, height), Image.LANCZOS)
+        for name, mime_type, extension, params in formats():
+            buffer = BytesIO()
+            resized.save(buffer, name, **params)
+            variant = PostImageVariant(
+                post=post, source=source, mime_type=mime_type,
+                width=width, height=height)
+            variant.image.save(
+                f'{post.pk}/{stem}-{width}.{extension}',
+                ContentFile(buffer.getvalue()), save=False)
+            variants.append(variant)
+    stale = list(post.image_variants.exclude(source=source))
+    using = post._state.db
+    with transaction.atomic(using=using):
+        PostImageVariant.objects.using(using).filter(
+            pk__in=[variant.pk for variant in stale]).delete()
+        PostImageVariant.objects.using(using).bulk_create(variants)
+    for variant in stale:
+        variant.image.delete(save=False)
+    return (caching.GLOBAL, *caching.post_scopes(post))
+
+
+def generate(post_id):
+    """Нарезает варианты в текущем процессе и сдвигает поколения."""
+    scopes = make_variants(post_id)
+    if scopes:
+        caching.bump(*scopes)
+
+
+def attach_variants(posts):
+    """Проставляет постам с картинкой picture_variants одним запросом."""
+    posts = [post for post in posts if post.image]
+    if not posts:
+        return
+    # Посты страницы могут быть из разных шардов.
+    by_database = defaultdict(list)
+    for post in posts:
+        by_database[post._state.db].append(post)
+    variants = defaultdict(list)
+    for using, group in by_database.items():
+        # По id: у архивных постов (posts.archive) вариантов нет.
+        for variant in PostImageVariant.objects.using(using).filter(
+                post_id__in=[post.pk for post in group]):
+            variants[variant.post_id].append(variant)
+    for post in posts:
+        post.picture_variants = [
+            variant for variant in variants[post.pk]
+            if variant.source == post.image.name
+        ]
+
+
+def executor(renew=False):
+    """Пул текущего процесса, создаётся при первом обращении."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if renew or _executor is None or _executor_pid != os.getpid():
+            _executor = process_pool(settings.THUMBNAIL_WORKERS)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _done(future):
+    if future.exception() is not None:
+        logger.error(
+            'Не удалось нарезать картинку', exc_info=future.exception())
+    elif future.result():
+        caching.bump(*future.result())
+
+
+def submit(post_id):
+    if settings.JOBS_QUEUE:
+        # Нарезку выполнит run_workers; пока набор ждёт в очереди,
+        # повторная загрузка картинки не ставит его второй раз.
+        jobs.enqueue(generate, [post_id], key=f'thumbnails:{post_id}')
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        with timing.phase(timing.THUMBNAIL):
+            generate(post_id)
+        return
+    try:
+        future = executor().submit(make_variants, post_id)
+    except BrokenProcessPool:
+        # Воркер пула упал (например, по памяти) - пул больше не принимает
+        # задач, поэтому создаём новый.
+        future = executor(renew=True).submit(make_variants, post_id)
+    future.add_done_callback(_done)
+
+
+def schedule(post):
+    """Ставит нарезку вариантов картинки поста в очередь после коммита."""
+    if post.image:
+        post_id = post.pk
+        transaction.on_commit(lambda: submit(post_id))
@@ -0,0 +1,95 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост сразу раскладывается в ленты подписчиков автора, поэтому
+чтение /follow/ - это один диапазонный поиск по индексу (user, pub_date)
+вместо соединения Post и Follow. В ленте хранится не больше FEED_SIZE
+последних записей: лишнее подрезается раз в FEED_TRIM_EVERY постов.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import shards
+from .models import FeedEntry, Follow, Post
+
+# Коммит на каждого читателя стоил бы fsync, поэтому rebuild_all
+# собирает ленты пачками в одной транзакции.
+FEEDS_PER_TRANSACTION = 200
+
+
+def trim(user_id):
+    """Удаляет из ленты записи старше окна FEED_SIZE."""
+    stale = FeedEntry.objects.filter(user_id=user_id).order_by(
+        '-pub_date', '-pk').values_list('pk', flat=True)[settings.FEED_SIZE:]
+    FeedEntry.objects.filter(pk__in=list(stale)).delete()
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты всех подписчиков автора."""
+    followers = list(Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers
+        ],
+        ignore_conflicts=True,
+    )
+    if post.pk % settings.FEED_TRIM_EVERY == 0:
+        for user_id in followers:
+            trim(user_id)
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту последними постами автора после подписки."""
+    posts = Post.objects.using(shards.for_author(author_id)).filter(
+        author_id=author_id).order_by('-pub_date', '-pk').values_list(
+        'pk', 'pub_date')
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts[:settings.FEED_SIZE]
+        ],
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    if settings.SHARDS:
+        # Посты на шарде - соединить с ними ленту в default нельзя.
+        posts = list(Post.objects.using(shards.for_author(author_id)).filter(
+            author_id=author_id).values_list('pk', flat=True))
+        FeedEntry.objects.filter(user_id=user_id, post_id__in=posts).delete()
+        return
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    """Собирает ленту заново из постов всех авторов, на которых подписан
+    пользователь: один INSERT ... SELECT вместо backfill по каждой подписке.
+    """
+    FeedEntry.objects.filter(user_id=user_id).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {FeedEntry._meta.db_table} '
+            '(user_id, post_id, pub_date) '
+            f'SELECT %s, id, pub_date FROM {Post._meta.db_table} '
+            'WHERE author_id IN ('
+            f'SELECT author_id FROM {Follow._meta.db_table} '
+            'WHERE user_id = %s) '
+            'ORDER BY pub_date DESC, id DESC LIMIT %s',
+            [user_id, user_id, settings.FEED_SIZE],
+        )
+
+
+def rebuild_all():
+    """Пересобирает ленты всех, у кого есть подписки."""
+    readers = list(Follow.objects.order_by().values_list(
+        'user_id', flat=True).distinct())
+    for start in range(0, len(readers), FEEDS_PER_TRANSACTION):
+        with transaction.atomic():
+            for user_id in readers[start:start + FEEDS_PER_TRANSACTION]:
+                rebuild(user_id)
+    return len(readers)
@@ -1,8 +1,218 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.core.paginator import Page, Paginator
 from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.formats import date_format
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, value, pk):
+    """Упаковывает позицию (direction, key, pk) в непрозрачную строку."""
+    raw = f'{direction}|{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор; для битого курсора возвращает None."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, value, pk = raw.decode().split('|')
+        if direction not in (NEXT, PREVIOUS):
+            return None
+        return direction, datetime.fromisoformat(value), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Временно отключает auto_now_add, чтобы bulk_create сохранил даты."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def lookup(request, queryset, **lookup):
+    """get_object_or_404 не чаще раза за запрос: объект нужен и для
+    валидаторов условного GET, и самой вьюхе.
+    """
+    lookups = request.__dict__.setdefault('_lookups', {})
+    key = (queryset.model, tuple(sorted(lookup.items())))
+    if key not in lookups:
+        # Промах тоже запоминается: за ним может идти поиск в архиве.
+        try:
+            lookups[key] = get_object_or_404(queryset, **lookup)
+        except Http404 as error:
+            lookups[key] = error
+    if isinstance(lookups[key], Http404):
+        raise lookups[key]
+    return lookups[key]
+
+
+def prepare_cards(posts):
+    """Заранее вычисляет для карточек постов ссылки, имя автора и дату.
+
+    Иначе шаблон карточки считал бы для каждой {% url %}, get_full_name
+    и фильтр date; авторы, группы и дни на странице повторяются, поэтому
+    каждое значение считается один раз.
+    """
+    authors, groups, dates = {}, {}, {}
+    for post in posts:
+        author = post.author
+        if author.pk not in authors:
+            authors[author.pk] = (
+                reverse('posts:profile', args=[author.username]),
+                author.get_full_name(),
+            )
+        post.author_url, post.author_name = authors[author.pk]
+        if post.group_id is not None:
+            if post.group_id not in groups:
+                groups[post.group_id] = reverse(
+                    'posts:group_list', args=[post.group.slug])
+            post.group_url = groups[post.group_id]
+        day = timezone.localtime(post.pub_date).date()
+        if day not in dates:
+            dates[day] = date_format(day, 'd E Y')
+        post.pub_date_text = dates[day]
+        post.url = reverse('posts:post_detail', args=[post.pk])
+
+
+class WindowedPaginator(Paginator):
+    """Paginator, страницы которого знают page_window - номера первой,
+    последней и ON_EACH_SIDE соседних страниц, а вместо пропущенных None.
+
+    У главной сотни тысяч страниц, ссылка на каждую не нужна.
+    """
+    ON_EACH_SIDE = 2
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            # Готовое число строк (счётчик или оценка) вместо COUNT(*).
+            self.count = count
+
+    def page_window(self, number):
+        last = self.num_pages
+        window = list(range(
+            max(number - self.ON_EACH_SIDE, 1),
+            min(number + self.ON_EACH_SIDE, last) + 1,
+        ))
+        if window[0] > 2:
+            window.insert(0, None)
+        if window[0] != 1:
+            window.insert(0, 1)
+        if window[-1] < last - 1:
+            window.append(None)
+        if window[-1] != last:
+            window.append(last)
+        return window
+
+    def _get_page(self, object_list, number, paginator):
+        page = super()._get_page(object_list, number, paginator)
+        page.page_window = self.page_window(number)
+        return page
+
+
+class KeysetPaginator(WindowedPaginator):
+    """Пагинатор, который умеет листать по курсору (key, pk) без OFFSET.
+
+    Номерные страницы работают как у обычного Paginator, но каждая
+    страница дополнительно получает next_cursor/previous_cursor: переход
+    по ним ищет строки по индексу от последней показанной записи, поэтому
+    не зависит от глубины и не сбивается при появлении новых постов.
+    """
+
+    def __init__(self, object_list, per_page, key='pub_date',
+                 descending=True, transform=None, **kwargs):
+        self.key = key
+        self.descending = descending
+        self.transform = transform
+        super().__init__(self._ordered(object_list), per_page, **kwargs)
+
+    def _ordered(self, object_list, backward=False):
+        sign = '-' if self.descending != backward else ''
+        return object_list.order_by(f'{sign}{self.key}', f'{sign}pk')
+
+    def _seek(self, value, pk, backward):
+        lookup = 'lt' if self.descending != backward else 'gt'
+        return self._ordered(self.object_list, backward).filter(
+            Q(**{f'{self.key}__{lookup}': value})
+            | Q(**{self.key: value, f'pk__{lookup}': pk})
+        )
+
+    def _cursor(self, direction, row):
+        return encode_cursor(direction, getattr(row, self.key), row.pk)
+
+    def _make_page(self, rows, number, has_previous, has_next):
+        objects = rows
+        if self.transform is not None:
+            objects = [self.transform(row) for row in rows]
+        page = Page(objects, number, self)
+        page.previous_cursor = None
+        page.next_cursor = None
+        if rows and has_previous:
+            page.previous_cursor = self._cursor(PREVIOUS, rows[0])
+        if rows and has_next:
+            page.next_cursor = self._cursor(NEXT, rows[-1])
+        return page
+
+    def _get_page(self, object_list, number, paginator):
+        page = self._make_page(
+            list(object_list), number,
+            number > 1, number < self.num_pages,
+        )
+        page.page_window = self.page_window(number)
+        return page
+
+    def get_cursor_page(self, cursor):
+        """Страница после/до курсора; number у неё None, COUNT не нужен.
+
+        Битый или пустой курсор, как и в get_page, даёт первую страницу.
+        """
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            rows = list(self.object_list[:self.per_page + 1])
+            return self._make_page(
+                rows[:self.per_page], None, False,
+                len(rows) > self.per_page,
+            )
+        direction, value, pk = decoded
+        backward = direction == PREVIOUS
+        rows = list(self._seek(value, pk, backward)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backward:
+            rows.reverse()
+            return self._make_page(rows, None, has_more, True)
+        return self._make_page(rows, None, True, has_more)
+
 
+def pagination(request, post_list, count=None, **kwargs):
+    """Страница по номеру или курсору из запроса.
 
-def pagination(request, post_list):
-    paginator = Paginator(post_list, settings.NUM_POST)
+    count() - число строк вместо COUNT(*) или None; нужно только
+    номерным страницам.
+    """
+    cursor = request.GET.get('cursor')
+    if cursor:
+        paginator = KeysetPaginator(post_list, settings.NUM_POST, **kwargs)
+        return paginator.get_cursor_page(cursor)
+    paginator = KeysetPaginator(
+        post_list, settings.NUM_POST,
+        count=count() if count is not None else None, **kwargs)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
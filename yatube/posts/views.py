@@ -1,74 +1,215 @@
+from operator import attrgetter
+
+from django.conf import settings
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import urlencode
+
+from core import writer
+from core.ratelimit import ratelimit
+
 from .models import Post, Group, User, Follow
 from .forms import PostForm, CommentForm
-from .utils import pagination
+from . import archive, caching, counters, shards, thumbnails
+from .counters import get_stats
+from .search import SearchResults
+from .utils import (KeysetPaginator, WindowedPaginator, lookup, pagination,
+                    prepare_cards)
+
+# Бюджеты запросов в докстрингах - для страниц без картинок; если картинки
+# есть, их варианты добавляют ещё один запрос (thumbnails.attach_variants).
+# Ответ 304 стоит только запроса за объектом страницы, если он нужен.
+
+
+def _group_scopes(request, slug):
+    group = lookup(request, Group.objects.all(), slug=slug)
+    return [caching.group_scope(group.pk), caching.PROFILES]
+
 
+def _profile_scopes(request, username):
+    author = lookup(
+        request, User.objects.select_related('stats'), username=username)
+    return [
+        caching.author_scope(author.pk),
+        caching.follow_scope(author.pk),
+        caching.PROFILES,
+    ]
 
+
+def _post_scopes(request, post_id):
+    post = archive.post(request, post_id)
+    return [
+        caching.post_scope(post.pk),
+        caching.author_scope(post.author_id),
+        caching.PROFILES,
+    ]
+
+
+@caching.conditional(_group_scopes)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.all().filter(
-        group=group).order_by('pub_date')
-    page_obj = pagination(request, post_list)
+    """Посты группы: 4 запроса - группа, COUNT и страница с JOIN автора
+    в двух запросах: лента по возрастанию дат начинается с архива
+    и добирается свежими постами. У больших групп вместо COUNT счётчик.
+    """
+    group = lookup(request, Group.objects.all(), slug=slug)
+    post_list = archive.posts(group=group)
+    page_obj = pagination(
+        request, post_list, descending=False,
+        count=lambda: counters.estimate(group.posts_count))
+    thumbnails.attach_variants(page_obj)
+    prepare_cards(page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
+        'cache_version': caching.annotate_versions(
+            page_obj, caching.group_scope(group.pk)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@caching.conditional(lambda request: [caching.GLOBAL, caching.PROFILES])
 def index(request):
-    post_list = Post.objects.all().order_by('-pub_date')
-    page_obj = pagination(request, post_list)
+    """Главная: 2 запроса - COUNT и страница с JOIN автора и группы;
+    при COUNT_ESTIMATE_MIN постов и больше число берётся из кэша.
+    """
+    post_list = shards.posts()
+    page_obj = pagination(request, post_list, count=counters.posts_total)
+    thumbnails.attach_variants(page_obj)
+    prepare_cards(page_obj)
     context = {
         'page_obj': page_obj,
+        'cache_version': caching.annotate_versions(page_obj, caching.GLOBAL),
     }
     return render(request, 'posts/index.html', context)
 
 
+@caching.conditional(_profile_scopes)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    page_obj = pagination(request, post_list)
+    """Профиль: 3 запроса - автор со счётчиками, COUNT и страница
+    с JOIN группы; авторизованному ещё один - проверка подписки.
+    У авторов с большим числом постов вместо COUNT счётчик.
+    """
+    author = lookup(
+        request, User.objects.select_related('stats'), username=username)
+    stats = get_stats(author)
+    post_list = archive.posts(author=author)
+    page_obj = pagination(
+        request, post_list,
+        count=lambda: counters.estimate(stats.posts_count))
+    thumbnails.attach_variants(page_obj)
+    prepare_cards(page_obj)
+    following = request.user.is_authenticated and (
+        request.user.follower.filter(author=author).exists()
+    )
     context = {
         'author': author,
         'page_obj': page_obj,
+        'posts_count': stats.posts_count,
+        'followers_count': stats.followers_count,
+        'following_count': stats.following_count,
+        'following': following,
+        'cache_version': caching.annotate_versions(
+            page_obj, caching.author_scope(author.pk)),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@caching.conditional(_post_scopes)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.select_related('author')
+    """Пост: 2 запроса - пост с JOIN автора, его счётчиков и группы
+    и первая страница комментариев с JOIN авторов.
+    """
+    post = archive.post(request, post_id)
+    caching.annotate_versions([post])
+    thumbnails.attach_variants([post])
+    # Ленивая страница: при попадании в кэш фрагмента запроса нет.
+    comments = SimpleLazyObject(lambda: _comments_page(post))
     form = CommentForm()
     context = {
         'post': post,
         'form': form,
         'comments': comments,
+        'posts_count': get_stats(post.author).posts_count,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def _comments_page(post, cursor=None):
+    """Страница комментариев по курсору (created, id), без COUNT."""
+    paginator = KeysetPaginator(
+        shards.related(post.comments.all(), 'author'),
+        settings.COMMENTS_PAGE_SIZE, key='created', descending=False)
+    return paginator.get_cursor_page(cursor)
+
+
+@caching.conditional(_post_scopes)
+def comments(request, post_id):
+    """Следующие страницы комментариев HTML-фрагментом: пост
+    и страница комментариев с JOIN авторов.
+    """
+    post = archive.post(request, post_id)
+    context = {
+        'comments': _comments_page(post, request.GET.get('cursor')),
+        'post_id': post.pk,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+@caching.conditional(lambda request: [caching.GLOBAL, caching.PROFILES])
+def search(request):
+    """Поиск: COUNT и страница id из FTS-индекса, затем посты
+    с JOIN автора и группы; фильтры по группе и автору - по запросу.
+    """
+    query = request.GET.get('q', '').strip()
+    group = author = None
+    if request.GET.get('group'):
+        group = get_object_or_404(Group, slug=request.GET['group'])
+    if request.GET.get('author'):
+        author = get_object_or_404(User, username=request.GET['author'])
+    paginator = WindowedPaginator(
+        SearchResults(query, group=group, author=author), settings.NUM_POST)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    thumbnails.attach_variants(page_obj)
+    params = {
+        key: request.GET[key]
+        for key in ('q', 'group', 'author') if request.GET.get(key)
+    }
+    context = {
+        'query': query,
+        'group': group,
+        'author': author,
+        'page_obj': page_obj,
+        'page_query': urlencode(params) + '&' if params else '',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required()
+@ratelimit('posts:post_create')
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         form = form.save(commit=False)
         form.author = request.user
-        form.save()
+        writer.run(form.save)
+        thumbnails.schedule(form)
         return redirect('posts:profile', form.author.username)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
 @login_required()
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.using(shards.for_post(post_id)), pk=post_id)
     if post.author != request.user:
         return redirect('posts:post_detail', post_id)
     form = PostForm(request.POST or None,
                     files=request.FILES or None, instance=post)
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -79,21 +220,42 @@ def post_edit(request, post_id):
 
 
 @login_required
+@ratelimit('posts:add_comment')
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.using(shards.for_post(post_id)), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        writer.run(comment.save)
     return redirect('posts:post_detail', post_id)
 
 
 @login_required
+@caching.conditional(lambda request: [
+    caching.GLOBAL, caching.PROFILES, caching.follow_scope(request.user.pk),
+])
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = pagination(request, post_list)
+    """Лента подписок: 2 запроса - COUNT и страница ленты с JOIN поста,
+    автора и группы (плюс сессия и пользователь).
+    """
+    if settings.SHARDS:
+        # Посты лежат на шардах авторов: JOIN с лентой невозможен.
+        page_obj = pagination(request, request.user.feed.all())
+        posts = shards.in_bulk([entry.post_id for entry in page_obj])
+        page_obj.object_list = [
+            posts[entry.post_id] for entry in page_obj
+            if entry.post_id in posts
+        ]
+    else:
+        feed = request.user.feed.select_related(
+            'post__author', 'post__group')
+        page_obj = pagination(request, feed, transform=attrgetter('post'))
+    thumbnails.attach_variants(page_obj)
+    prepare_cards(page_obj)
+    caching.annotate_versions(page_obj)
     context = {
         'page_obj': page_obj,
     }
@@ -101,12 +263,14 @@ def follow_index(request):
 
 
 @login_required
+@ratelimit('posts:profile_follow')
 def profile_follow(request, username):
     follow_author = get_object_or_404(User, username=username)
     if follow_author != request.user and (
         not request.user.follower.filter(author=follow_author).exists()
     ):
-        Follow.objects.get_or_create(
+        writer.run(
+            Follow.objects.get_or_create,
             user=request.user,
             author=follow_author
         )
@@ -117,5 +281,5 @@ def profile_follow(request, username):
 def profile_unfollow(request, username):
     follow_author = get_object_or_404(User, username=username)
     data_follow = request.user.follower.filter(author=follow_author)
-    data_follow.delete()
+    writer.run(data_follow.delete)
     return redirect('posts:profile', username)
@@ -1,6 +1,9 @@
-from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
+from django.core.mail import EmailMultiAlternatives
+from django.template import loader
 
+from core import jobs
 
 User = get_user_model()
 
@@ -9,3 +12,31 @@ class CreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ('first_name', 'last_name', 'username', 'email')
+
+
+def send_email(subject, body, from_email, recipients, html=None):
+    """Отправляет письмо; выполняется в очереди core.jobs."""
+    message = EmailMultiAlternatives(subject, body, from_email, recipients)
+    if html is not None:
+        message.attach_alternative(html, 'text/html')
+    message.send()
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Письмо о сбросе пароля уходит из очереди, а не из запроса.
+
+    Шаблоны рендерятся сразу: в очередь попадают только строки.
+    """
+
+    def send_mail(self, subject_template_name, email_template_name,
+                  context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = loader.render_to_string(subject_template_name, context)
+        subject = ''.join(subject.splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html = None
+        if html_email_template_name is not None:
+            html = loader.render_to_string(html_email_template_name, context)
+        jobs.enqueue(
+            send_email, [subject, body, from_email, [to_email], html],
+            priority=10)
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'core.apps.CoreConfig',
     'sorl.thumbnail',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -49,12 +50,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'core.ratelimit.RateLimitMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -72,6 +76,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.fragments.fragment_cache_timeout',
             ],
         },
     },
@@ -87,7 +92,56 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # Локальная реплика только для чтения - копия, которую обновляет
+    # команда sqlite_replicate.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{os.path.join(BASE_DIR, "db-replica.sqlite3")}?mode=ro',
+        'TEST': {'MIRROR': 'default'},
+    },
+    # Локальные шарды постов (posts.shards).
+    'shard0': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-shard0.sqlite3'),
+    },
+    'shard1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-shard1.sqlite3'),
+    },
+}
+DATABASE_ROUTERS = [
+    'posts.shards.ShardRouter',
+    'core.replicas.ReplicaRouter',
+]
+
+# Шардирование постов по авторам (posts.shards): SHARD_DATABASES - базы,
+# в которых создаются таблицы постов, SHARDS - те из них, по которым
+# сейчас распределены посты. Пустой SHARDS - всё хранится в default.
+# После изменения SHARDS посты переносит команда rebalance_shards.
+# Поиск и API читают посты с шардов; выгрузка, загрузка, сверка
+# счётчиков и pregenerate_thumbnails работают только с default и при
+# непустом SHARDS отказываются запускаться.
+SHARD_DATABASES = ['shard0', 'shard1']
+SHARDS = []
+
+# Чтение с реплик (core.replicas): алиасы из DATABASES, которые получают
+# чтения GET-вьюх из REPLICA_VIEW_MODULES, и допустимое отставание
+# реплики в секундах. Пустой список - всё читается с default.
+REPLICA_DATABASES = []
+REPLICA_VIEW_MODULES = ['posts.views']
+REPLICA_MAX_LAG = 30
+REPLICA_PIN_COOKIE = 'primary_after'
+
+# Прагмы каждого соединения с SQLite (core.sqlite). cache_size
+# отрицательный - в КиБ.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
 }
 
 
@@ -139,6 +193,17 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 NUM_POST = 10
+# Выборкам от COUNT_ESTIMATE_MIN строк пагинатор не считает COUNT(*):
+# число постов группы и автора берётся из счётчиков, а главной - из кэша
+# (posts.counters.posts_total), который обновляется раз в
+# COUNT_ESTIMATE_TTL секунд.
+COUNT_ESTIMATE_MIN = 10000
+COUNT_ESTIMATE_TTL = 60
+# Комментарии под постом: первая страница сразу, остальные - фрагментами
+# по курсору (posts.views.comments).
+COMMENTS_PAGE_SIZE = 50
+# Размер страницы JSON API (api): только курсоры, без COUNT.
+API_PAGE_SIZE = 50
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -148,3 +213,89 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# В бою кэш общий для всех воркеров: LRU процесса (L1) перед файлом
+# SQLite (L2), согласованность L1 - по штампам версий из L2.
+if not DEBUG:
+    CACHES['default'] = {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_MAX_ENTRIES': 5000,
+            'L1_MAX_BYTES': 32 * 1024 * 1024,
+            'L1_TIMEOUT': 30,
+            'SYNC_INTERVAL': 0.5,
+        },
+    }
+
+# Фрагменты шаблонов инвалидируются счётчиками поколений (posts.caching),
+# время жизни лишь ограничивает память под устаревшие версии.
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# Сколько последних записей хранится в ленте подписок пользователя
+# и как часто (раз в сколько новых постов) лента подрезается до этого окна.
+FEED_SIZE = 1000
+FEED_TRIM_EVERY = 50
+
+# Посты старше ARCHIVE_AFTER_DAYS дней с комментариями команда archive_posts
+# переносит в архивные таблицы (posts.archive): главная и ленты читают
+# только свежие посты, профиль и группа листают архив после них.
+ARCHIVE_AFTER_DAYS = 365
+
+# Варианты картинок постов нарезаются в фоне сразу после загрузки
+# (posts.thumbnails); 0 - нарезать синхронно в процессе запроса.
+THUMBNAIL_ENGINE = 'posts.thumbnails.DraftEngine'
+THUMBNAIL_BACKEND = 'posts.thumbnails.TimedBackend'
+THUMBNAIL_WORKERS = 2
+
+# Доля запросов, для которых замеряются фазы (core.timing): 1 - все,
+# 0 - ни одного. Итог - заголовок Server-Timing и строка в журнале
+# core.timing.
+SERVER_TIMING_SAMPLE_RATE = 1.0 if DEBUG else 0.1
+SERVER_TIMING_HEADER = True
+
+# Ограничение частоты пишущих запросов (core.ratelimit) по имени URL:
+# 'user:N/период' - на пользователя (у гостя - на IP), 'ip:N/период' -
+# на IP; период - s, m, h или d. Считаются запросы методами из methods.
+RATELIMIT_ENABLED = not DEBUG
+RATELIMIT_IP_HEADER = None
+RATELIMITS = {
+    'posts:post_create': {'rates': ['user:10/m', 'ip:30/m']},
+    'posts:add_comment': {'rates': ['user:20/m', 'ip:60/m']},
+    'posts:profile_follow': {
+        'rates': ['user:30/m', 'ip:60/m'], 'methods': ['GET', 'POST']},
+    'users:signup': {'rates': ['ip:5/h']},
+}
+
+# Очередь записей (core.writer): записи вьюх выполняет один поток-писатель
+# процесса, собирая их в общие транзакции до WRITE_QUEUE_BATCH задач.
+# Имеет смысл для многопоточного сервера; WRITE_QUEUE_TIMEOUT - сколько
+# секунд вьюха ждёт свою запись.
+WRITE_QUEUE = False
+WRITE_QUEUE_BATCH = 64
+WRITE_QUEUE_TIMEOUT = 30
+
+# Очередь фоновых задач в базе (core.jobs), её выполняет команда
+# run_workers. Без JOBS_QUEUE задачи (нарезка картинок, письма)
+# выполняются сразу. Упавшая задача повторяется через JOBS_RETRY_DELAY
+# секунд с удвоением паузы, всего до JOBS_MAX_ATTEMPTS попыток; задача,
+# выполняемая дольше JOBS_TIMEOUT секунд, возвращается в очередь.
+JOBS_QUEUE = False
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_DELAY = 10
+JOBS_TIMEOUT = 600
+JOBS_POLL_INTERVAL = 1
+JOBS_REPORT_INTERVAL = 60
+
+if not DEBUG:
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'console': {'class': 'logging.StreamHandler'},
+        },
+        'loggers': {
+            'core.timing': {'handlers': ['console'], 'level': 'INFO'},
+        },
+    }